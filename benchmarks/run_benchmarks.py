@@ -0,0 +1,100 @@
+"""
+Run benchmark scenarios for one tree profile and write results as JSON.
+Run from root folder as `python -m benchmarks.run_benchmarks -h` to see possible arguments.
+
+Results can be compared with stored baseline, run ends with exit code 1 when some metric got worse more than allowed
+tolerance or when peak RSS of some scenario is over the memory limit.
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+
+from benchmarks.scenarios import SCENARIOS, run_scenario
+from benchmarks.tree_generator import PROFILES, TreeGenerator
+
+DEFAULT_TOLERANCE = 0.2
+# shorter runs are dominated by noise
+MIN_COMPARED_SECONDS = 0.1
+
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """
+    :param results: results of current run
+    :param baseline: stored results of previous run of the same profile
+    :param tolerance: allowed relative growth of wall time, number of calls and peak RSS
+    :return: description of every regression
+    """
+    regressions = []
+    for scenario, metrics in results['results'].items():
+        expected = baseline['results'].get(scenario)
+        if expected is None:
+            continue
+        checked = {'wall_seconds': (metrics['wall_seconds'], expected['wall_seconds']),
+                   'syscalls': (sum(metrics['syscalls'].values()), sum(expected['syscalls'].values())),
+                   'peak_rss_kb': (metrics['peak_rss_kb'], expected['peak_rss_kb'])}
+        if expected['wall_seconds'] < MIN_COMPARED_SECONDS:
+            del checked['wall_seconds']
+        for metric, (current, previous) in checked.items():
+            if current is not None and previous and current > previous * (1 + tolerance):
+                regressions.append(f"{scenario}: {metric} {previous} -> {current}")
+    return regressions
+
+
+def check_memory(results: dict, max_rss_kb: int) -> list[str]:
+    """
+    :return: description of every scenario whose peak RSS is over the limit
+    """
+    return [f"{scenario}: peak_rss_kb {metrics['peak_rss_kb']} over limit {max_rss_kb}"
+            for scenario, metrics in results['results'].items()
+            if metrics['peak_rss_kb'] is not None and metrics['peak_rss_kb'] > max_rss_kb]
+
+
+def main(arguments: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-p", "--profile", choices=PROFILES, default='smoke', help="shape of generated source tree")
+    parser.add_argument("-s", "--scenario", choices=SCENARIOS, action='append',
+                        help="scenario to run, can be repeated, all scenarios are run by default")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of number of files and directories")
+    parser.add_argument("--size_scale", type=float, default=1.0, help="multiplier of file size")
+    parser.add_argument("--sync_options", type=json.loads, default={},
+                        help="options of Synchronizer as JSON e.g. '{\"manifest\": true, \"workers\": 4}'")
+    parser.add_argument("--workdir", help="where trees are generated, temporary directory is used by default")
+    parser.add_argument("-o", "--output", help="file where JSON results are written")
+    parser.add_argument("-b", "--baseline", help="JSON results of previous run which are compared with current run")
+    parser.add_argument("--max_rss_mb", type=int,
+                        help="peak RSS in MB which no scenario may exceed, e.g. with memory_budget sync option")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative regression against baseline, default is 0.2")
+    args = parser.parse_args(arguments)
+
+    generator = TreeGenerator(PROFILES[args.profile], args.scale, args.size_scale)
+    results = {'profile': args.profile, 'scale': args.scale, 'size_scale': args.size_scale,
+               'sync_options': args.sync_options, 'python': platform.python_version(), 'platform': platform.platform(),
+               'results': {}}
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for scenario in args.scenario or SCENARIOS:
+            metrics = run_scenario(scenario, generator, workdir, args.sync_options)
+            results['results'][scenario] = metrics
+            print(f"{scenario}: {metrics['wall_seconds']:.3f} s, {metrics['files_per_second']} files/s, "
+                  f"{metrics['mb_per_second']} MB/s, syscalls {metrics['syscalls']}, "
+                  f"peak RSS {metrics['peak_rss_kb']} KB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+    if args.max_rss_mb is not None:
+        regressions += check_memory(results, args.max_rss_mb * 1024)
+    for regression in regressions:
+        print(f"Regression {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
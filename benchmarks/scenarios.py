@@ -0,0 +1,116 @@
+"""
+Benchmark scenarios. Every scenario prepares source and replica and then measures one synchronization run.
+
+Measured run is done in fresh process, so peak RSS belongs only to the synchronization and not to preparation of the
+tree or to previous scenarios.
+"""
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from typing import Callable, Optional
+
+from benchmarks.syscalls import SyscallCounter
+from benchmarks.tree_generator import MB, TreeGenerator
+from synchronizer.dir_sync import Synchronizer
+from synchronizer.run_stats import peak_rss_kb
+
+MODIFIED_RATIO = 100
+
+
+def prepare_first_sync(generator: TreeGenerator, source: str, replica: str, sync_options: dict):
+    """
+    Replica is empty
+    """
+
+
+def prepare_noop_resync(generator: TreeGenerator, source: str, replica: str, sync_options: dict):
+    Synchronizer(**sync_options).synchronize(source, replica)
+
+
+def prepare_modified(generator: TreeGenerator, source: str, replica: str, sync_options: dict):
+    """
+    Content of every hundredth file is changed and its modification time is moved by one second
+    """
+    Synchronizer(**sync_options).synchronize(source, replica)
+    rng = random.Random(generator.seed + 1)
+    for relative in generator.files()[::MODIFIED_RATIO]:
+        path = os.path.join(source, relative)
+        modified = os.stat(path).st_mtime_ns + 1_000_000_000
+        generator.write_file(path, rng.randbytes(min(generator.file_size, MB)))
+        os.utime(path, ns=(modified, modified))
+
+
+def prepare_mass_rename(generator: TreeGenerator, source: str, replica: str, sync_options: dict):
+    """
+    All top level directories are renamed
+    """
+    Synchronizer(**sync_options).synchronize(source, replica)
+    for name in sorted(os.listdir(source)):
+        os.rename(os.path.join(source, name), os.path.join(source, 'r' + name[1:]))
+
+
+def prepare_mass_delete(generator: TreeGenerator, source: str, replica: str, sync_options: dict):
+    """
+    Every second file is removed
+    """
+    Synchronizer(**sync_options).synchronize(source, replica)
+    for relative in generator.files()[::2]:
+        os.remove(os.path.join(source, relative))
+
+
+SCENARIOS: dict[str, Callable[[TreeGenerator, str, str, dict], None]] = {
+    'first_sync': prepare_first_sync,
+    'noop_resync': prepare_noop_resync,
+    'modified_1pct': prepare_modified,
+    'mass_rename': prepare_mass_rename,
+    'mass_delete': prepare_mass_delete,
+}
+
+
+def measure(source: str, replica: str, sync_options: dict) -> dict:
+    """
+    :return: wall time, counted calls and peak RSS in KB (None when it can't be measured) of one synchronization
+    """
+    synchronizer = Synchronizer(**sync_options)
+    with SyscallCounter() as counter:
+        start = time.perf_counter()
+        synchronizer.synchronize(source, replica)
+        wall_seconds = time.perf_counter() - start
+    return {'wall_seconds': wall_seconds, 'syscalls': counter.counts, 'peak_rss_kb': peak_rss_kb()}
+
+
+def run_scenario(name: str, generator: TreeGenerator, workdir: str, sync_options: Optional[dict] = None,
+                 isolated: bool = True) -> dict:
+    """
+    :param name: one of SCENARIOS
+    :param workdir: directory where source and replica are created, previous content is removed
+    :param isolated: measure synchronization in fresh process
+    :return: metrics of the measured synchronization
+    """
+    sync_options = sync_options or {}
+    source = os.path.join(workdir, 'source')
+    replica = os.path.join(workdir, 'replica')
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+
+    info = generator.generate(source)
+    os.mkdir(replica)
+    SCENARIOS[name](generator, source, replica, sync_options)
+    transferred = Synchronizer(**sync_options).plan(source, replica).summary()['bytes']
+
+    if isolated:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(measure, (source, replica, sync_options))
+    else:
+        result = measure(source, replica, sync_options)
+
+    wall_seconds = result['wall_seconds'] or 1e-9
+    result.update({
+        'files': info.files,
+        'bytes': transferred,
+        'files_per_second': round(info.files / wall_seconds, 1),
+        'mb_per_second': round(transferred / MB / wall_seconds, 1),
+    })
+    return result
@@ -0,0 +1,83 @@
+"""
+Counting shim of metadata and open calls done through Python os module and built-in open.
+"""
+import builtins
+import os
+from unittest.mock import patch
+
+COUNTED = ('scandir', 'stat', 'lstat', 'entry_stat', 'open')
+
+
+class _CountingDirEntry:
+    """
+    Wrap os.DirEntry, so stat calls which are not cached by the entry can be counted
+    """
+    def __init__(self, entry: os.DirEntry, counts: dict):
+        self.__entry = entry
+        self.__counts = counts
+
+    def stat(self, **kwargs) -> os.stat_result:
+        self.__counts['entry_stat'] += 1
+        return self.__entry.stat(**kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.__entry, name)
+
+    def __fspath__(self) -> str:
+        return self.__entry.path
+
+
+class _CountingScandir:
+    def __init__(self, iterator, counts: dict):
+        self.__iterator = iterator
+        self.__counts = counts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.__iterator.close()
+
+    def __iter__(self):
+        return (_CountingDirEntry(entry, self.__counts) for entry in self.__iterator)
+
+    def close(self):
+        self.__iterator.close()
+
+
+class SyscallCounter:
+    """
+    Count calls done while the context manager is active. DirEntry stat is counted every time it is called even when
+    the entry returns cached result, open counts both os.open and built-in open.
+    """
+    def __init__(self):
+        self.counts = dict.fromkeys(COUNTED, 0)
+        self.__patches = []
+
+    def __enter__(self) -> 'SyscallCounter':
+        counts = self.counts
+        original_scandir, original_stat, original_lstat = os.scandir, os.stat, os.lstat
+        original_os_open, original_open = os.open, builtins.open
+
+        def counted(name, function):
+            def wrapper(*args, **kwargs):
+                counts[name] += 1
+                return function(*args, **kwargs)
+            return wrapper
+
+        def scandir(*args, **kwargs):
+            counts['scandir'] += 1
+            return _CountingScandir(original_scandir(*args, **kwargs), counts)
+
+        self.__patches = [patch('os.scandir', scandir), patch('os.stat', counted('stat', original_stat)),
+                          patch('os.lstat', counted('lstat', original_lstat)),
+                          patch('os.open', counted('open', original_os_open)),
+                          patch('builtins.open', counted('open', original_open))]
+        for started in self.__patches:
+            started.start()
+        return self
+
+    def __exit__(self, *args):
+        for started in self.__patches:
+            started.stop()
+        self.__patches = []
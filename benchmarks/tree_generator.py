@@ -0,0 +1,90 @@
+"""
+Generator of synthetic source trees for benchmarks.
+
+Trees are deterministic for given profile, scale and seed, so results of different runs can be compared.
+"""
+import os
+import random
+from typing import NamedTuple
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+_WRITE_BLOCK = MB
+
+
+class Profile(NamedTuple):
+    """
+    Shape of generated tree. Directories form chains of given depth, files are spread evenly over all directories.
+    """
+    files: int
+    file_size: int
+    directories: int
+    depth: int
+    description: str
+
+
+PROFILES = {
+    'small_files': Profile(1_000_000, 4 * KB, 1000, 1, "1M 4 KB files"),
+    'large_files': Profile(50, 5 * GB, 1, 1, "50 files of 5 GB"),
+    'deep_tree': Profile(10_000, 1 * KB, 10_000, 100, "deep narrow tree with 10k directories"),
+    'smoke': Profile(200, 4 * KB, 20, 4, "small tree for quick check of the suite"),
+}
+
+
+class TreeInfo(NamedTuple):
+    files: int
+    bytes: int
+    directories: int
+
+
+class TreeGenerator:
+    """
+    Create tree of given profile. Scale multiplies number of files and directories, size_scale multiplies size of
+    files, so large profiles can be run on small machines with the same shape.
+    """
+    def __init__(self, profile: Profile, scale: float = 1.0, size_scale: float = 1.0, seed: int = 0):
+        self.profile = profile
+        self.file_count = max(1, int(profile.files * scale))
+        self.directory_count = max(1, int(profile.directories * scale))
+        self.depth = max(1, min(profile.depth, self.directory_count))
+        self.file_size = max(1, int(profile.file_size * size_scale))
+        self.seed = seed
+
+    def directories(self) -> list[str]:
+        """
+        :return: relative paths of directories, every directory follows its parent
+        """
+        result = []
+        for index in range(self.directory_count):
+            chain, level = divmod(index, self.depth)
+            parent = result[index - 1] if level else ''
+            result.append(os.path.join(parent, f"d{chain:05d}" if not level else f"l{level:03d}"))
+        return result
+
+    def files(self) -> list[str]:
+        """
+        :return: relative paths of files in order of their creation
+        """
+        directories = self.directories()
+        return [os.path.join(directories[index % len(directories)], f"f{index:07d}.bin")
+                for index in range(self.file_count)]
+
+    def generate(self, root: str) -> TreeInfo:
+        os.makedirs(root, exist_ok=True)
+        directories = self.directories()
+        for directory in directories:
+            os.mkdir(os.path.join(root, directory))
+
+        rng = random.Random(self.seed)
+        # every file starts with its own random block, so files differ also for block level comparison
+        for relative in self.files():
+            self.write_file(os.path.join(root, relative), rng.randbytes(min(self.file_size, _WRITE_BLOCK)))
+        return TreeInfo(self.file_count, self.file_count * self.file_size, len(directories))
+
+    def write_file(self, path: str, block: bytes):
+        with open(path, 'wb') as file:
+            remaining = self.file_size
+            while remaining > 0:
+                remaining -= file.write(block[:remaining])
@@ -0,0 +1,149 @@
+"""
+YAML job file with more source and target pairs which are run by one JobRunner.
+
+Example:
+
+    limits:
+      max_copy_streams: 4
+      max_mb_in_flight: 512
+      stagger: 30s
+      throttle:
+        - 08:00-18:00,50,500
+      max_write_latency_ms: 50
+    jobs:
+      - name: documents
+        input_dir: /data/documents
+        output_dir: /backup/documents
+        interval: 1h
+        options:
+          manifest: true
+          workers: 4
+      - name: projects
+        input_dir: /data/projects
+        output_dir: /backup/projects
+        interval: 1h
+        snapshots:
+          hourly: 24
+          daily: 30
+
+Options of every job are passed to the Synchronizer and are checked against its arguments when the file is loaded,
+io_limiter and throttle are given by the runner. Limits are shared by all jobs. Throttle windows have the format of
+synchronizer.throttle.parse_window. Job with snapshots writes every run to new snapshot in output_dir and keeps the
+newest snapshot of given number of hours and days, see SnapshotStore.
+"""
+import inspect
+from typing import NamedTuple, Optional
+
+import yaml
+
+from job.snapshots import CONFLICTING_OPTIONS, Retention
+from synchronizer.dir_sync import Synchronizer
+from synchronizer.throttle import ThrottleWindow, parse_window
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Synchronizer arguments which are given by the runner from shared limits
+_RESERVED_OPTIONS = ('io_limiter', 'throttle')
+_OPTIONS = [name for name in inspect.signature(Synchronizer.__init__).parameters
+            if name != 'self' and name not in _RESERVED_OPTIONS]
+
+
+class JobConfigException(Exception):
+    pass
+
+
+class JobConfig(NamedTuple):
+    name: str
+    input_dir: str
+    output_dir: str
+    interval: str
+    sync_options: dict
+    snapshots: Optional[Retention] = None
+
+
+class Limits(NamedTuple):
+    """
+    Limits shared by all jobs, None means unlimited. Start of jobs is delayed by stagger seconds one after another.
+    Writes are throttled in given time windows and also by write latency (seconds) when max_write_latency is set.
+    """
+    max_copy_streams: Optional[int] = None
+    max_bytes_in_flight: Optional[int] = None
+    stagger: int = 0
+    throttle_windows: tuple[ThrottleWindow, ...] = ()
+    max_write_latency: Optional[float] = None
+
+
+class Config(NamedTuple):
+    jobs: list[JobConfig]
+    limits: Limits
+
+
+def load(path: str) -> Config:
+    with open(path, mode='rt', encoding='utf-8') as file:
+        content = yaml.safe_load(file) or {}
+    if not isinstance(content, dict) or not content.get('jobs'):
+        raise JobConfigException(f"No jobs are defined in '{path}'")
+    jobs = [_to_job(index, job) for index, job in enumerate(content['jobs'])]
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise JobConfigException(f"Job names have to be unique: {names}")
+    return Config(jobs, _to_limits(content.get('limits') or {}))
+
+
+def to_seconds(time_frame: str) -> int:
+    """
+    :param time_frame: time value with unit postfix e.g. 5s, 10m, 4h or 2d
+    :return: number of seconds
+    """
+    time_frame = str(time_frame)
+    value, unit = time_frame[:-1], time_frame[-1:]
+    if not value.isdigit() or unit not in _UNITS:
+        raise JobConfigException(f"Wrong time value was provided: '{time_frame}'")
+    return int(value) * _UNITS[unit]
+
+
+def _to_job(index: int, job: dict) -> JobConfig:
+    if not isinstance(job, dict):
+        raise JobConfigException(f"Job {index} has to be a mapping")
+    name = str(job.get('name', index))
+    missing = [key for key in ('input_dir', 'output_dir', 'interval') if not job.get(key)]
+    if missing:
+        raise JobConfigException(f"Job '{name}' is missing {', '.join(missing)}")
+    # validated here, so wrong interval doesn't stop other jobs later
+    to_seconds(job['interval'])
+    options = dict(job.get('options') or {})
+    unknown = [option for option in options if option not in _OPTIONS]
+    if unknown:
+        raise JobConfigException(f"Job '{name}' has unknown options {', '.join(map(str, unknown))}")
+    return JobConfig(name, job['input_dir'], job['output_dir'], str(job['interval']), options,
+                     _to_retention(name, job['snapshots'], options) if job.get('snapshots') else None)
+
+
+def _to_retention(name: str, snapshots, options: dict) -> Retention:
+    conflicts = [option for option in CONFLICTING_OPTIONS if options.get(option)]
+    if conflicts:
+        raise JobConfigException(f"Job '{name}' with snapshots can't use options {', '.join(conflicts)}")
+    if snapshots is True:
+        return Retention()
+    if not isinstance(snapshots, dict):
+        raise JobConfigException(f"Snapshots of job '{name}' have to be true or mapping with hourly and daily")
+    retention = Retention(**{key: snapshots[key] for key in Retention._fields if key in snapshots})
+    if not all(isinstance(count, int) and count >= 0 for count in retention):
+        raise JobConfigException(f"Snapshot retention of job '{name}' has to be non-negative numbers: {snapshots}")
+    return retention
+
+
+def _to_limits(limits: dict) -> Limits:
+    max_mb = limits.get('max_mb_in_flight')
+    max_latency = limits.get('max_write_latency_ms')
+    return Limits(limits.get('max_copy_streams'), max_mb * 1024 * 1024 if max_mb is not None else None,
+                  to_seconds(limits['stagger']) if limits.get('stagger') else 0,
+                  tuple(_to_window(window) for window in limits.get('throttle') or []),
+                  max_latency / 1000 if max_latency is not None else None)
+
+
+def _to_window(window: str) -> ThrottleWindow:
+    try:
+        return parse_window(str(window))
+    except ValueError as error:
+        raise JobConfigException(f"Wrong throttle window '{window}': {error}") from error
@@ -1,14 +1,25 @@
 """
 Scheduled runner which allow to run directory synchronization straight away or on provided interval.
+More source and target pairs can be run by one runner when they are defined in YAML job file, see job_config.
 """
+import datetime
 import logging
+import threading
 import time
-from typing import Optional
+from typing import Callable, Optional
 
 import schedule
 from schedule import Job
+import yaml
 
+from job import job_config, watcher
+from job.job_config import JobConfig, Limits
+from job.run_history import RunHistory
+from job.snapshots import Retention, SnapshotStore
 from synchronizer import dir_sync
+from synchronizer.io_limits import IOLimiter
+from synchronizer.run_stats import RunStats
+from synchronizer.throttle import Throttle
 
 log = logging.getLogger('job.job_runner.JobRunner')
 
@@ -17,25 +28,90 @@ class JobRunnerException(Exception):
     pass
 
 
+class _JobState:
+    """
+    Synchronizer of one job from job file together with thread of its current run
+    """
+    def __init__(self, job: JobConfig, sync: dir_sync.Synchronizer, first_run: float,
+                 snapshots: Optional[SnapshotStore] = None):
+        self.job = job
+        self.sync = sync
+        self.snapshots = snapshots
+        self.first_run: Optional[float] = first_run
+        self.thread: Optional[threading.Thread] = None
+
+
 class JobRunner:
     """
     Create instance of job runner which will then run synchronization from input_dir to output_dir.
     When optional time_frame is not provided then synchronization is called straight away.
-    If it is provided then after given time interval and repeat forever until killed
+    If it is provided then after given time interval and repeat forever until killed.
+    Optional sync_options are passed to the Synchronizer.
+
+    In watch mode whole tree is synchronized at start and then only directories reported by file system events are
+    synchronized. Full synchronization is still done in time_frame interval (default is 1 hour) and when some events
+    were lost. Failed synchronization doesn't stop watching, replica is fixed by the following synchronization.
+
+    Statistics of every run are kept in history of last history_size runs, which is written to metrics_file after
+    every run when it is provided (Prometheus text format for '.prom' suffix, JSON otherwise).
+
+    Runner created from job file (see from_config) runs every job in its own thread. First runs are started straight
+    away one after another with delay given by stagger limit, then every job is run in its interval shifted by the same
+    delay. When previous run of the job is still in progress, the run is skipped. Copy streams, bytes in flight and
+    throttle of writes are shared by all jobs.
+
+    With snapshots retention every run writes new snapshot to output_dir instead of updating one replica, unchanged
+    files are hardlinked from the previous snapshot, see SnapshotStore. Watch mode can't write snapshots.
     """
-    def __init__(self, input_dir: str, output_dir: str, time_frame: Optional[str] = None):
+    DEFAULT_RECONCILE_INTERVAL = '1h'
+
+    def __init__(self, input_dir: str, output_dir: str, time_frame: Optional[str] = None,
+                 sync_options: Optional[dict] = None, watch: bool = False, metrics_file: Optional[str] = None,
+                 history_size: int = 100, jobs: Optional[list[JobConfig]] = None, limits: Optional[Limits] = None,
+                 snapshots: Optional[Retention] = None):
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.time_frame = time_frame
+        self.sync_options = sync_options or {}
+        self.watch = watch
+        self.history = RunHistory(history_size, metrics_file)
+        self.jobs = jobs or []
+        self.limits = limits or Limits()
+        self.snapshots = snapshots
         self.should_be_running = True
 
+    @classmethod
+    def from_config(cls, path: str, metrics_file: Optional[str] = None, history_size: int = 100) -> 'JobRunner':
+        """
+        :param path: YAML job file
+        """
+        try:
+            config = job_config.load(path)
+        except (job_config.JobConfigException, OSError, yaml.YAMLError) as error:
+            raise JobRunnerException(f"Job file '{path}' can't be loaded: {error}") from error
+        return cls('', '', metrics_file=metrics_file, history_size=history_size, jobs=config.jobs,
+                   limits=config.limits)
+
     def run_job(self):
-        sync = dir_sync.Synchronizer()
-        if self.time_frame is None:
+        if self.jobs:
+            self.__run_jobs()
+            return
+
+        if self.snapshots is not None:
+            if self.watch:
+                raise JobRunnerException("Snapshots can't be written in watch mode")
+            self.__run_snapshots(SnapshotStore(self.output_dir, self.snapshots))
+            return
+
+        sync = dir_sync.Synchronizer(**self.sync_options)
+        sync.add_stats_listener(self.history.add)
+        if self.watch:
+            self.__run_watch(sync)
+        elif self.time_frame is None:
             log.info("Synchronization execution started")
             sync.synchronize(self.input_dir, self.output_dir)
         else:
-            self.__create_timed_scheduler().do(sync.synchronize, self.input_dir, self.output_dir)
+            self.__create_timed_scheduler(self.time_frame).do(sync.synchronize, self.input_dir, self.output_dir)
             log.info("Synchronization job started with interval %s", self.time_frame)
 
             while self.should_be_running:
@@ -45,14 +121,136 @@ class JobRunner:
     def stop(self):
         self.should_be_running = False
 
-    def __create_timed_scheduler(self) -> Job:
-        unit = self.time_frame[-1]
-        value = self.time_frame.removesuffix(unit)
+    def __run_snapshots(self, snapshots: SnapshotStore):
+        sync = dir_sync.Synchronizer(**self.sync_options)
+        sync.add_stats_listener(self.__snapshot_listener(snapshots))
+        if self.time_frame is None:
+            log.info("Snapshot execution started")
+            self.__snapshot(sync, self.input_dir, snapshots)
+            snapshots.wait()
+            return
+
+        self.__create_timed_scheduler(self.time_frame).do(self.__snapshot, sync, self.input_dir, snapshots)
+        log.info("Snapshot job started with interval %s", self.time_frame)
+        while self.should_be_running:
+            schedule.run_pending()
+            time.sleep(1)
+        snapshots.wait()
+
+    def __snapshot_listener(self, snapshots: SnapshotStore) -> Callable[[RunStats], None]:
+        def add(stats: RunStats):
+            # history is kept for the snapshot root, not for every snapshot
+            stats.output_dir = snapshots.root
+            self.history.add(stats)
+        return add
+
+    @staticmethod
+    def __snapshot(sync: dir_sync.Synchronizer, input_dir: str, snapshots: SnapshotStore):
+        """
+        Write new snapshot, snapshot of failed run is kept as partial and continued by the next run
+        """
+        previous = snapshots.latest()
+        partial = snapshots.begin()
+        sync.synchronize(input_dir, partial, link_dest=previous)
+        snapshots.finish(partial)
+
+    def __run_watch(self, sync: dir_sync.Synchronizer):
+        directory_watcher = watcher.DirectoryWatcher(self.input_dir)
+        # watches are added before the first synchronization, so no change can be missed in between
+        directory_watcher.start()
+        try:
+            log.info("Synchronization execution started")
+            sync.synchronize(self.input_dir, self.output_dir)
+            time_frame = self.time_frame or self.DEFAULT_RECONCILE_INTERVAL
+            self.__create_timed_scheduler(time_frame).do(self.__watch_run, sync, self.input_dir, self.output_dir)
+            log.info("Watching changes with full synchronization interval %s", time_frame)
+
+            while self.should_be_running:
+                changes = directory_watcher.poll(1)
+                if changes is not None and changes.overflow:
+                    self.__watch_run(sync, self.input_dir, self.output_dir)
+                elif changes is not None:
+                    self.__watch_run(sync, self.input_dir, self.output_dir, changes.directories)
+                schedule.run_pending()
+        finally:
+            directory_watcher.close()
+
+    @staticmethod
+    def __watch_run(sync: dir_sync.Synchronizer, input_dir: str, output_dir: str,
+                    directories: Optional[dict[str, bool]] = None):
+        """
+        Synchronize whole tree or only given directories. Failure is only logged, entries changed while they were
+        synchronized are fixed by the next event or by the full synchronization.
+        """
+        try:
+            if directories is None:
+                sync.synchronize(input_dir, output_dir)
+            else:
+                sync.synchronize_directories(input_dir, output_dir, directories)
+        except (dir_sync.SynchronizerException, OSError) as error:
+            log.error("Synchronization of changes failed: %s", error)
+
+    def __run_jobs(self):
+        limiter = IOLimiter(self.limits.max_copy_streams, self.limits.max_bytes_in_flight)
+        throttle = None
+        if self.limits.throttle_windows or self.limits.max_write_latency is not None:
+            throttle = Throttle(self.limits.throttle_windows, self.limits.max_write_latency)
+        scheduler = schedule.Scheduler()
+        states = []
+        start = time.monotonic()
+        for index, job in enumerate(self.jobs):
+            sync = dir_sync.Synchronizer(**job.sync_options, io_limiter=limiter, throttle=throttle)
+            snapshots = SnapshotStore(job.output_dir, job.snapshots) if job.snapshots is not None else None
+            sync.add_stats_listener(self.__snapshot_listener(snapshots) if snapshots is not None else self.history.add)
+            state = _JobState(job, sync, start + index * self.limits.stagger, snapshots)
+            periodic = self.__create_timed_scheduler(job.interval, scheduler).do(self.__start_run, state)
+            # later runs keep the offset of the first run, so jobs with the same interval don't start together
+            periodic.next_run += datetime.timedelta(seconds=index * self.limits.stagger)
+            states.append(state)
+        log.info("%s synchronization jobs started", len(states))
+
+        try:
+            while self.should_be_running:
+                for state in states:
+                    if state.first_run is not None and time.monotonic() >= state.first_run:
+                        state.first_run = None
+                        self.__start_run(state)
+                scheduler.run_pending()
+                time.sleep(1)
+        finally:
+            for state in states:
+                if state.thread is not None:
+                    state.thread.join()
+                if state.snapshots is not None:
+                    state.snapshots.wait()
+
+    def __start_run(self, state: _JobState):
+        if state.thread is not None and state.thread.is_alive():
+            log.info("Job '%s' is still running, its run is skipped", state.job.name)
+            return
+        state.thread = threading.Thread(target=self.__run_once, args=(state,), name=f"job-{state.job.name}")
+        state.thread.start()
+
+    @staticmethod
+    def __run_once(state: _JobState):
+        log.info("Synchronization of job '%s' started", state.job.name)
+        try:
+            if state.snapshots is not None:
+                JobRunner.__snapshot(state.sync, state.job.input_dir, state.snapshots)
+            else:
+                state.sync.synchronize(state.job.input_dir, state.job.output_dir)
+        except (dir_sync.SynchronizerException, OSError) as error:
+            log.error("Synchronization of job '%s' failed: %s", state.job.name, error)
+
+    @staticmethod
+    def __create_timed_scheduler(time_frame: str, scheduler: Optional[schedule.Scheduler] = None) -> Job:
+        unit = time_frame[-1]
+        value = time_frame.removesuffix(unit)
         if not value.isdigit():
-            raise JobRunnerException(f"Wrong time value was provided: '{self.time_frame}'")
+            raise JobRunnerException(f"Wrong time value was provided: '{time_frame}'")
         value = int(value)
 
-        prepared_schedule = schedule.every(value)
+        prepared_schedule = scheduler.every(value) if scheduler is not None else schedule.every(value)
         match unit:
             case 's':
                 return prepared_schedule.seconds
@@ -0,0 +1,111 @@
+"""
+History of synchronization runs exported for monitoring.
+
+History can be written after every run as JSON or as Prometheus text file which is read by textfile collector of node
+exporter. File is replaced atomically, so collector never reads partially written file.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+from typing import Optional
+
+from synchronizer.run_stats import RunStats
+
+log = logging.getLogger('job.run_history.RunHistory')
+
+PROMETHEUS_SUFFIX = '.prom'
+_PREFIX = 'dir_sync'
+
+
+class RunHistory:
+    """
+    Keep statistics of last max_size runs together with totals since the start. Export format is chosen by suffix
+    of export_file, '.prom' is Prometheus text format, anything else is JSON. Runs can be added from more threads,
+    Prometheus export contains the last run of every source and replica pair.
+    """
+    def __init__(self, max_size: int = 100, export_file: Optional[str] = None):
+        self.runs: deque[dict] = deque(maxlen=max_size)
+        self.export_file = export_file
+        self.totals = {'success': 0, 'failure': 0}
+        self.last_success: Optional[float] = None
+        self.__last_runs: dict[tuple[str, str], dict] = {}
+        self.__last_successes: dict[tuple[str, str], float] = {}
+        self.__lock = threading.Lock()
+
+    def add(self, stats: RunStats):
+        with self.__lock:
+            run = stats.to_dict()
+            pair = (stats.input_dir, stats.output_dir)
+            self.runs.append(run)
+            self.__last_runs[pair] = run
+            self.totals['success' if stats.success else 'failure'] += 1
+            if stats.success:
+                self.last_success = self.__last_successes[pair] = stats.finished
+            if self.export_file:
+                self.export(self.export_file)
+
+    def export(self, path: str):
+        content = self.to_prometheus() if path.endswith(PROMETHEUS_SUFFIX) else self.to_json()
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as file:
+            file.write(content)
+        # temporary file is readable only by owner, exporter usually runs as another user
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+        log.debug("Run history exported to '%s'", path)
+
+    def to_json(self) -> str:
+        return json.dumps({'totals': self.totals, 'last_success': self.last_success, 'runs': list(self.runs)},
+                          indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        self.__add_metric(lines, 'runs_total', 'counter', 'Finished synchronization runs',
+                          [({'status': status}, count) for status, count in self.totals.items()])
+        self.__add_metric(lines, 'last_success_timestamp_seconds', 'gauge',
+                          'Time when the last successful synchronization finished',
+                          [(self.__labels(pair), finished) for pair, finished in self.__last_successes.items()])
+
+        last_runs = [(self.__labels(pair), run) for pair, run in self.__last_runs.items()]
+        self.__add_metric(lines, 'last_run_timestamp_seconds', 'gauge', 'Time when the last synchronization finished',
+                          [(labels, run['finished']) for labels, run in last_runs])
+        self.__add_metric(lines, 'last_run_success', 'gauge', 'Whether the last synchronization succeeded',
+                          [(labels, int(bool(run['success']))) for labels, run in last_runs])
+        self.__add_metric(lines, 'last_run_duration_seconds', 'gauge', 'Duration of the last synchronization',
+                          [(labels, run['duration']) for labels, run in last_runs])
+        self.__add_metric(lines, 'last_run_phase_seconds', 'gauge', 'Time spent in phases of the last synchronization',
+                          [({**labels, 'phase': phase}, seconds) for labels, run in last_runs
+                           for phase, seconds in run['phases'].items()])
+        self.__add_metric(lines, 'last_run_entries', 'gauge', 'Entries handled by the last synchronization',
+                          [({**labels, 'kind': kind}, count) for labels, run in last_runs
+                           for kind, count in run['counts'].items()])
+        self.__add_metric(lines, 'last_run_copied_bytes', 'gauge', 'Bytes copied by the last synchronization',
+                          [(labels, run['bytes_copied']) for labels, run in last_runs])
+        self.__add_metric(lines, 'last_run_peak_rss_bytes', 'gauge',
+                          'Peak resident memory of the process when the last synchronization finished',
+                          [(labels, run['peak_rss_kb'] * 1024) for labels, run in last_runs
+                           if run['peak_rss_kb'] is not None])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def __labels(pair: tuple[str, str]) -> dict:
+        return {'input': pair[0], 'output': pair[1]}
+
+    @staticmethod
+    def __add_metric(lines: list[str], name: str, metric_type: str, description: str,
+                     samples: list[tuple[dict, float]]):
+        if not samples:
+            return
+        name = f"{_PREFIX}_{name}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            rendered = ','.join(f'{key}="{RunHistory.__escape(str(label))}"' for key, label in labels.items())
+            lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+
+    @staticmethod
+    def __escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
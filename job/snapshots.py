@@ -0,0 +1,162 @@
+"""
+Point-in-time snapshots of source directory stored in timestamped directories of one snapshot root.
+
+Every run writes new snapshot, files which didn't change since the previous snapshot are hardlinked from it and only
+changed files are copied (link-dest), so every snapshot takes only the space of changed files. Snapshot is written to
+directory with '.partial' suffix, which is renamed to its final name only when the run succeeded. Partial snapshot of
+failed run is continued by the next run.
+
+Retention keeps the newest snapshot of each of the last hourly hours and of each of the last daily days, which have
+any snapshot, the newest snapshot is always kept. Pruned snapshot is renamed at once and removed in background, so
+the next run doesn't wait for removal of whole tree.
+"""
+import datetime
+import logging
+import os
+import shutil
+import threading
+from typing import Callable, NamedTuple, Optional
+
+log = logging.getLogger('job.snapshots.SnapshotStore')
+
+NAME_FORMAT = '%Y-%m-%d_%H-%M-%S'
+PARTIAL_SUFFIX = '.partial'
+PRUNED_PREFIX = '.pruned-'
+
+# synchronizer options which keep their files next to the replica, they would be created next to every snapshot
+CONFLICTING_OPTIONS = ('manifest', 'detect_renames', 'dedup', 'checksum', 'resume')
+
+
+class Retention(NamedTuple):
+    """
+    Number of hours and days whose newest snapshot is kept
+    """
+    hourly: int = 24
+    daily: int = 7
+
+
+class SnapshotStore:
+    """
+    Snapshots of one source in root directory. Entries of root which are not named by snapshot time are left alone.
+    """
+    def __init__(self, root: str, retention: Retention = Retention(),
+                 clock: Callable[[], datetime.datetime] = datetime.datetime.now):
+        self.root = root
+        self.retention = retention
+        self.__clock = clock
+        self.__removals: list[threading.Thread] = []
+
+    def snapshots(self) -> list[tuple[datetime.datetime, str]]:
+        """
+        :return: times and paths of finished snapshots from the oldest one
+        """
+        snapshots = []
+        with os.scandir(self.root) as iterator:
+            for entry in iterator:
+                time = self.__parse(entry.name)
+                if time is not None and entry.is_dir(follow_symlinks=False):
+                    snapshots.append((time, entry.path))
+        snapshots.sort()
+        return snapshots
+
+    def latest(self) -> Optional[str]:
+        """
+        :return: path of the newest finished snapshot, None when there is none
+        """
+        snapshots = self.snapshots()
+        return snapshots[-1][1] if snapshots else None
+
+    def begin(self) -> str:
+        """
+        Create directory of new snapshot, partial snapshot of failed run is reused
+        :return: path of partial snapshot
+        """
+        name = self.__clock().strftime(NAME_FORMAT)
+        path = os.path.join(self.root, name + PARTIAL_SUFFIX)
+        partial = sorted(entry for entry in os.listdir(self.root)
+                         if entry.endswith(PARTIAL_SUFFIX) and self.__parse(entry.removesuffix(PARTIAL_SUFFIX)))
+        if partial:
+            log.info("Snapshot '%s' of failed run is continued as '%s'", partial[-1], name)
+            os.rename(os.path.join(self.root, partial[-1]), path)
+        else:
+            os.mkdir(path)
+        return path
+
+    def finish(self, partial: str) -> str:
+        """
+        Give final name to successfully written snapshot and prune snapshots which are not kept by retention
+        :return: path of finished snapshot
+        """
+        path = partial.removesuffix(PARTIAL_SUFFIX)
+        os.rename(partial, path)
+        log.info("Snapshot '%s' was created", path)
+        self.prune()
+        return path
+
+    def prune(self) -> list[str]:
+        """
+        :return: paths of pruned snapshots
+        """
+        snapshots = self.snapshots()
+        kept = self.kept(snapshots)
+        pruned = []
+        for _, path in snapshots:
+            if path in kept:
+                continue
+            trash = os.path.join(self.root, PRUNED_PREFIX + os.path.basename(path))
+            os.rename(path, trash)
+            pruned.append(path)
+        if pruned:
+            log.info("Pruned %s snapshots: %s", len(pruned), ', '.join(os.path.basename(path) for path in pruned))
+        self.__remove_pruned()
+        return pruned
+
+    def kept(self, snapshots: list[tuple[datetime.datetime, str]]) -> set[str]:
+        """
+        :param snapshots: times and paths of snapshots from the oldest one
+        :return: paths of snapshots kept by retention
+        """
+        kept = {snapshots[-1][1]} if snapshots else set()
+        for count, bucket in ((self.retention.hourly, '%Y-%m-%d %H'), (self.retention.daily, '%Y-%m-%d')):
+            buckets = set()
+            for time, path in reversed(snapshots):
+                key = time.strftime(bucket)
+                if key in buckets:
+                    continue
+                if len(buckets) == count:
+                    break
+                buckets.add(key)
+                kept.add(path)
+        return kept
+
+    def wait(self):
+        """
+        Wait until pruned snapshots are removed
+        """
+        for thread in self.__removals:
+            thread.join()
+        self.__removals = []
+
+    def __remove_pruned(self):
+        # also snapshots pruned before the process was stopped
+        trash = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.startswith(PRUNED_PREFIX)]
+        self.__removals = [thread for thread in self.__removals if thread.is_alive()]
+        if not trash or self.__removals:
+            return
+        thread = threading.Thread(target=self.__remove, args=(trash,), name='snapshot-prune', daemon=True)
+        thread.start()
+        self.__removals.append(thread)
+
+    @staticmethod
+    def __remove(paths: list[str]):
+        for path in paths:
+            shutil.rmtree(path, onerror=lambda function, failed, info: log.warning(
+                "Pruned snapshot '%s' can't be removed: %s", failed, info[1]))
+            log.debug("Pruned snapshot '%s' was removed", path)
+
+    @staticmethod
+    def __parse(name: str) -> Optional[datetime.datetime]:
+        try:
+            return datetime.datetime.strptime(name, NAME_FORMAT)
+        except ValueError:
+            return None
@@ -0,0 +1,188 @@
+"""
+Watch of source directory tree with Linux inotify called through ctypes.
+
+Changed directories are collected into debounced set, so burst of events (e.g. extraction of archive) results in one
+synchronization of affected directories. Overflow of kernel event queue is reported, so caller can do full
+synchronization instead.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Optional
+
+log = logging.getLogger('job.watcher.DirectoryWatcher')
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class WatcherException(Exception):
+    pass
+
+
+class Changes:
+    """
+    Directories changed since last report. Directories are relative to watched directory and mapped to flag whether
+    their subdirectories have to be synchronized too (e.g. directory was created or moved in).
+    When overflow is set some events were lost and whole tree has to be synchronized.
+    """
+    __slots__ = ('directories', 'overflow')
+
+    def __init__(self):
+        self.directories: dict[str, bool] = {}
+        self.overflow = False
+
+    def add(self, directory: str, recursive: bool):
+        self.directories[directory] = self.directories.get(directory, False) or recursive
+
+    def __bool__(self) -> bool:
+        return bool(self.directories) or self.overflow
+
+    def __repr__(self) -> str:
+        return f"Changes(directories={self.directories}, overflow={self.overflow})"
+
+
+class DirectoryWatcher:
+    """
+    Watch all directories under given directory. Changes are reported when there was no event for debounce seconds
+    or at latest max_delay seconds after the first not reported event.
+    """
+    def __init__(self, directory: str, debounce: float = 0.5, max_delay: float = 5.0):
+        self.directory = directory.rstrip('\\/') or os.sep
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.__libc = None
+        self.__fd: Optional[int] = None
+        self.__watches: dict[int, str] = {}
+        self.__changes = Changes()
+        self.__first_event: Optional[float] = None
+        self.__last_event: Optional[float] = None
+
+    def start(self):
+        if not sys.platform.startswith('linux'):
+            raise WatcherException("Watch mode is supported only on Linux")
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.__fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            error = ctypes.get_errno()
+            raise WatcherException(f"Inotify can't be initialized: {os.strerror(error)}")
+        self.__watch_tree('')
+        log.info("Watching %s directories under %s", len(self.__watches), self.directory)
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+        self.__watches.clear()
+
+    def poll(self, timeout: float) -> Optional[Changes]:
+        """
+        Wait for events at most timeout seconds
+        :return: collected changes when they should be synchronized, None otherwise
+        """
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if readable:
+            self.__read_events()
+
+        if not self.__changes:
+            return None
+        now = time.monotonic()
+        if (self.__changes.overflow or now - self.__last_event >= self.debounce
+                or now - self.__first_event >= self.max_delay):
+            changes, self.__changes = self.__changes, Changes()
+            self.__first_event = self.__last_event = None
+            return changes
+        return None
+
+    def __read_events(self):
+        try:
+            buffer = os.read(self.__fd, _READ_SIZE)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(buffer):
+            watch, mask, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            self.__handle_event(watch, mask, name)
+
+    def __handle_event(self, watch: int, mask: int, name: str):
+        now = time.monotonic()
+        self.__first_event = self.__first_event or now
+        self.__last_event = now
+
+        if mask & IN_Q_OVERFLOW:
+            log.warning("Inotify event queue overflowed, whole tree will be synchronized")
+            self.__changes.overflow = True
+            return
+
+        directory = self.__watches.get(watch)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            del self.__watches[watch]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # parent directory receives its own event about the removal
+            return
+
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            child = os.path.join(directory, name)
+            self.__watch_tree(child)
+            self.__changes.add(child, True)
+        self.__changes.add(directory, False)
+
+    def __watch_tree(self, relative: str):
+        stack = [relative]
+        while stack:
+            current = stack.pop()
+            if not self.__add_watch(current):
+                continue
+            try:
+                with os.scandir(os.path.join(self.directory, current)) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(os.path.join(current, entry.name))
+            except FileNotFoundError:
+                continue
+
+    def __add_watch(self, relative: str) -> bool:
+        path = os.fsencode(os.path.join(self.directory, relative))
+        watch = self.__libc.inotify_add_watch(self.__fd, ctypes.c_char_p(path), WATCH_MASK)
+        if watch < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # removed before the watch was added, parent event covers it
+                return False
+            if error == errno.ENOSPC:
+                raise WatcherException("Limit of inotify watches reached, increase fs.inotify.max_user_watches")
+            raise WatcherException(f"Directory '{relative}' can't be watched: {os.strerror(error)}")
+        self.__watches[watch] = relative
+        return True
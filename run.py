@@ -3,7 +3,8 @@ Main runnable script with input parameters from command line.
 Run script with -h parameter to see possible arguments.
 
 When time_interval parameter is not provided synchronization will be done straight away.
-If interval is provided then synchronization is run after given interval and then periodically
+If interval is provided then synchronization is run after given interval and then periodically.
+More source and target pairs with their own intervals can be run together from YAML job file (see jobs.yaml).
 """
 import argparse
 import logging.config
@@ -11,13 +12,20 @@ import logging.config
 import yaml
 
 from job.job_runner import  JobRunner
+from job.snapshots import CONFLICTING_OPTIONS, Retention
+from synchronizer.dedup import MODES as DEDUP_MODES
+from synchronizer.dir_sync import Synchronizer
+from synchronizer.durability import MODES
+from synchronizer.plan import ORDERS
+from synchronizer.throttle import Throttle, parse_window
 
 if __name__ == '__main__':
     argParser = argparse.ArgumentParser()
-    argParser.add_argument("-i", "--input_dir", help="source directory which will be synchronized to replica",
-                           required=True)
-    argParser.add_argument("-o", "--output_dir", help="output directory which will be synchronized from source folder",
-                           required=True)
+    argParser.add_argument("-i", "--input_dir", help="source directory which will be synchronized to replica")
+    argParser.add_argument("-o", "--output_dir", help="output directory which will be synchronized from source folder")
+    argParser.add_argument("-j", "--jobs_file",
+                           help="YAML file with more source and target pairs, their intervals and options, can't be "
+                                "used with other arguments except -l and --metrics_file")
     argParser.add_argument("-l", "--log_output", help="where logs will be stored")
     argParser.add_argument("-t", "--time_interval", help="""
         provide time interval in which the synchronization should take a place. Use number with unit postfix as follows:
@@ -26,8 +34,83 @@ if __name__ == '__main__':
         4h = 4 hours,
         2d = 2 days
         """)
+    argParser.add_argument("--watch", action="store_true",
+                           help="synchronize changes as they happen (Linux only), time interval is then used for full "
+                                "synchronization which is done as safety net, default is 1h")
+    argParser.add_argument("-m", "--manifest", action="store_true",
+                           help="keep manifest of replica state next to the output directory, so following runs don't "
+                                "need to read whole replica again")
+    argParser.add_argument("-w", "--workers", type=int, default=1,
+                           help="number of parallel workers copying files, default is 1")
+    argParser.add_argument("--scan_workers", type=int, default=1,
+                           help="number of processes comparing subtrees of source and replica, default is 1, "
+                                "scan stays serial with detection of renames")
+    argParser.add_argument("-c", "--checksum", action="store_true",
+                           help="compare also content of files, hashes are cached next to the output directory")
+    argParser.add_argument("-d", "--delta_threshold", type=int,
+                           help="size in MB from which changed files are updated in place by writing only changed "
+                                "blocks")
+    argParser.add_argument("--parallel_copy", type=int,
+                           help="files with at least given size in MB are copied by more threads at once, each thread "
+                                "copies different part of the file")
+    argParser.add_argument("--parallel_workers", type=int, default=4,
+                           help="number of threads which copy one large file, see --parallel_copy")
+    argParser.add_argument("--chunk_checksums", action="store_true",
+                           help="read back every part of file copied by --parallel_copy and compare its checksum with "
+                                "the source")
+    argParser.add_argument("-r", "--detect_renames", action="store_true",
+                           help="rename entries in replica which were moved or renamed in source instead of copying "
+                                "them again, manifest is used for that")
+    argParser.add_argument("--dedup", choices=DEDUP_MODES,
+                           help="link new files to identical files already in replica instead of copying them, "
+                                "requires manifest which is then enabled")
+    argParser.add_argument("--verify", action="store_true",
+                           help="rebuild manifest from real replica content e.g. when replica was modified manually")
+    argParser.add_argument("--throttle", action="append", type=parse_window, default=[],
+                           help="limit writes to replica in time window of the day, format is "
+                                "HH:MM-HH:MM,<MB per second>[,<operations per second>], can be used more times")
+    argParser.add_argument("--max_write_latency", type=float,
+                           help="latency of writes in milliseconds above which copy slows down")
+    argParser.add_argument("--durability", choices=MODES, default=MODES[0],
+                           help="when copied files are flushed to disk, 'none' leaves it to the system, 'batched' "
+                                "flushes file system of replica after every batch of files, 'strict' every file")
+    argParser.add_argument("--resume", action="store_true",
+                           help="keep journal of the run next to the output directory, so interrupted run is continued "
+                                "where it stopped by the next run")
+    argParser.add_argument("--exclude", action="append", default=[],
+                           help="gitignore-style pattern of paths which are not synchronized, pattern starting with ! "
+                                "includes paths again, can be given more times, .syncignore files in source "
+                                "directories are used too")
+    argParser.add_argument("--memory_budget", type=int,
+                           help="size in MB of plan kept in memory, operations over the budget are written to folder "
+                                "next to the output directory")
+    argParser.add_argument("--snapshots", action="store_true",
+                           help="write every run as new timestamped snapshot in the output directory, unchanged files "
+                                "are hardlinked from the previous snapshot")
+    argParser.add_argument("--keep_hourly", type=int, default=24,
+                           help="number of last hours whose newest snapshot is kept, default is 24")
+    argParser.add_argument("--keep_daily", type=int, default=7,
+                           help="number of last days whose newest snapshot is kept, default is 7")
+    argParser.add_argument("--metrics_file",
+                           help="file where statistics of runs are written after every run, Prometheus text format is "
+                                "used for '.prom' suffix (e.g. for node exporter textfile collector), JSON otherwise")
+    argParser.add_argument("-n", "--dry_run", "--dry-run", action="store_true",
+                           help="only print operations which would be done together with their estimated duration")
+    argParser.add_argument("--apply_order", choices=ORDERS, default=ORDERS[0],
+                           help="order of operations, 'walk' follows the source tree, 'optimized' creates directories "
+                                "and renames first, then removes entries and copies files sorted by source inode")
 
     args = argParser.parse_args()
+    if not args.jobs_file and not (args.input_dir and args.output_dir):
+        argParser.error("input and output directories or jobs file have to be provided")
+    if args.jobs_file:
+        # options of jobs are given in jobs file, so options given on command line would be ignored
+        ignored = [name for name, value in vars(args).items()
+                   if name not in ('jobs_file', 'log_output', 'metrics_file') and value != argParser.get_default(name)]
+        if ignored:
+            argParser.error(f"jobs file can't be used with: {', '.join('--' + name for name in ignored)}")
+    if args.keep_hourly < 0 or args.keep_daily < 0:
+        argParser.error("numbers of kept snapshots can't be negative")
 
     with open('log_conf.yaml', mode='rt', encoding='utf-8') as file:
         conf = yaml.safe_load(file)
@@ -38,6 +121,33 @@ if __name__ == '__main__':
 
         logging.info('Script called with parameters=%s', args)
 
-        runner = JobRunner(args.input_dir, args.output_dir, args.time_interval)
+        sync_options = {'manifest': args.manifest, 'verify': args.verify, 'workers': args.workers,
+                        'checksum': args.checksum, 'detect_renames': args.detect_renames,
+                        'apply_order': args.apply_order, 'scan_workers': args.scan_workers,
+                        'durability': args.durability, 'resume': args.resume, 'exclude': args.exclude,
+                        'parallel_workers': args.parallel_workers, 'chunk_checksums': args.chunk_checksums,
+                        'dedup': args.dedup}
+        if args.throttle or args.max_write_latency is not None:
+            sync_options['throttle'] = Throttle(args.throttle, args.max_write_latency / 1000
+                                                if args.max_write_latency is not None else None)
+        if args.delta_threshold is not None:
+            sync_options['delta_threshold'] = args.delta_threshold * 1024 * 1024
+        if args.parallel_copy is not None:
+            sync_options['parallel_threshold'] = args.parallel_copy * 1024 * 1024
+        if args.memory_budget is not None:
+            sync_options['memory_budget'] = args.memory_budget * 1024 * 1024
+        if args.snapshots:
+            conflicts = [option for option in CONFLICTING_OPTIONS if sync_options.get(option)]
+            if conflicts:
+                argParser.error(f"snapshots can't be used with: {', '.join(conflicts)}")
+        if args.dry_run:
+            print(Synchronizer(**sync_options).plan(args.input_dir, args.output_dir).to_text())
+            raise SystemExit(0)
+        if args.jobs_file:
+            runner = JobRunner.from_config(args.jobs_file, args.metrics_file)
+        else:
+            runner = JobRunner(args.input_dir, args.output_dir, args.time_interval, sync_options, args.watch,
+                               args.metrics_file, snapshots=Retention(args.keep_hourly, args.keep_daily)
+                               if args.snapshots else None)
         runner.run_job()
         logging.info('Synchronization finished')
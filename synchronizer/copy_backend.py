@@ -0,0 +1,423 @@
+"""
+Copy of file content done by kernel where possible.
+
+Mechanisms are tried in order: reflink (FICLONE ioctl on copy-on-write file systems like btrfs or XFS),
+os.copy_file_range, os.sendfile and copy through userspace buffer as last resort.
+Mechanism which is not supported between two devices is not tried again for the same devices.
+Metadata are preserved the same way as shutil.copy2 does it.
+Content is written to temporary file in the target directory which is then renamed to the target, so the target is
+never left partially written. Copy with progress writes to partial file which is kept when the run is interrupted and
+continues from the last recorded offset next time.
+When Throttle is given, content is copied in chunks of its chunk size and every chunk waits for the throttle.
+
+Files from parallel threshold are split into byte ranges which are copied concurrently by positional calls
+(copy_file_range with offsets, pread and pwrite as fallback) into temporary file preallocated to the size of the source.
+Metadata are copied and the file is renamed only when all ranges were copied. Every range can be also read back and
+compared with the source by checksum, which catches errors of the copy but not of the disk below page cache.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from synchronizer.durability import TEMPORARY_PREFIX, Durability
+from synchronizer.journal import CopyProgress
+from synchronizer.throttle import Throttle
+
+log = logging.getLogger('synchronizer.copy_backend.CopyBackend')
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+USERSPACE = 'userspace'
+MECHANISMS = (REFLINK, COPY_FILE_RANGE, SENDFILE, USERSPACE)
+
+# errors which mean that mechanism can't be used for given files, anything else is real failure of the copy
+_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                       errno.EPERM, errno.ENOTSUP}
+_CHUNK_SIZE = 1024 * 1024 * 1024
+_BUFFER_SIZE = 1024 * 1024
+DEFAULT_PARALLEL_WORKERS = 4
+DEFAULT_RANGE_SIZE = 64 * 1024 * 1024
+
+
+class _MechanismUnsupported(Exception):
+    pass
+
+
+class CopyStats:
+    """
+    Number of files, bytes and time spent by one copy mechanism
+    """
+    __slots__ = ('files', 'bytes', 'seconds')
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: bytes per second
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {'files': self.files, 'bytes': self.bytes, 'seconds': self.seconds, 'throughput': self.throughput}
+
+
+class CopyBackend:
+    """
+    Copy files with the cheapest mechanism supported by source and target file system.
+    Instance can be shared between copy workers. Written files are flushed according to given durability.
+
+    Files which have at least parallel_threshold bytes are copied by parallel_workers threads in ranges of range_size
+    bytes, resumable copy is always done by one stream. Ranges are verified by checksums when chunk_checksums is set.
+    """
+    def __init__(self, mechanisms: tuple[str, ...] = MECHANISMS, throttle: Optional[Throttle] = None,
+                 durability: Optional[Durability] = None, parallel_threshold: Optional[int] = None,
+                 parallel_workers: int = DEFAULT_PARALLEL_WORKERS, range_size: int = DEFAULT_RANGE_SIZE,
+                 chunk_checksums: bool = False):
+        self.mechanisms = tuple(mechanism for mechanism in mechanisms if self.__available(mechanism))
+        self.parallel_threshold = parallel_threshold
+        self.parallel_workers = parallel_workers
+        self.range_size = range_size
+        self.chunk_checksums = chunk_checksums
+        self.__throttle = throttle
+        self.__durability = durability or Durability()
+        self.__chunk_size = throttle.chunk_size if throttle is not None else _CHUNK_SIZE
+        self.__buffer_size = min(_BUFFER_SIZE, self.__chunk_size)
+        self.__lock = threading.Lock()
+        self.__unsupported: set[tuple[str, int, int]] = set()
+        self.__stats = {mechanism: CopyStats() for mechanism in MECHANISMS}
+
+    def copy(self, source: str, target: str, progress: Optional[CopyProgress] = None) -> str:
+        """
+        Copy content and metadata of source file to target file
+        :param progress: progress of resumable copy
+        :return: name of mechanism which finished the copy
+        """
+        offset = 0
+        if progress is None:
+            target_fd, temporary = tempfile.mkstemp(prefix=TEMPORARY_PREFIX, dir=os.path.dirname(target) or os.curdir)
+        else:
+            temporary = progress.partial
+            target_fd = os.open(temporary, os.O_WRONLY | os.O_CREAT, 0o600)
+            # content after the recorded offset may not be complete
+            offset = progress.offset = min(progress.offset, os.fstat(target_fd).st_size)
+            os.ftruncate(target_fd, offset)
+            if offset:
+                log.debug("Copy of '%s' continues from offset %s", target, offset)
+        try:
+            with os.fdopen(target_fd, 'wb'), open(source, 'rb') as source_file:
+                source_fd = source_file.fileno()
+                source_stats = os.fstat(source_fd)
+                devices = (source_stats.st_dev, os.fstat(target_fd).st_dev)
+                if progress is None and self.__is_parallel(source_stats.st_size):
+                    mechanism = self.__copy_parallel(source_fd, target_fd, source_stats.st_size, devices)
+                else:
+                    mechanism = self.__copy_content(source_fd, target_fd, source_stats.st_size, devices, offset,
+                                                    progress)
+                shutil.copystat(source, temporary)
+                self.__durability.sync_file(target_fd)
+            os.replace(temporary, target)
+        except BaseException as error:
+            # partial file of interrupted copy is kept, so the copy can continue next time
+            if progress is None or isinstance(error, Exception):
+                with contextlib.suppress(OSError):
+                    os.remove(temporary)
+            raise
+        self.__durability.written(target)
+        return mechanism
+
+    def stats(self) -> dict[str, CopyStats]:
+        """
+        :return: statistics of mechanisms which copied at least one file
+        """
+        with self.__lock:
+            return {mechanism: stats for mechanism, stats in self.__stats.items() if stats.files or stats.bytes}
+
+    def reset_stats(self):
+        with self.__lock:
+            self.__stats = {mechanism: CopyStats() for mechanism in MECHANISMS}
+
+    def log_report(self):
+        for mechanism, stats in self.stats().items():
+            log.info("Copied %s files (%s bytes) with %s in %.3f s, throughput %.1f MB/s", stats.files, stats.bytes,
+                     mechanism, stats.seconds, stats.throughput / 1024 / 1024)
+
+    def __copy_content(self, source_fd: int, target_fd: int, size: int, devices: tuple[int, int], offset: int,
+                       progress: Optional[CopyProgress]) -> str:
+        for mechanism in self.mechanisms:
+            if (mechanism, *devices) in self.__unsupported or (mechanism == REFLINK and offset):
+                continue
+            started = time.perf_counter()
+            try:
+                copied = self.__copy_with(mechanism, source_fd, target_fd, offset, size, progress)
+            except _MechanismUnsupported as error:
+                copied = error.args[0]
+                log.debug("Mechanism %s is not supported between devices %s", mechanism, devices)
+                with self.__lock:
+                    self.__unsupported.add((mechanism, *devices))
+                self.__add_stats(mechanism, copied, time.perf_counter() - started, False)
+                offset += copied
+                continue
+            self.__add_stats(mechanism, copied, time.perf_counter() - started, True)
+            return mechanism
+        raise OSError(errno.ENOTSUP, "No copy mechanism is available")
+
+    def __copy_with(self, mechanism: str, source_fd: int, target_fd: int, offset: int, size: int,
+                    progress: Optional[CopyProgress]) -> int:
+        """
+        Copy content from given offset to the end of the file
+        :return: number of copied bytes
+        :raise _MechanismUnsupported: with number of bytes copied before mechanism failed
+        """
+        match mechanism:
+            case 'reflink':
+                return self.__reflink(source_fd, target_fd, offset, size)
+            case 'copy_file_range':
+                return self.__copy_file_range(source_fd, target_fd, offset, size, progress)
+            case 'sendfile':
+                return self.__sendfile(source_fd, target_fd, offset, size, progress)
+            case _:
+                return self.__copy_userspace(source_fd, target_fd, offset, progress)
+
+    def __reflink(self, source_fd: int, target_fd: int, offset: int, size: int) -> int:
+        if offset:
+            raise _MechanismUnsupported(0)
+        try:
+            # clone shares blocks of the source, so only one operation is written
+            with self.__chunk(0):
+                fcntl.ioctl(target_fd, FICLONE, source_fd)
+        except OSError as error:
+            if error.errno in _UNSUPPORTED_ERRORS:
+                raise _MechanismUnsupported(0) from error
+            raise
+        return size
+
+    def __copy_file_range(self, source_fd: int, target_fd: int, offset: int, size: int,
+                          progress: Optional[CopyProgress]) -> int:
+        copied = 0
+        while True:
+            if progress is not None:
+                progress.advanced(target_fd, offset + copied)
+            try:
+                with self.__chunk_at(offset + copied, size):
+                    sent = os.copy_file_range(source_fd, target_fd, self.__count(progress), offset + copied,
+                                              offset + copied)
+            except OSError as error:
+                if error.errno in _UNSUPPORTED_ERRORS:
+                    raise _MechanismUnsupported(copied) from error
+                raise
+            if sent == 0:
+                # file can't be copied by this mechanism at all e.g. some pseudo file systems report zero size
+                if copied == 0 and size > offset:
+                    raise _MechanismUnsupported(0)
+                return copied
+            copied += sent
+
+    def __sendfile(self, source_fd: int, target_fd: int, offset: int, size: int,
+                   progress: Optional[CopyProgress]) -> int:
+        copied = 0
+        os.lseek(target_fd, offset, os.SEEK_SET)
+        while True:
+            if progress is not None:
+                progress.advanced(target_fd, offset + copied)
+            try:
+                with self.__chunk_at(offset + copied, size):
+                    sent = os.sendfile(target_fd, source_fd, offset + copied, self.__count(progress))
+            except OSError as error:
+                if error.errno in _UNSUPPORTED_ERRORS:
+                    raise _MechanismUnsupported(copied) from error
+                raise
+            if sent == 0:
+                if copied == 0 and size > offset:
+                    raise _MechanismUnsupported(0)
+                return copied
+            copied += sent
+
+    def __copy_userspace(self, source_fd: int, target_fd: int, offset: int, progress: Optional[CopyProgress]) -> int:
+        copied = 0
+        os.lseek(source_fd, offset, os.SEEK_SET)
+        os.lseek(target_fd, offset, os.SEEK_SET)
+        while True:
+            if progress is not None:
+                progress.advanced(target_fd, offset + copied)
+            data = os.read(source_fd, self.__buffer_size)
+            if not data:
+                return copied
+            view = memoryview(data)
+            written = 0
+            with self.__chunk(len(data)):
+                while written < len(data):
+                    written += os.write(target_fd, view[written:])
+            copied += len(data)
+
+    def __is_parallel(self, size: int) -> bool:
+        return (self.parallel_threshold is not None and size >= self.parallel_threshold and size > self.range_size
+                and self.parallel_workers > 1 and hasattr(os, 'pread'))
+
+    def __copy_parallel(self, source_fd: int, target_fd: int, size: int, devices: tuple[int, int]) -> str:
+        if REFLINK in self.mechanisms and (REFLINK, *devices) not in self.__unsupported:
+            # clone is done by one call, there is nothing to split
+            started = time.perf_counter()
+            try:
+                copied = self.__reflink(source_fd, target_fd, 0, size)
+            except _MechanismUnsupported:
+                log.debug("Mechanism %s is not supported between devices %s", REFLINK, devices)
+                with self.__lock:
+                    self.__unsupported.add((REFLINK, *devices))
+            else:
+                self.__add_stats(REFLINK, copied, time.perf_counter() - started, True)
+                return REFLINK
+
+        self.__preallocate(target_fd, size)
+        ranges = [(start, min(start + self.range_size, size)) for start in range(0, size, self.range_size)]
+        log.debug("Copying %s bytes in %s ranges by %s threads", size, len(ranges), self.parallel_workers)
+        with ThreadPoolExecutor(max_workers=min(self.parallel_workers, len(ranges)),
+                                thread_name_prefix='range-worker') as executor:
+            futures: list[Future] = [executor.submit(self.__copy_range, source_fd, target_fd, start, end, devices)
+                                     for start, end in ranges]
+            try:
+                mechanisms = {future.result() for future in futures}
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        mechanism = USERSPACE if USERSPACE in mechanisms else COPY_FILE_RANGE
+        self.__add_stats(mechanism, 0, 0.0, True)
+        return mechanism
+
+    def __copy_range(self, source_fd: int, target_fd: int, start: int, end: int, devices: tuple[int, int]) -> str:
+        """
+        Copy bytes from start to end by positional calls, so ranges can be copied by more threads at once
+        :return: name of mechanism which finished the range
+        """
+        position = start
+        mechanism = USERSPACE
+        if COPY_FILE_RANGE in self.mechanisms and (COPY_FILE_RANGE, *devices) not in self.__unsupported:
+            mechanism = COPY_FILE_RANGE
+            started = time.perf_counter()
+            try:
+                while position < end:
+                    count = min(self.__chunk_size, end - position)
+                    with self.__chunk(count):
+                        sent = os.copy_file_range(source_fd, target_fd, count, position, position)
+                    if sent == 0:
+                        # the same as in serial copy, range is copied in userspace when nothing was copied at all
+                        if position == start:
+                            mechanism = USERSPACE
+                        break
+                    position += sent
+            except OSError as error:
+                if error.errno not in _UNSUPPORTED_ERRORS:
+                    raise
+                log.debug("Mechanism %s is not supported between devices %s", COPY_FILE_RANGE, devices)
+                with self.__lock:
+                    self.__unsupported.add((COPY_FILE_RANGE, *devices))
+                mechanism = USERSPACE
+            self.__add_stats(COPY_FILE_RANGE, position - start, time.perf_counter() - started, False)
+
+        if position < end and mechanism == USERSPACE:
+            started = time.perf_counter()
+            copied = position
+            while position < end:
+                data = os.pread(source_fd, min(self.__buffer_size, end - position), position)
+                if not data:
+                    break
+                view = memoryview(data)
+                written = 0
+                with self.__chunk(len(data)):
+                    while written < len(data):
+                        written += os.pwrite(target_fd, view[written:], position + written)
+                position += len(data)
+            self.__add_stats(USERSPACE, position - copied, time.perf_counter() - started, False)
+
+        if position < end:
+            raise OSError(errno.EIO, f"Source file ended at {position} bytes during copy of range {start}-{end}")
+        if self.chunk_checksums:
+            self.__verify_range(source_fd, target_fd, start, end)
+        return mechanism
+
+    def __verify_range(self, source_fd: int, target_fd: int, start: int, end: int):
+        if self.__range_digest(source_fd, start, end) != self.__range_digest(target_fd, start, end):
+            raise OSError(errno.EIO, f"Checksum of copied range {start}-{end} differs from the source")
+
+    def __range_digest(self, fd: int, start: int, end: int) -> bytes:
+        digest = hashlib.blake2b()
+        position = start
+        while position < end:
+            data = os.pread(fd, min(self.__buffer_size, end - position), position)
+            if not data:
+                break
+            digest.update(data)
+            position += len(data)
+        return digest.digest()
+
+    @staticmethod
+    def __preallocate(fd: int, size: int):
+        """
+        Reserve space of the whole file, so ranges are not written to fragmented file and missing space is found
+        before the copy
+        """
+        if not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as error:
+            if error.errno not in _UNSUPPORTED_ERRORS:
+                raise
+
+    def __chunk(self, size: int) -> contextlib.AbstractContextManager:
+        return self.__throttle.chunk(size) if self.__throttle is not None else contextlib.nullcontext()
+
+    def __count(self, progress: Optional[CopyProgress]) -> int:
+        """
+        :return: maximal number of bytes copied by one call, progress is recorded between calls
+        """
+        return min(self.__chunk_size, progress.interval) if progress is not None else self.__chunk_size
+
+    def __chunk_at(self, offset: int, size: int) -> contextlib.AbstractContextManager:
+        """
+        Call which only finds the end of the file is not throttled
+        """
+        if offset >= size:
+            return contextlib.nullcontext()
+        return self.__chunk(min(self.__chunk_size, size - offset))
+
+    def __add_stats(self, mechanism: str, copied: int, seconds: float, finished: bool):
+        with self.__lock:
+            stats = self.__stats[mechanism]
+            stats.bytes += copied
+            stats.seconds += seconds
+            if finished:
+                stats.files += 1
+
+    @staticmethod
+    def __available(mechanism: str) -> bool:
+        match mechanism:
+            case 'reflink':
+                return fcntl is not None and os.name == 'posix'
+            case 'copy_file_range':
+                return hasattr(os, 'copy_file_range')
+            case 'sendfile':
+                return hasattr(os, 'sendfile') and os.name == 'posix'
+            case _:
+                return True
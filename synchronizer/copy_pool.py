@@ -0,0 +1,80 @@
+"""
+Pool of copy workers fed from the tree walk through bounded queue.
+
+Only file operations are executed by the workers. Directories are created and replica entries are removed by the walking
+thread before any work for their children is submitted, so directories always exist before their content is written and
+removals never race with copies.
+"""
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+from typing import Callable, Optional
+
+log = logging.getLogger('synchronizer.copy_pool.CopyPool')
+
+
+class CopyPool:
+    """
+    Execute submitted tasks on given number of worker threads. With single worker tasks are executed straight away in
+    calling thread, so the order of operations is the same as the order of the walk.
+
+    Failure of one task doesn't stop the others, errors are collected and returned by wait.
+    """
+    def __init__(self, workers: int = 1, queue_size: Optional[int] = None):
+        if workers < 1:
+            raise ValueError(f"Number of workers has to be positive: {workers}")
+        self.workers = workers
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__slots: Optional[threading.BoundedSemaphore] = None
+        if workers > 1:
+            self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy-worker')
+            self.__slots = threading.BoundedSemaphore(queue_size or workers * 4)
+        self.__condition = threading.Condition()
+        self.__pending = 0
+        self.__errors: list[tuple[str, BaseException]] = []
+
+    def submit(self, description: str, function: Callable, *args):
+        """
+        Submit task for execution. Blocks when the queue is full.
+        :param description: identification of the task used in error report e.g. path of the file
+        :param function: task to execute
+        """
+        if self.__executor is None:
+            try:
+                function(*args)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                self.__add_error(description, error)
+            return
+
+        self.__slots.acquire()
+        with self.__condition:
+            self.__pending += 1
+        future = self.__executor.submit(function, *args)
+        future.add_done_callback(lambda done: self.__finish(description, done))
+
+    def wait(self) -> list[tuple[str, BaseException]]:
+        """
+        Wait until all submitted tasks are finished
+        :return: description and error of every failed task since last wait
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__pending == 0)
+            errors, self.__errors = self.__errors, []
+        return errors
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+
+    def __finish(self, description: str, future: Future):
+        if future.exception() is not None:
+            self.__add_error(description, future.exception())
+        self.__slots.release()
+        with self.__condition:
+            self.__pending -= 1
+            self.__condition.notify_all()
+
+    def __add_error(self, description: str, error: BaseException):
+        log.error("Synchronization of '%s' failed: %s", description, error)
+        with self.__condition:
+            self.__errors.append((description, error))
@@ -0,0 +1,140 @@
+"""
+Deduplication of identical files in replica.
+
+Replica files recorded in manifest are the index of replica content. New or changed source file is compared with
+replica files of the same size, first by hash of their first and last block and then by full content hash, which is
+cached next to the replica (see HashCache). Identical replica file is then linked instead of copying the source:
+
+- hardlink: replica files share one inode, so also mode, owners and modification time. File is linked only when they
+  are the same as metadata of the source file, otherwise it is copied.
+- reflink: new replica file shares data blocks with the identical file (copy-on-write file systems like btrfs or XFS),
+  but it has its own metadata, which are copied from the source file.
+
+Shared inode is never changed in place, see Synchronizer. Mode is turned off for the rest of the run when replica
+file system doesn't support the links at all.
+"""
+import errno
+import logging
+import os
+import shutil
+from os import stat_result
+from typing import Optional
+
+from synchronizer.copy_backend import REFLINK as REFLINK_MECHANISM, CopyBackend
+from synchronizer.durability import TEMPORARY_PREFIX, Durability
+from synchronizer.hash_cache import HashCache
+from synchronizer.manifest import Manifest
+from synchronizer.renames import RenameDetector
+from synchronizer.walker import FileStat
+
+log = logging.getLogger('synchronizer.dedup.Deduplicator')
+
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+MODES = (HARDLINK, REFLINK)
+
+# replica files of the same size which are compared with one source file
+MAX_CANDIDATES = 16
+
+# errors which mean that replica file system can't link files at all
+_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}
+
+
+def same_metadata(source_stats: FileStat, stats: stat_result | FileStat) -> bool:
+    """
+    :return: True when file with given stats can be hardlinked as the source file
+    """
+    return (stats.st_mode == source_stats.st_mode and stats.st_uid == source_stats.st_uid
+            and stats.st_gid == source_stats.st_gid and stats.st_mtime_ns == source_stats.st_mtime_ns)
+
+
+def hardlink(path: str, target: str):
+    """
+    Replace target by hardlink to given file, target is never missing when it existed before
+    """
+    temporary = os.path.join(os.path.dirname(target), f"{TEMPORARY_PREFIX}{os.urandom(8).hex()}.link")
+    os.link(path, temporary)
+    try:
+        os.replace(temporary, target)
+    except OSError:
+        os.remove(temporary)
+        raise
+
+
+class Deduplicator:
+    """
+    Link new replica files to identical replica files. Instance can be shared between copy workers.
+    """
+    def __init__(self, mode: str, manifest: Manifest, hash_cache: HashCache, output_dir: str,
+                 durability: Optional[Durability] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown deduplication mode '{mode}', expected one of {MODES}")
+        self.mode = mode
+        self.__manifest = manifest
+        self.__hash_cache = hash_cache
+        self.__output_dir = output_dir
+        self.__durability = durability or Durability()
+        self.__cloner = CopyBackend((REFLINK_MECHANISM,), durability=durability)
+        self.__supported = True
+
+    def link(self, source: str, target: str, source_stats: FileStat) -> bool:
+        """
+        Replace target by link to replica file with the same content as the source file
+        :return: True when target was linked, False when the source has to be copied
+        """
+        size = source_stats.st_size
+        if not self.__supported or size == 0:
+            return False
+        partial = None
+        checked = 0
+        for directory, candidate in self.__manifest.find_by_size(size):
+            path = os.path.join(self.__output_dir, directory, candidate.name)
+            if os.path.normpath(path) == os.path.normpath(target) or not self.__can_share(source_stats, candidate.stat):
+                continue
+            if checked == MAX_CANDIDATES:
+                break
+            checked += 1
+            try:
+                # replica could be changed after the file was recorded
+                stats = os.stat(path)
+                if stats.st_size != size or not self.__can_share(source_stats, stats):
+                    continue
+                if partial is None:
+                    partial = RenameDetector.partial_digest(source, size)
+                if (RenameDetector.partial_digest(path, size) != partial
+                        or self.__hash_cache.digest(source, source_stats) != self.__hash_cache.digest(path, stats)):
+                    continue
+            except OSError as error:
+                log.debug("Replica file '%s' can't be compared with '%s': %s", path, source, error)
+                continue
+            if self.__link(path, source, target):
+                return True
+            if not self.__supported:
+                return False
+        return False
+
+    def __can_share(self, source_stats: FileStat, stats: stat_result | FileStat) -> bool:
+        """
+        :return: True when replica file with given stats can be linked to the source file
+        """
+        return self.mode == REFLINK or same_metadata(source_stats, stats)
+
+    def __link(self, path: str, source: str, target: str) -> bool:
+        try:
+            if self.mode == HARDLINK:
+                hardlink(path, target)
+                self.__durability.written(target)
+            else:
+                self.__cloner.copy(path, target)
+                shutil.copystat(source, target)
+        except OSError as error:
+            if error.errno == errno.EMLINK:
+                log.debug("Replica file '%s' has maximal number of links", path)
+                return False
+            if error.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            log.info("Replica doesn't support %s, identical files are copied: %s", self.mode, error)
+            self.__supported = False
+            return False
+        log.debug("Replica file '%s' linked to identical file '%s'", target, path)
+        return True
@@ -0,0 +1,100 @@
+"""
+Block level update of large files which exist in replica already.
+
+Replica file is updated in place, only blocks which differ from source are written. Every block of replica is
+compared with source, so only the new part of grown append-only files (e.g. logs) is written, while changes in the old
+part of grown files (e.g. database pages) are not missed. Unlike full copy, the update is not atomic, replica file
+which was being updated when the run was killed differs from source and is updated again by the next run.
+"""
+import contextlib
+import logging
+import os
+import shutil
+import threading
+from typing import Optional
+
+from synchronizer.durability import Durability
+from synchronizer.throttle import Throttle
+
+log = logging.getLogger('synchronizer.delta.DeltaCopier')
+
+DEFAULT_BLOCK_SIZE = 128 * 1024
+
+
+class DeltaCopier:
+    """
+    Update replica file by writing only changed blocks.
+    Both files are local, so blocks are compared directly which is cheaper than computing checksums of both sides.
+    Instance can be shared between copy workers. Every written block waits for the throttle when it is given, updated
+    files are flushed according to given durability.
+    """
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE, throttle: Optional[Throttle] = None,
+                 durability: Optional[Durability] = None):
+        self.block_size = block_size
+        self.__throttle = throttle
+        self.__durability = durability or Durability()
+        self.__lock = threading.Lock()
+        self.__files = 0
+        self.__written = 0
+        self.__skipped = 0
+
+    def update(self, source: str, target: str) -> int:
+        """
+        Update content and metadata of target file to match source file
+        :return: number of written bytes
+        """
+        with open(source, 'rb') as source_file, open(target, 'r+b') as target_file:
+            target_size = os.fstat(target_file.fileno()).st_size
+
+            written, offset = self.__write_changed_blocks(source_file, target_file, target_size)
+            if offset != target_size:
+                target_file.truncate(offset)
+            # buffered blocks would change modification time when they were written after copystat
+            target_file.flush()
+            shutil.copystat(source, target)
+            self.__durability.sync_file(target_file.fileno())
+        self.__durability.written(target)
+
+        log.debug("Delta update of '%s' wrote %s of %s bytes", target, written, offset)
+        with self.__lock:
+            self.__files += 1
+            self.__written += written
+            self.__skipped += offset - written
+        return written
+
+    def reset_stats(self):
+        with self.__lock:
+            self.__files = 0
+            self.__written = 0
+            self.__skipped = 0
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {'files': self.__files, 'written': self.__written, 'skipped': self.__skipped}
+
+    def log_report(self):
+        stats = self.stats()
+        if stats['files']:
+            log.info("Delta updated %s files, written %s bytes, unchanged %s bytes", stats['files'], stats['written'],
+                     stats['skipped'])
+
+    def __write_changed_blocks(self, source_file, target_file, target_size: int) -> tuple[int, int]:
+        """
+        :return: number of written bytes and size of the source file
+        """
+        written = 0
+        offset = 0
+        while True:
+            block = source_file.read(self.block_size)
+            if not block:
+                return written, offset
+
+            if offset < target_size and target_file.read(len(block)) == block:
+                offset += len(block)
+                continue
+
+            target_file.seek(offset)
+            with self.__throttle.chunk(len(block)) if self.__throttle is not None else contextlib.nullcontext():
+                target_file.write(block)
+            written += len(block)
+            offset += len(block)
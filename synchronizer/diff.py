@@ -0,0 +1,299 @@
+"""
+Diff of source and replica trees producing plan of operations.
+
+Source directory and its replica counterpart are both listed sorted by name and merged in one pass, so every directory
+is compared in linear time. Diff doesn't change replica nor its manifest, all changes are done when the plan is applied.
+"""
+import logging
+import os
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from synchronizer.filters import Filter
+from synchronizer.manifest import Manifest
+from synchronizer.plan import (COPY, DELETE, MKDIR, RECORD, RENAME, UPDATE, UPDATE_META, VERIFY, Operation, Plan)
+from synchronizer.renames import RenameDetector
+from synchronizer.spill import Spill
+from synchronizer.walker import Entry, Walker
+
+log = logging.getLogger('synchronizer.diff.TreeDiff')
+
+
+class _DirectoryPair(NamedTuple):
+    """
+    Directory which is being compared together with pairs of source and replica entries that were not processed yet.
+    Replica directory has different path than the source one when it is renamed by the plan. Protected names are
+    excluded replica entries, which are neither removed nor replaced.
+    """
+    relative: str
+    replica_relative: str
+    recursive: bool
+    pending: Iterator[tuple[Optional[Entry], Optional[Entry]]]
+    protected: frozenset[str] = frozenset()
+
+
+class Shard(NamedTuple):
+    """
+    Directory which can be compared independently of the rest of the tree. Replica directory doesn't exist yet when
+    it is created by the plan.
+    """
+    relative: str
+    recursive: bool
+    replica_exists: bool = True
+
+
+class TreeDiff:
+    """
+    Compare source tree with replica and create plan which makes them the same.
+
+    Replica is taken from trusted manifest when it is given, otherwise replica directories are listed.
+    When rename detector is given, entries missing in replica are renamed from their previous location and removal of
+    replica entries is postponed to the end of the plan, so they can still be used as rename candidates.
+    Paths of renames are tracked during the diff, so every operation has path valid at the time it is applied.
+
+    Diff can be split into shards, then only given directories are compared and their subdirectories are returned as
+    shards of the plan instead of being compared too. Rename detection needs whole tree, so it can't be split.
+
+    Entries excluded by filter are skipped on both sides before they are stat-ed and excluded directories are not
+    descended into. Excluded replica entries are never removed, renamed nor replaced. Filter has to be started with
+    the source directory before the diff.
+
+    Plan keeps in memory only operations which fit into memory budget of given spill, the rest is written to disk.
+    """
+    def __init__(self, walker: Walker, manifest: Optional[Manifest] = None, manifest_trusted: bool = False,
+                 renames: Optional[RenameDetector] = None, checksum: bool = False, filters: Optional[Filter] = None,
+                 spill: Optional[Spill] = None):
+        self.__walker = walker
+        self.__spill = spill
+        self.__filter = filters
+        self.__manifest = manifest
+        self.__manifest_trusted = manifest_trusted
+        self.__renames = renames
+        self.__checksum = checksum
+        self.__output_dir = ''
+        self.__plan = Plan()
+        self.__postponed: list[tuple[str, Operation]] = []
+        # previous replica paths of renamed entries mapped to their new paths
+        self.__moved: dict[str, str] = {}
+        # previous replica paths of entries which can't be rename candidates any more
+        self.__used: set[str] = set()
+        self.__removed: set[str] = set()
+
+    def diff(self, input_dir: str, output_dir: str, directories: list[tuple[str, bool]]) -> Plan:
+        """
+        :param directories: relative paths of directories existing in both trees with flag whether their
+        subdirectories should be compared too
+        :return: operations in order of the tree walk
+        """
+        shards = [Shard(relative, recursive) for relative, recursive in directories]
+        return self.diff_shards(input_dir, output_dir, shards)
+
+    def diff_shards(self, input_dir: str, output_dir: str, shards: list[Shard], split: bool = False) -> Plan:
+        """
+        :param split: compare only given directories and return their subdirectories as shards of the plan
+        :return: operations in order of the tree walk
+        """
+        if split and self.__renames is not None:
+            raise ValueError("Diff with rename detection can't be split")
+        self.__output_dir = output_dir
+        self.__plan = Plan(spill=self.__spill)
+        try:
+            for shard in shards:
+                self.__diff_tree(input_dir, shard, split)
+            for previous, operation in self.__postponed:
+                # entry which was moved away or together with its renamed parent is no longer there
+                if self.__current_path(previous) == operation.path:
+                    self.__plan.add(operation)
+            return self.__plan
+        finally:
+            self.__postponed = []
+            self.__moved = {}
+            self.__used = set()
+            self.__removed = set()
+
+    def __diff_tree(self, input_dir: str, shard: Shard, split: bool):
+        if shard.relative and self.__filter is not None and self.__filter.excluded(shard.relative, True):
+            log.debug("Directory '%s' is excluded", shard.relative)
+            return
+        stack = [self.__open_directory_pair(input_dir, shard.relative, shard.relative, shard.replica_exists,
+                                            shard.recursive)]
+        while stack:
+            pair = stack[-1]
+            entry, replica_entry = next(pair.pending, (None, None))
+            if entry is None and replica_entry is None:
+                stack.pop()
+                continue
+
+            replica_path = os.path.join(pair.replica_relative, (entry or replica_entry).name)
+            if replica_entry is not None and self.__renames is not None and replica_path in self.__moved:
+                replica_entry = None
+            if entry is None:
+                if replica_entry is not None:
+                    self.__remove(pair, replica_entry, replica_path, False)
+                continue
+            if entry.name in pair.protected:
+                log.debug("Item '%s' is excluded in replica, it is not replaced", replica_path)
+                continue
+
+            log.debug("Processing item: %s", os.path.join(pair.relative, entry.name))
+            self.__plan.scanned += 1
+            if replica_entry is not None and replica_entry.is_dir != entry.is_dir:
+                self.__remove(pair, replica_entry, replica_path, True)
+                replica_entry = None
+            elif replica_entry is not None and pair.relative != pair.replica_relative:
+                self.__used.add(replica_path)
+
+            if replica_entry is None and self.__renames is not None:
+                found = self.__find_renamed(input_dir, pair, entry)
+                if found is not None:
+                    replica_path, replica_entry = found
+
+            if entry.is_dir:
+                if replica_entry is None:
+                    self.__plan.add(Operation(MKDIR, pair.relative, entry.name, True, entry=entry))
+                elif self.__needs_record(entry, replica_entry):
+                    self.__plan.add(Operation(RECORD, pair.relative, entry.name, True, entry=entry,
+                                              replica_entry=replica_entry))
+                if split and (pair.recursive or replica_entry is None):
+                    self.__plan.shards.append(Shard(os.path.join(pair.relative, entry.name), True,
+                                                    replica_entry is not None))
+                elif pair.recursive or replica_entry is None:
+                    stack.append(self.__open_directory_pair(input_dir, os.path.join(pair.relative, entry.name),
+                                                            replica_path, replica_entry is not None))
+            else:
+                self.__diff_file(pair, entry, replica_entry)
+
+    def __open_directory_pair(self, input_dir: str, relative: str, replica_relative: str, target_existed: bool,
+                              recursive: bool = True) -> _DirectoryPair:
+        if self.__filter is None:
+            source = self.__walker.scan(os.path.join(input_dir, relative))
+            accept = None
+        else:
+            source = self.__walker.scan(os.path.join(input_dir, relative), self.__filter.selector(relative))
+            # replica entries are filtered by rules of the source directory where they belong
+            accept = self.__filter.acceptor(relative)
+        protected = set()
+
+        def accept_replica(name: str, is_dir: bool) -> bool:
+            if accept(name, is_dir):
+                return True
+            protected.add(name)
+            return False
+
+        if not target_existed:
+            replica = []
+        elif self.__manifest_trusted:
+            replica = list(self.__manifest.listing(replica_relative).values())
+            if accept is not None:
+                replica = [entry for entry in replica if accept_replica(entry.name, entry.is_dir)]
+        else:
+            replica = self.__walker.scan(os.path.join(self.__output_dir, replica_relative),
+                                         (lambda names: accept_replica) if accept is not None else None)
+        return _DirectoryPair(relative, replica_relative, recursive, self.__merge(source, replica),
+                              frozenset(protected))
+
+    @staticmethod
+    def __merge(source: list[Entry], replica: list[Entry]) -> Iterator[tuple[Optional[Entry], Optional[Entry]]]:
+        """
+        :return: entries of both sorted listings paired by name, missing entry is None
+        """
+        replica_entries = iter(replica)
+        replica_entry = next(replica_entries, None)
+        for entry in source:
+            while replica_entry is not None and replica_entry.name < entry.name:
+                yield None, replica_entry
+                replica_entry = next(replica_entries, None)
+            if replica_entry is not None and replica_entry.name == entry.name:
+                yield entry, replica_entry
+                replica_entry = next(replica_entries, None)
+            else:
+                yield entry, None
+        while replica_entry is not None:
+            yield None, replica_entry
+            replica_entry = next(replica_entries, None)
+
+    def __diff_file(self, pair: _DirectoryPair, entry: Entry, replica_entry: Entry | None):
+        if replica_entry is None:
+            self.__plan.add(Operation(COPY, pair.relative, entry.name, size=entry.stat.st_size, entry=entry))
+            return
+
+        source_stats, target_stats = entry.stat, replica_entry.stat
+        if source_stats.st_size != target_stats.st_size or source_stats.st_mtime_ns != target_stats.st_mtime_ns:
+            kind = UPDATE
+        elif self.__checksum:
+            kind = VERIFY
+        elif (source_stats.st_mode != target_stats.st_mode or source_stats.st_uid != target_stats.st_uid
+              or source_stats.st_gid != target_stats.st_gid):
+            kind = UPDATE_META
+        elif self.__needs_record(entry, replica_entry):
+            kind = RECORD
+        else:
+            return
+        size = source_stats.st_size if kind in (UPDATE, VERIFY) else 0
+        self.__plan.add(Operation(kind, pair.relative, entry.name, size=size, entry=entry,
+                                  replica_entry=replica_entry))
+
+    def __needs_record(self, entry: Entry, replica_entry: Entry) -> bool:
+        """
+        :return: True when unchanged entry is missing in manifest or it has different source inode there
+        """
+        return self.__manifest is not None and (not self.__manifest_trusted or replica_entry.inode != entry.inode)
+
+    def __remove(self, pair: _DirectoryPair, replica_entry: Entry, replica_path: str, replacing: bool):
+        operation = Operation(DELETE, pair.relative, replica_entry.name, replica_entry.is_dir, replacing=replacing,
+                              replica_entry=replica_entry)
+        if self.__renames is None:
+            self.__plan.add(operation)
+        elif replacing:
+            self.__removed.add(replica_path)
+            self.__plan.add(operation)
+        else:
+            self.__postponed.append((replica_path, operation))
+
+    def __find_renamed(self, input_dir: str, pair: _DirectoryPair, entry: Entry) -> Optional[tuple[str, Entry]]:
+        """
+        Plan rename of replica entry which was moved or renamed in source
+        :return: previous replica path and manifest entry of renamed entry, None when there is nothing to rename
+        """
+        path = os.path.join(pair.relative, entry.name)
+        found = self.__renames.find(os.path.join(input_dir, path), entry, self.__rename_filter(path))
+        if found is None:
+            return None
+
+        directory, replica_entry = found
+        previous = os.path.join(directory, replica_entry.name)
+        self.__plan.add(Operation(RENAME, pair.relative, entry.name, entry.is_dir,
+                                  previous=self.__current_path(previous), entry=entry, replica_entry=replica_entry))
+        self.__moved[previous] = path
+        self.__used.add(previous)
+        return previous, replica_entry
+
+    def __rename_filter(self, path: str) -> Callable[[str, Entry], bool]:
+        def accept(directory: str, candidate: Entry) -> bool:
+            previous = os.path.join(directory, candidate.name)
+            if self.__filter is not None and self.__filter.excluded(previous, candidate.is_dir):
+                return False
+            if previous in self.__used or any(parent in self.__removed for parent in self.__parents(previous)):
+                return False
+            # directory can't be moved into itself
+            return not path.startswith(self.__current_path(previous) + os.sep)
+        return accept
+
+    def __current_path(self, previous: str) -> str:
+        """
+        :param previous: replica path before the plan is applied
+        :return: replica path after renames planned so far are applied
+        """
+        for parent in self.__parents(previous):
+            moved = self.__moved.get(parent)
+            if moved is not None:
+                return moved + previous[len(parent):]
+        return previous
+
+    @staticmethod
+    def __parents(path: str) -> Iterator[str]:
+        """
+        :return: given path followed by its parents
+        """
+        while path:
+            yield path
+            path = os.path.dirname(path)
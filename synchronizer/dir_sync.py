@@ -3,11 +3,34 @@ Directory synchronization implementation.
 
 Only local disk synchronization is supported right now.
 """
-import glob
+import contextlib
 import logging
 import os
 from os import stat_result
 import shutil
+import stat
+import threading
+import time
+from typing import Callable, Collection, Iterator, Optional
+
+from synchronizer.copy_backend import DEFAULT_PARALLEL_WORKERS, CopyBackend
+from synchronizer.copy_pool import CopyPool
+from synchronizer.dedup import Deduplicator, hardlink, same_metadata
+from synchronizer.delta import DeltaCopier
+from synchronizer.diff import TreeDiff
+from synchronizer.durability import NONE, Durability
+from synchronizer.filters import Filter
+from synchronizer.hash_cache import HashCache
+from synchronizer.io_limits import IOLimiter
+from synchronizer.journal import CopyProgress, Journal, JournalState
+from synchronizer.manifest import Manifest
+from synchronizer.plan import COPY, DELETE, MKDIR, RECORD, RENAME, WALK_ORDER, Operation, Plan
+from synchronizer.renames import RenameDetector
+from synchronizer.run_stats import RunStats
+from synchronizer.sharded_diff import ShardedDiff
+from synchronizer.spill import Spill
+from synchronizer.throttle import Throttle
+from synchronizer.walker import FileStat, Walker
 
 log = logging.getLogger('synchronizer.dir_sync.Synchronizer')
 
@@ -23,9 +46,227 @@ class Synchronizer:
 
     File and directory presence between input and output directory is checked together with file size, modification time
     file mode and owners.
+
+    Synchronization has two phases. Source tree and replica are compared first and plan of operations is created,
+    see TreeDiff. Plan is then applied in order of the tree walk or in optimized order, see Plan.ordered. Plan can be
+    also only created, so it is shown what would be done without touching the replica.
+
+    When manifest is enabled, state of replica is taken from manifest stored next to the replica and replica is touched
+    only for entries which differ from source. Verify mode rebuilds manifest from real replica content.
+
+    Copy and update of files is done by given number of workers. Failure of single file doesn't stop synchronization of
+    the others, all failures are reported together when synchronization is finished.
+    File content is copied by kernel (reflink, copy_file_range or sendfile) when file systems support it, used copy
+    mechanisms are reported at the end of every run.
+
+    Changed files which have at least delta_threshold bytes are updated in place and only changed blocks are written.
+    Copied files which have at least parallel_threshold bytes are split into ranges copied by parallel_workers threads,
+    ranges are verified by checksums when chunk_checksums is set.
+
+    Deduplication (requires manifest) links new and changed files to identical replica files by hardlink or reflink
+    instead of copying them, see Deduplicator. Hardlinked replica file is never updated in place nor its metadata are
+    changed, it is replaced by a copy, so other links of the same inode stay untouched.
+
+    Replica can be also written as new snapshot of the source, then files which are the same in the previous snapshot
+    (link_dest) are hardlinked from it instead of being copied. Shared inodes are protected the same way.
+
+    Checksum mode compares also content hashes of files with the same size and modification time. Hashes are cached next
+    to the replica, so only new or modified files are read.
+
+    Only some directories can be synchronized when it is known where the changes are (e.g. from file system events).
+
+    Paths can be excluded by gitignore-style rules given by exclude and by .syncignore files in source directories,
+    see Filter. Excluded directories are not scanned in source nor in replica and excluded replica content is kept.
+
+    Scan of large trees can be split into subtrees which are compared in parallel by scan_workers processes. Rename
+    detection needs whole tree, so the tree is scanned by one process when it is enabled.
+
+    Copy streams can be limited by IOLimiter shared with other synchronizers running in the same process. Written
+    bytes and operations can be limited by Throttle, which can be shared the same way.
+
+    Resumable run keeps journal of its plan and finished operations next to the replica, see Journal. Run which was
+    killed or interrupted is then continued by the next run without scanning the trees again, large files continue
+    from the last recorded offset. Manifest is committed together with every batch of finished operations.
+
+    Copied files replace replica files atomically. Durability mode (none, batched or strict) decides when they are
+    flushed to disk, see Durability. Batched files are flushed at the latest before the manifest is committed.
+
+    Plan of the run is kept in memory only up to memory_budget bytes, operations over the budget are spilled to
+    directory next to the replica (e.g. 'backup.spill') and read back while the plan is applied, see Plan. Dry-run plan
+    is always kept in memory.
+
+    Every run returns its statistics (RunStats), the same statistics are passed to registered listeners also when the
+    run fails.
+
+    Rename detection (requires manifest) renames replica entries which were moved or renamed in source instead of
+    removing and copying them again. Removal of replica entries is postponed to the end of the run in that case, so
+    they can still be used as rename candidates.
     """
-    def synchronize(self, input_dir: str, output_dir: str):
+    def __init__(self, manifest: bool = False, verify: bool = False, workers: int = 1,
+                 delta_threshold: Optional[int] = None, checksum: bool = False, detect_renames: bool = False,
+                 apply_order: str = WALK_ORDER, io_limiter: Optional[IOLimiter] = None, scan_workers: int = 1,
+                 throttle: Optional[Throttle] = None, durability: str = NONE, resume: bool = False,
+                 exclude: Collection[str] = (), parallel_threshold: Optional[int] = None,
+                 parallel_workers: int = DEFAULT_PARALLEL_WORKERS, chunk_checksums: bool = False,
+                 dedup: Optional[str] = None, memory_budget: Optional[int] = None):
+        self.__walker = Walker()
+        self.__filter = Filter(exclude)
+        self.__durability = Durability(durability)
+        self.__copier = CopyBackend(throttle=throttle, durability=self.__durability,
+                                    parallel_threshold=parallel_threshold, parallel_workers=parallel_workers,
+                                    chunk_checksums=chunk_checksums)
+        self.__delta = DeltaCopier(throttle=throttle, durability=self.__durability)
+        self.__delta_threshold = delta_threshold
+        self.__checksum = checksum
+        self.__hash_cache: Optional[HashCache] = None
+        self.__use_manifest = manifest or detect_renames or dedup is not None
+        self.__dedup_mode = dedup
+        self.__dedup: Optional[Deduplicator] = None
+        self.__link_dest: Optional[str] = None
+        self.__detect_renames = detect_renames
+        self.__apply_order = apply_order
+        self.__io_limiter = io_limiter
+        self.__scan_workers = scan_workers
+        self.__memory_budget = memory_budget
+        self.__resume = resume
+        self.__journal: Optional[Journal] = None
+        self.__checkpoint_lock = threading.Lock()
+        self.__output_dir = ''
+        self.__verify = verify
+        self.__workers = workers
+        self.__manifest: Optional[Manifest] = None
+        self.__manifest_trusted = False
+        self.__pool: Optional[CopyPool] = None
+        self.__stats: Optional[RunStats] = None
+        self.__stats_listeners: list[Callable[[RunStats], None]] = []
+        self.last_stats: Optional[RunStats] = None
+
+    def add_stats_listener(self, listener: Callable[[RunStats], None]):
+        """
+        :param listener: called with statistics of every finished run
+        """
+        self.__stats_listeners.append(listener)
+
+    def synchronize(self, input_dir: str, output_dir: str, link_dest: Optional[str] = None) -> RunStats:
+        """
+        :param link_dest: previous snapshot of the source, files with the same metadata are hardlinked from it
+        """
         log.info("Started with synchronization of %s to %s", input_dir, output_dir)
+        return self.__run(input_dir, output_dir, {'': True}, link_dest)
+
+    def synchronize_directories(self, input_dir: str, output_dir: str, directories: dict[str, bool]) -> RunStats:
+        """
+        Synchronize only given directories of input_dir. Whole tree is synchronized when replica manifest can't be
+        trusted, because it would be incomplete otherwise.
+        :param directories: paths relative to input_dir mapped to flag whether their subdirectories should be
+        synchronized too
+        """
+        log.info("Started with synchronization of %s to %s", input_dir, output_dir)
+        log.debug("Synchronized directories: %s", directories)
+        return self.__run(input_dir, output_dir, directories)
+
+    def plan(self, input_dir: str, output_dir: str) -> Plan:
+        """
+        Create plan of whole tree synchronization. Neither replica nor its manifest are changed.
+        """
+        input_dir, output_dir = self.__check_directories(input_dir, output_dir)
+        try:
+            renames = self.__open_manifest(input_dir, output_dir, True)
+            return self.__diff(input_dir, output_dir, {'': True}, renames)
+        finally:
+            if self.__manifest is not None:
+                self.__manifest.close(False)
+                self.__manifest = None
+
+    def __run(self, input_dir: str, output_dir: str, directories: dict[str, bool],
+              link_dest: Optional[str] = None) -> RunStats:
+        input_dir, output_dir = self.__check_directories(input_dir, output_dir)
+        self.__stats = stats = RunStats(input_dir, output_dir)
+        self.__durability.root = output_dir
+        journal = Journal.for_replica(output_dir) if self.__resume else None
+        state = journal.load(input_dir, output_dir, directories) if journal is not None else None
+        renames = self.__open_manifest(input_dir, output_dir, False, state is not None)
+        requested = directories
+        if self.__use_manifest and not self.__manifest_trusted:
+            directories = {'': True}
+
+        if self.__checksum or self.__dedup_mode is not None:
+            self.__hash_cache = HashCache.for_replica(output_dir)
+            self.__hash_cache.open()
+        if self.__dedup_mode is not None:
+            self.__dedup = Deduplicator(self.__dedup_mode, self.__manifest, self.__hash_cache, output_dir,
+                                        self.__durability)
+
+        spill = self.__open_spill(output_dir)
+        self.__pool = CopyPool(self.__workers)
+        self.__copier.reset_stats()
+        self.__delta.reset_stats()
+        complete = False
+        apply_start = None
+        try:
+            self.__output_dir = output_dir
+            self.__link_dest = link_dest
+            if state is not None:
+                operations = state.operations
+                journal.resume()
+            else:
+                with stats.phase('scan'):
+                    plan = self.__diff(input_dir, output_dir, directories, renames, spill)
+                stats.add('scanned', plan.scanned)
+                operations = plan.ordered(self.__apply_order)
+                if journal is not None:
+                    journal.start(input_dir, output_dir, requested, operations)
+            self.__journal = journal
+            apply_start = time.perf_counter()
+            self.__apply(input_dir, operations, state)
+            complete = True
+        finally:
+            # failed files are not recorded in manifest, so they are synchronized again next time
+            errors = self.__pool.wait()
+            try:
+                if self.__journal is not None and not complete:
+                    # finished operations are kept, so interrupted run can be resumed
+                    self.__checkpoint()
+                self.__durability.flush()
+            except OSError as error:
+                log.error("Flush of written files failed, replica will be verified by the next run: %s", error)
+                complete = False
+            if apply_start is not None:
+                stats.add_time('apply', time.perf_counter() - apply_start)
+            stats.add('failed', len(errors))
+            self.__pool.shutdown()
+            self.__pool = None
+            if self.__manifest is not None:
+                self.__manifest.close(complete)
+                self.__manifest = None
+            if self.__journal is not None:
+                self.__journal.close(complete)
+                self.__journal = None
+            if self.__hash_cache is not None:
+                self.__hash_cache.close()
+                self.__hash_cache = None
+            self.__dedup = None
+            self.__link_dest = None
+            if spill is not None:
+                shutil.rmtree(spill.directory, ignore_errors=True)
+            self.__copier.log_report()
+            self.__delta.log_report()
+            self.__finish_stats(complete and not errors)
+
+        if errors:
+            raise SynchronizerException(f"Synchronization of {len(errors)} files failed, first error: "
+                                        f"'{errors[0][0]}' {errors[0][1]}")
+        return stats
+
+    def __finish_stats(self, success: bool):
+        stats, self.__stats = self.__stats, None
+        stats.finish(success)
+        stats.log_report()
+        self.last_stats = stats
+        for listener in self.__stats_listeners:
+            listener(stats)
+
+    def __check_directories(self, input_dir: str, output_dir: str) -> tuple[str, str]:
         input_dir = self.__fix_directory_postfix(input_dir)
         output_dir = self.__fix_directory_postfix(output_dir)
 
@@ -34,20 +275,205 @@ class Synchronizer:
 
         if not os.path.exists(output_dir) or not os.path.isdir(output_dir):
             raise SynchronizerException("Wrong output directory was provided")
+        return input_dir, output_dir
+
+    def __open_manifest(self, input_dir: str, output_dir: str, read_only: bool,
+                        resume: bool = False) -> Optional[RenameDetector]:
+        """
+        :return: rename detector when renames should be detected and manifest can be trusted
+        """
+        self.__manifest_trusted = False
+        if not self.__use_manifest:
+            return None
+        self.__manifest = Manifest.for_replica(output_dir)
+        self.__manifest_trusted = self.__manifest.open(output_dir, self.__verify, read_only, resume)
+        if self.__manifest_trusted and self.__detect_renames:
+            return RenameDetector(self.__manifest, input_dir, output_dir)
+        return None
+
+    def __open_spill(self, output_dir: str) -> Optional[Spill]:
+        """
+        :return: spill of the plan over memory budget, None when plan is kept in memory
+        """
+        if self.__memory_budget is None:
+            return None
+        spill = Spill.for_replica(output_dir, self.__memory_budget)
+        # spill of killed run is never read again
+        shutil.rmtree(spill.directory, ignore_errors=True)
+        os.mkdir(spill.directory)
+        return spill
+
+    def __diff(self, input_dir: str, output_dir: str, directories: dict[str, bool],
+               renames: Optional[RenameDetector], spill: Optional[Spill] = None) -> Plan:
+        existing = self.__existing_directories(input_dir, output_dir, directories)
+        self.__filter.start(input_dir)
+        if self.__scan_workers > 1 and renames is None:
+            tree_diff = ShardedDiff(self.__scan_workers, self.__manifest, self.__manifest_trusted, self.__checksum,
+                                    self.__filter, spill)
+        else:
+            tree_diff = TreeDiff(self.__walker, self.__manifest, self.__manifest_trusted, renames, self.__checksum,
+                                 self.__filter, spill)
+        plan = tree_diff.diff(input_dir, output_dir, existing)
+        if plan.runs:
+            log.info("Plan of %s operations doesn't fit into memory budget, %s operations were spilled to %s runs",
+                     len(plan), plan.spilled, len(plan.runs))
+        if log.isEnabledFor(logging.DEBUG):
+            # spilled plan is read from disk by summary
+            log.debug("Planned operations: %s", plan.summary()['operations'])
+        return plan
+
+    def __apply(self, input_dir: str, operations: Collection[Operation], state: Optional[JournalState]):
+        """
+        :param state: operations of resumed run which were finished already are skipped
+        """
+        if state is not None:
+            log.debug("Resumed run has %s of %s operations finished", len(state.done), len(operations))
+        for index, operation in enumerate(operations):
+            if state is not None and index in state.done:
+                continue
+            target = os.path.join(self.__output_dir, operation.path)
+            if state is not None and self.__is_applied(operation, target):
+                # finished operation which was not journaled before the run was interrupted, only manifest is updated
+                self.__record_applied(operation)
+            elif operation.kind == MKDIR:
+                log.info("Creating new directory '%s' in replica", target)
+                os.mkdir(target)
+                self.__stats.add('created_directories')
+                self.__record(operation)
+            elif operation.kind == RENAME:
+                self.__move_in_replica(input_dir, index, operation, target)
+                continue
+            elif operation.kind == DELETE:
+                with self.__stats.phase('cleanup'):
+                    self.__remove_from_replica(operation, target)
+                self.__stats.add('deleted')
+            elif operation.kind == RECORD:
+                self.__record(operation)
+            else:
+                offset = state.offsets.get(index, 0) if state is not None else 0
+                self.__pool.submit(target, self.__synchronize_file, index, operation,
+                                   os.path.join(input_dir, operation.path), target, offset)
+                continue
+            self.__finished(index)
+
+    def __is_applied(self, operation: Operation, target: str) -> bool:
+        match operation.kind:
+            case 'mkdir':
+                return os.path.isdir(target)
+            case 'delete':
+                return not os.path.lexists(target)
+            case 'rename':
+                return (not os.path.lexists(os.path.join(self.__output_dir, operation.previous))
+                        and os.path.lexists(target))
+            case _:
+                return False
+
+    def __record_applied(self, operation: Operation):
+        if operation.kind == MKDIR:
+            self.__record(operation)
+        elif self.__manifest is not None and operation.kind == DELETE:
+            self.__manifest.remove(operation.directory, operation.name)
+        elif self.__manifest is not None:
+            self.__manifest.move(*os.path.split(operation.previous), operation.directory, operation.name)
+
+    def __finished(self, index: int):
+        if self.__journal is not None and self.__journal.done(index):
+            self.__checkpoint()
+
+    def __checkpoint(self):
+        """
+        Operations are journaled only after their files and manifest entries can't be lost
+        """
+        with self.__checkpoint_lock:
+            self.__durability.flush()
+            if self.__manifest is not None:
+                self.__manifest.commit()
+            self.__journal.flush()
 
-        iterator = glob.iglob(input_dir + "**", recursive=True, include_hidden=True)
-        for file in iterator:
-            relative_path = self.__relative_path(file, input_dir)
-            if not relative_path:
+    @staticmethod
+    def __existing_directories(input_dir: str, output_dir: str, directories: dict[str, bool]) -> list[tuple[str, bool]]:
+        """
+        Directory which is missing in source is handled by its parent. Directory missing in replica is replaced by its
+        nearest existing parent which is then synchronized recursively. Directories already covered by recursive
+        synchronization of their parent are skipped.
+        :return: sorted relative paths of directories with their recursive flag
+        """
+        existing = {}
+        for relative, recursive in directories.items():
+            relative = relative.strip('\\/')
+            if relative and not os.path.isdir(os.path.join(input_dir, relative)):
                 continue
-            log.debug("Processing item: %s", relative_path)
-            target = os.path.join(output_dir, relative_path)
+            while relative and not os.path.isdir(os.path.join(output_dir, relative)):
+                relative = os.path.dirname(relative)
+                recursive = True
+            existing[relative] = existing.get(relative, False) or recursive
+
+        result = []
+        for relative in sorted(existing):
+            covered = any(existing.get(parent) for parent in Synchronizer.__parents(relative))
+            if not covered:
+                result.append((relative, existing[relative]))
+        return result
 
-            self.__create_directory_if_missing(file, target)
-            self.__create_file_if_missing(file, target)
-            self.__update_file_if_needed(file, target)
+    @staticmethod
+    def __parents(relative: str) -> Iterator[str]:
+        while relative:
+            relative = os.path.dirname(relative)
+            yield relative
+
+    def __move_in_replica(self, input_dir: str, index: int, operation: Operation, target: str):
+        previous = os.path.join(self.__output_dir, operation.previous)
+        log.info("Moving '%s' to '%s' in replica", previous, target)
+        try:
+            os.rename(previous, target)
+        except OSError as error:
+            if operation.is_dir:
+                # following operations expect content of the directory at the new place
+                raise SynchronizerException(f"Moving '{previous}' to '{target}' failed: {error}") from error
+            log.warning("Moving '%s' to '%s' failed, it will be copied instead: %s", previous, target, error)
+            copy = Operation(COPY, operation.directory, operation.name, entry=operation.entry)
+            self.__pool.submit(target, self.__synchronize_file, index, copy, os.path.join(input_dir, operation.path),
+                               target)
+            return
+        self.__stats.add('renamed')
+        self.__manifest.move(*os.path.split(operation.previous), operation.directory, operation.name)
+        self.__finished(index)
+
+    def __synchronize_file(self, index: int, operation: Operation, source: str, target: str, offset: int = 0):
+        """
+        :param offset: offset of partial copy recorded by interrupted run
+        """
+        start = time.perf_counter()
+        entry, replica_entry = operation.entry, operation.replica_entry
+        progress = None
+        if self.__journal is not None and entry.stat.st_size >= self.__journal.progress_interval:
+            progress = self.__journal.progress(index, target, offset)
+        if operation.kind == COPY:
+            target_stats = self.__create_file(source, target, entry.stat, progress)
+            self.__record_file(operation, target_stats.st_ino, True)
+        else:
+            changed, inode = self.__update_file_if_needed(source, target, entry.stat, replica_entry.stat, progress)
+            self.__record_file(operation, inode, changed)
+        self.__stats.file_done(target, time.perf_counter() - start)
+        self.__finished(index)
+
+    def __record(self, operation: Operation):
+        if self.__manifest is None:
+            return
+        if operation.is_dir:
+            self.__manifest.record_directory(operation.directory, operation.name, operation.entry.inode)
+        else:
+            self.__manifest.record_file(operation.directory, operation.name, operation.entry.stat,
+                                        operation.replica_entry.stat.st_ino)
 
-        self.__cleanup_replica(input_dir, output_dir)
+    def __record_file(self, operation: Operation, inode: int, changed: bool):
+        """
+        After synchronization replica file has the same metadata as source file, only inode differs
+        """
+        replica_entry = operation.replica_entry
+        if self.__manifest is not None and (changed or not self.__manifest_trusted or replica_entry is None
+                                            or replica_entry.inode != operation.entry.inode):
+            self.__manifest.record_file(operation.directory, operation.name, operation.entry.stat, inode)
 
     @staticmethod
     def __fix_directory_postfix(input_dir: str) -> str:
@@ -60,58 +486,152 @@ class Synchronizer:
             return input_dir + os.sep
         return input_dir
 
-    @staticmethod
-    def __relative_path(input_dir: str, base_dir: str):
-        return input_dir.replace(base_dir, '')
+    def __create_file(self, source: str, target: str, source_stats: FileStat,
+                      progress: Optional[CopyProgress] = None) -> stat_result:
+        log.info("Copying missing file '%s' to replica", target)
+        with self.__io_stream(source_stats.st_size), self.__stats.phase('copy'):
+            copied = self.__copy(source, target, source_stats, progress)
+        self.__stats.add('copied')
+        if copied:
+            self.__stats.add_bytes(source_stats.st_size)
+        # copy transfers mode and times but not owners
+        target_stats = os.stat(target)
+        self.__update_owners_if_needed(target, source_stats, target_stats)
+        return target_stats
 
-    @staticmethod
-    def __create_directory_if_missing(source: str, target: str):
-        if os.path.isdir(source) and not os.path.isdir(target):
-            log.info("Creating new directory '%s' in replica", target)
-            os.mkdir(target)
+    def __remove_from_replica(self, operation: Operation, target: str):
+        if self.__manifest is not None:
+            self.__manifest.remove(operation.directory, operation.name)
+        try:
+            if operation.is_dir:
+                log.info("Removing no longer existing directory '%s' from replica", target)
+                shutil.rmtree(target)
+            else:
+                log.info("Removing no longer existing file '%s' from replica", target)
+                os.remove(target)
+        except FileNotFoundError:
+            # stale manifest costs only the log line, entry was removed from manifest already
+            log.warning("'%s' was already removed from replica", target)
 
-    @staticmethod
-    def __create_file_if_missing(source: str, target: str):
-        if os.path.isfile(source) and not os.path.isfile(target):
-            log.info("Copying missing file '%s' to replica", target)
-            shutil.copy2(source, target)
-
-    def __cleanup_replica(self, input_dir: str, output_dir: str):
-        iterator = glob.iglob(output_dir + "**", recursive=True, include_hidden=True)
-        for file in iterator:
-            relative_path = self.__relative_path(file, output_dir)
-            target = os.path.join(input_dir, relative_path)
-            if not os.path.exists(target) and os.path.isdir(file):
-                log.info("Removing no longer existing directory '%s' from replica", file)
-                shutil.rmtree(file)
-            elif not os.path.exists(target) and os.path.isfile(file):
-                log.info("Removing no longer existing file '%s' from replica", file)
-                os.remove(file)
-
-    def __update_file_if_needed(self, source: str, target: str):
-        if os.path.isfile(source):
-            source_stats = os.stat(source)
-            target_stats = os.stat(target)
-
-            if source_stats.st_size != target_stats.st_size or source_stats.st_mtime != target_stats.st_mtime:
-                log.info("Updating file with changed metadata '%s': original -> %s, replica -> %s",
-                         target, self.__get_stats_info(source_stats), self.__get_stats_info(target_stats))
-                shutil.copy2(source, target)
-
-            if source_stats.st_mode != target_stats.st_mode:
-                log.info("Updating file mode '%s': original -> %s, replica -> %s", target, source_stats.st_mode,
-                         target_stats.st_mode)
+    def __update_file_if_needed(self, source: str, target: str, source_stats: FileStat,
+                                target_stats: stat_result | FileStat,
+                                progress: Optional[CopyProgress] = None) -> tuple[bool, int]:
+        """
+        :return: True when anything in replica was changed and inode of replica file
+        """
+        changed = False
+        if source_stats.st_size != target_stats.st_size or source_stats.st_mtime_ns != target_stats.st_mtime_ns:
+            log.info("Updating file with changed metadata '%s': original -> %s, replica -> %s",
+                     target, self.__get_stats_info(source_stats), self.__get_stats_info(target_stats))
+            target_stats = self.__copy_changed_file(source, target, source_stats, target_stats, progress)
+            changed = True
+        elif self.__checksum and (self.__hash_cache.digest(source, source_stats)
+                                  != self.__hash_cache.digest(target, self.__with_ctime(target, target_stats))):
+            log.info("Updating file with changed content '%s'", target)
+            target_stats = self.__copy_changed_file(source, target, source_stats, target_stats, progress)
+            changed = True
+        elif self.__has_other_links(target, source_stats, target_stats):
+            log.info("Replacing hardlinked file with changed metadata '%s'", target)
+            target_stats = self.__copy_changed_file(source, target, source_stats, target_stats, progress)
+            changed = True
+
+        if source_stats.st_mode != target_stats.st_mode:
+            log.info("Updating file mode '%s': original -> %s, replica -> %s", target, source_stats.st_mode,
+                     target_stats.st_mode)
+            with self.__stats.phase('metadata'):
                 os.chmod(target, source_stats.st_mode)
+            self.__stats.add('chmod')
+            changed = True
+
+        changed = self.__update_owners_if_needed(target, source_stats, target_stats) or changed
+        return changed, target_stats.st_ino
+
+    @staticmethod
+    def __with_ctime(target: str, target_stats: stat_result | FileStat) -> stat_result | FileStat:
+        """
+        :return: given stats or current stats of replica file when change time is not known from manifest
+        """
+        return target_stats if target_stats.st_ctime_ns else os.stat(target)
+
+    def __copy_changed_file(self, source: str, target: str, source_stats: FileStat,
+                            target_stats: stat_result | FileStat,
+                            progress: Optional[CopyProgress] = None) -> stat_result:
+        """
+        :return: stats of replica file which are compared with source metadata after the update
+        """
+        with self.__io_stream(source_stats.st_size), self.__stats.phase('copy'):
+            if (self.__delta_threshold is not None and target_stats.st_size > 0
+                    and source_stats.st_size >= self.__delta_threshold and not self.__is_linked(target)):
+                written = self.__delta.update(source, target)
+                if self.__hash_cache is not None:
+                    self.__hash_cache.invalidate(target_stats)
+            else:
+                written = None if self.__copy(source, target, source_stats, progress) else 0
+        self.__stats.add('updated')
+        self.__stats.add_bytes(written if written is not None else source_stats.st_size)
+        # delta updates replica file in place, copy replaces it by new file with its own inode and owners
+        return target_stats if written is not None else os.stat(target)
+
+    def __copy(self, source: str, target: str, source_stats: FileStat, progress: Optional[CopyProgress]) -> bool:
+        """
+        :return: True when content was copied, False when target was linked to identical replica file
+        """
+        if ((self.__link_dest is not None and self.__link_previous(target, source_stats))
+                or (self.__dedup is not None and self.__dedup.link(source, target, source_stats))):
+            self.__stats.add('linked')
+            return False
+        self.__copier.copy(source, target, progress)
+        return True
+
+    def __link_previous(self, target: str, source_stats: FileStat) -> bool:
+        """
+        :return: True when target was hardlinked to unchanged file of the previous snapshot
+        """
+        previous = os.path.join(self.__link_dest, os.path.relpath(target, self.__output_dir))
+        try:
+            previous_stats = os.lstat(previous)
+            if (not stat.S_ISREG(previous_stats.st_mode) or previous_stats.st_size != source_stats.st_size
+                    or not same_metadata(source_stats, previous_stats)):
+                return False
+            hardlink(previous, target)
+        except OSError as error:
+            log.debug("File '%s' can't be linked from previous snapshot: %s", target, error)
+            return False
+        self.__durability.written(target)
+        return True
+
+    def __is_linked(self, target: str) -> bool:
+        """
+        :return: True when replica file shares its inode with another replica file
+        """
+        # links can be left by earlier runs with dedup or link_dest, so they are checked on every run
+        return os.stat(target).st_nlink > 1
+
+    def __has_other_links(self, target: str, source_stats: FileStat, target_stats: stat_result | FileStat) -> bool:
+        """
+        :return: True when metadata of hardlinked replica file have to be changed
+        """
+        return ((source_stats.st_mode != target_stats.st_mode or source_stats.st_uid != target_stats.st_uid
+                 or source_stats.st_gid != target_stats.st_gid) and self.__is_linked(target))
+
+    def __io_stream(self, size: int) -> contextlib.AbstractContextManager:
+        return self.__io_limiter.stream(size) if self.__io_limiter is not None else contextlib.nullcontext()
 
-            if source_stats.st_uid != target_stats.st_uid or source_stats.st_gid != target_stats.st_gid:
-                log.info("Updating file owners of '%s': original -> %s, replica -> %s", target,
-                         self.__get_owners(source_stats), self.__get_owners(target_stats))
+    def __update_owners_if_needed(self, target: str, source_stats: FileStat,
+                                  target_stats: stat_result | FileStat) -> bool:
+        if source_stats.st_uid != target_stats.st_uid or source_stats.st_gid != target_stats.st_gid:
+            log.info("Updating file owners of '%s': original -> %s, replica -> %s", target,
+                     self.__get_owners(source_stats), self.__get_owners(target_stats))
+            with self.__stats.phase('metadata'):
                 os.chown(target, source_stats.st_uid, source_stats.st_gid)
+            self.__stats.add('chown')
+            return True
+        return False
 
     @staticmethod
-    def __get_stats_info(stats: stat_result) -> dict:
-        return {'size': stats.st_size, 'modified': stats.st_mtime}
+    def __get_stats_info(stats: stat_result | FileStat) -> dict:
+        return {'size': stats.st_size, 'modified': stats.st_mtime_ns}
 
     @staticmethod
-    def __get_owners(stats: stat_result) -> dict:
+    def __get_owners(stats: stat_result | FileStat) -> dict:
         return {'owner': stats.st_uid, 'group': stats.st_gid}
@@ -0,0 +1,129 @@
+"""
+Durability of files written to replica.
+
+Files are always written to temporary file and renamed over the replica file, so killed run never leaves truncated
+file in replica. Durability mode decides when written data are flushed to disk:
+
+- none: left to the operating system
+- batched: file system of the replica is flushed by one syncfs call on the replica root after every batch of files or
+  seconds and at the end of the run, so the manifest is never committed before the files it describes. Written files
+  and their directories are flushed one by one where syncfs is not available.
+- strict: every file is flushed before it is renamed and its directory is flushed after the rename
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+log = logging.getLogger('synchronizer.durability.Durability')
+
+NONE = 'none'
+BATCHED = 'batched'
+STRICT = 'strict'
+MODES = (NONE, BATCHED, STRICT)
+
+DEFAULT_BATCH_FILES = 1000
+DEFAULT_BATCH_SECONDS = 5.0
+TEMPORARY_PREFIX = '.dir_sync-'
+
+
+def _load_syncfs() -> Optional[Callable[[int], int]]:
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True).syncfs
+    except (OSError, AttributeError):
+        return None
+
+
+_syncfs = _load_syncfs()
+
+
+class Durability:
+    """
+    Flush files written by copy workers according to the mode. Instance can be shared between copy workers.
+    """
+    def __init__(self, mode: str = NONE, batch_files: int = DEFAULT_BATCH_FILES,
+                 batch_seconds: float = DEFAULT_BATCH_SECONDS, clock: Callable[[], float] = time.monotonic):
+        if mode not in MODES:
+            raise ValueError(f"Unknown durability mode '{mode}', expected one of {MODES}")
+        self.mode = mode
+        self.batch_files = batch_files
+        self.batch_seconds = batch_seconds
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__pending: list[str] = []
+        self.__flushed = clock()
+        self.flushes = 0
+        # directory which exists during the whole run, written files can be replaced or removed before the flush
+        self.root: Optional[str] = None
+
+    def sync_file(self, fd: int):
+        """
+        Called with descriptor of written file before it is closed and renamed
+        """
+        if self.mode == STRICT:
+            os.fsync(fd)
+
+    def written(self, path: str):
+        """
+        Called when written file is in its final place
+        """
+        if self.mode == STRICT:
+            self.__sync_directory(os.path.dirname(path))
+        elif self.mode == BATCHED:
+            with self.__lock:
+                self.__pending.append(path)
+                due = (len(self.__pending) >= self.batch_files
+                       or self.__clock() - self.__flushed >= self.batch_seconds)
+            if due:
+                self.flush()
+
+    def flush(self):
+        """
+        Flush files written since the last flush
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, []
+            self.__flushed = self.__clock()
+        if not pending:
+            return
+        log.debug("Flushing %s written files", len(pending))
+        if _syncfs is not None:
+            self.__syncfs(self.root or os.path.dirname(pending[0]) or os.curdir)
+        else:
+            for path in pending:
+                try:
+                    self.__sync_path(path)
+                except FileNotFoundError:
+                    # file was replaced or removed later in the batch, its replacement is flushed on its own
+                    log.debug("Written file '%s' no longer exists", path)
+            for directory in {os.path.dirname(path) for path in pending}:
+                self.__sync_directory(directory)
+        with self.__lock:
+            self.flushes += 1
+
+    @staticmethod
+    def __syncfs(path: str):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if _syncfs(fd) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), path)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def __sync_path(path: str):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def __sync_directory(directory: str):
+        if os.name == 'posix':
+            # directories can't be opened for fsync on Windows
+            Durability.__sync_path(directory or os.curdir)
@@ -0,0 +1,197 @@
+"""
+Gitignore-style include and exclude rules of synchronized paths.
+
+Rules are given for the whole tree (run option) and they are also read from ignore files (.syncignore) in source
+directories, rules of ignore file apply to its directory and all subdirectories. Syntax is the same as in .gitignore:
+
+- blank lines and lines starting with # are skipped
+- pattern without slash matches name at any depth, pattern with slash is relative to the directory of its file
+- trailing slash matches only directories
+- * and ? don't match slash, ** matches any number of directories, [...] matches one character of the class
+- ! includes paths excluded by previous rules, the last matching rule wins
+
+All rules which apply to one directory are compiled into one regular expression, so every entry is matched once.
+Excluded directory is not descended into, so paths under it can't be included again.
+"""
+import logging
+import os
+import re
+from typing import Callable, Collection, Iterable, NamedTuple, Optional
+
+log = logging.getLogger('synchronizer.filters.Filter')
+
+IGNORE_FILE = '.syncignore'
+
+
+class Rule(NamedTuple):
+    """
+    Pattern compiled to regular expression matching whole path relative to the synchronized tree
+    """
+    regex: str
+    negated: bool
+    dir_only: bool
+
+
+def parse_rules(lines: Iterable[str], base: str = '') -> list[Rule]:
+    """
+    :param lines: patterns in gitignore syntax
+    :param base: relative path of directory where the rules are defined
+    """
+    prefix = re.escape(base.replace(os.sep, '/') + '/') if base else ''
+    rules = []
+    for line in lines:
+        pattern = line.rstrip('\n').rstrip(' ')
+        if not pattern or pattern.startswith('#'):
+            continue
+        negated = pattern.startswith('!')
+        if negated:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        if not pattern:
+            continue
+        anchored = '/' in pattern
+        regex = _glob_to_regex(pattern.lstrip('/'))
+        rules.append(Rule(prefix + (regex if anchored else '(?:.*/)?' + regex), negated, dir_only))
+    return rules
+
+
+def _glob_to_regex(pattern: str) -> str:
+    result = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        segment_start = index == 0 or pattern[index - 1] == '/'
+        if segment_start and pattern.startswith('**/', index):
+            result.append('(?:.*/)?')
+            index += 3
+            continue
+        if segment_start and pattern[index:] == '**':
+            result.append('.*')
+            break
+        if char == '*':
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+        elif char == '[' and ']' in pattern[index + 2:]:
+            end = pattern.index(']', index + 2)
+            content = pattern[index + 1:end]
+            if content.startswith('!'):
+                content = '^' + content[1:]
+            result.append('[' + content.replace('\\', '\\\\') + ']')
+            index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            result.append(re.escape(pattern[index]))
+        else:
+            result.append(re.escape(char))
+        index += 1
+    return ''.join(result)
+
+
+class _Matcher:
+    """
+    Rules of one directory compiled separately for files and directories
+    """
+    def __init__(self, rules: list[Rule]):
+        self.rules = rules
+        self.__files = self.__compile([rule for rule in rules if not rule.dir_only])
+        self.__directories = self.__compile(rules)
+
+    def extended(self, rules: list[Rule]) -> '_Matcher':
+        return _Matcher(self.rules + rules)
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        regex, negated = self.__directories if is_dir else self.__files
+        if regex is None:
+            return False
+        match = regex.fullmatch(path)
+        return match is not None and not negated[int(match.lastgroup[1:])]
+
+    @staticmethod
+    def __compile(rules: list[Rule]) -> tuple[Optional[re.Pattern], list[bool]]:
+        if not rules:
+            return None, []
+        # the first matching alternative is the last matching rule
+        rules = rules[::-1]
+        regex = '|'.join(f'(?P<r{index}>{rule.regex})' for index, rule in enumerate(rules))
+        return re.compile(regex, re.DOTALL), [rule.negated for rule in rules]
+
+
+class Filter:
+    """
+    Rules given for the whole tree together with rules from ignore files of source directories. Rules of directories
+    are loaded when the directory is scanned and kept until the tree is started again.
+    """
+    def __init__(self, patterns: Collection[str] = (), ignore_file: Optional[str] = IGNORE_FILE):
+        self.patterns = tuple(patterns)
+        self.ignore_file = ignore_file
+        self.__root = _Matcher(parse_rules(self.patterns))
+        self.__input_dir = ''
+        self.__matchers: dict[str, _Matcher] = {}
+
+    def start(self, input_dir: str):
+        """
+        Start filtering of tree with given source directory
+        """
+        self.__input_dir = input_dir
+        self.__matchers = {}
+
+    def selector(self, relative: str) -> Callable[[Collection[str]], Callable[[str, bool], bool]]:
+        """
+        :param relative: source directory which is scanned
+        :return: selector of Walker.scan, ignore file is read only when it is listed in the directory
+        """
+        def select(names: Collection[str]) -> Callable[[str, bool], bool]:
+            return self.acceptor(relative, names)
+        return select
+
+    def acceptor(self, relative: str, names: Optional[Collection[str]] = None) -> Callable[[str, bool], bool]:
+        """
+        :param relative: directory whose entries are accepted
+        :param names: names of source directory entries, ignore file is looked for when None
+        :return: function of entry name and directory flag which is False for excluded entries
+        """
+        matcher = self.__matcher(relative, names)
+        if not matcher.rules:
+            return lambda name, is_dir: True
+
+        def accept(name: str, is_dir: bool) -> bool:
+            return not matcher.excluded(self.__path(relative, name), is_dir)
+        return accept
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        """
+        :param path: relative path of entry
+        :return: True when the entry or any of its parent directories is excluded
+        """
+        parent = os.path.dirname(path)
+        if parent and self.excluded(parent, True):
+            return True
+        return not self.acceptor(parent)(os.path.basename(path), is_dir)
+
+    def __matcher(self, relative: str, names: Optional[Collection[str]] = None) -> _Matcher:
+        matcher = self.__matchers.get(relative)
+        if matcher is None:
+            matcher = self.__matcher(os.path.dirname(relative)) if relative else self.__root
+            if self.ignore_file is not None and (names is None or self.ignore_file in names):
+                rules = self.__read(relative)
+                if rules:
+                    matcher = matcher.extended(rules)
+            self.__matchers[relative] = matcher
+        return matcher
+
+    def __read(self, relative: str) -> list[Rule]:
+        path = os.path.join(self.__input_dir, relative, self.ignore_file)
+        try:
+            with open(path, 'rt', encoding='utf-8') as file:
+                rules = parse_rules(file, relative)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        log.debug("Loaded %s rules from '%s'", len(rules), path)
+        return rules
+
+    @staticmethod
+    def __path(relative: str, name: str) -> str:
+        path = os.path.join(relative, name) if relative else name
+        return path.replace(os.sep, '/') if os.sep != '/' else path
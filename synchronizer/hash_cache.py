@@ -0,0 +1,130 @@
+"""
+Content hashes of files cached in SQLite database, so only new or modified files are read and hashed.
+
+Hash is identified by (device, inode, size, mtime_ns) of the file. Change time is stored together with the hash and
+has to match as well, because tools which restore modification time after changing content can't restore change time.
+Hash is not taken from the cache when change time is not known. Hashes which were not used for max_unused seconds
+are removed when the cache is opened, so hashes of removed and replaced files don't pile up.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from os import stat_result
+from typing import Callable, Optional
+
+from synchronizer.walker import FileStat
+
+log = logging.getLogger('synchronizer.hash_cache.HashCache')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (device, inode)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used);
+"""
+_VERSION = 2
+
+DIGEST = 'blake2b'
+
+DEFAULT_MAX_UNUSED = 30 * 86400
+# time of use is written at most once per this number of seconds, so cached hashes are read without writes
+_USE_PRECISION = 86400
+
+
+class HashCache:
+    """
+    Persistent cache of file content hashes. Files are hashed in streaming way with fixed size buffer.
+    Instance can be shared between copy workers.
+    """
+    FILE_SUFFIX = '.hashes.sqlite'
+
+    def __init__(self, path: str, max_unused: int = DEFAULT_MAX_UNUSED, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_unused = max_unused
+        self.__clock = clock
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__lock = threading.Lock()
+        self.hashed = 0
+        self.cached = 0
+
+    @classmethod
+    def for_replica(cls, output_dir: str) -> 'HashCache':
+        """
+        :param output_dir: replica directory
+        :return: cache stored as sibling file of given replica directory
+        """
+        return cls(output_dir.rstrip('\\/') + cls.FILE_SUFFIX)
+
+    def open(self):
+        self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+        if self.__connection.execute("PRAGMA user_version").fetchone()[0] != _VERSION:
+            # cache of older version is dropped, hashes are computed again
+            self.__connection.executescript(f"DROP TABLE IF EXISTS hashes; PRAGMA user_version = {_VERSION};")
+        self.__connection.executescript(_SCHEMA)
+        pruned = self.__connection.execute("DELETE FROM hashes WHERE used < ?",
+                                           (int(self.__clock()) - self.max_unused,)).rowcount
+        self.__connection.commit()
+        log.debug("Removed %s hashes which were not used for %s seconds", pruned, self.max_unused)
+        self.hashed = 0
+        self.cached = 0
+
+    def close(self):
+        if self.__connection is None:
+            return
+        self.__connection.commit()
+        self.__connection.close()
+        self.__connection = None
+        log.debug("Hashed %s files, %s hashes taken from cache", self.hashed, self.cached)
+
+    def digest(self, path: str, stats: stat_result | FileStat) -> bytes:
+        """
+        :param path: path to the file
+        :param stats: current stats of the file
+        :return: content hash of the file
+        """
+        key = (stats.st_dev, stats.st_ino)
+        now = int(self.__clock())
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT size, mtime_ns, ctime_ns, digest, used FROM hashes WHERE device = ? AND inode = ?",
+                key).fetchone()
+        if row is not None and self.__is_valid(row, stats):
+            with self.__lock:
+                self.cached += 1
+                if now - row[4] >= _USE_PRECISION:
+                    self.__connection.execute("UPDATE hashes SET used = ? WHERE device = ? AND inode = ?", (now, *key))
+            return row[3]
+
+        with open(path, 'rb') as file:
+            digest = hashlib.file_digest(file, DIGEST).digest()
+        with self.__lock:
+            self.hashed += 1
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO hashes (device, inode, size, mtime_ns, ctime_ns, digest, used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, stats.st_size, stats.st_mtime_ns, stats.st_ctime_ns, digest, now))
+        return digest
+
+    def invalidate(self, stats: stat_result | FileStat):
+        """
+        Forget hash of file whose content was changed in place, because its size and modification time can stay the same
+        :param stats: stats of the file before the change
+        """
+        with self.__lock:
+            self.__connection.execute("DELETE FROM hashes WHERE device = ? AND inode = ?", (stats.st_dev, stats.st_ino))
+
+    @staticmethod
+    def __is_valid(row: tuple, stats: stat_result | FileStat) -> bool:
+        size, mtime_ns, ctime_ns = row[:3]
+        # change time is not known when stats come from replica manifest, content could be changed in place then
+        return (size == stats.st_size and mtime_ns == stats.st_mtime_ns and stats.st_ctime_ns != 0
+                and ctime_ns == stats.st_ctime_ns)
@@ -0,0 +1,58 @@
+"""
+Limits of copy I/O shared by synchronizers which run in parallel in one process (e.g. more jobs on the same disks).
+"""
+import contextlib
+import logging
+import threading
+from typing import Iterator, Optional
+
+log = logging.getLogger('synchronizer.io_limits.IOLimiter')
+
+
+class IOLimiter:
+    """
+    Limit number of concurrent copy streams and number of bytes which are being copied at the same time.
+    File larger than the bytes limit is copied only when no other file is being copied, so it can't wait forever.
+    Limit which is None is not applied.
+    """
+    def __init__(self, max_streams: Optional[int] = None, max_bytes: Optional[int] = None):
+        if max_streams is not None and max_streams < 1:
+            raise ValueError(f"Number of copy streams has to be at least 1: {max_streams}")
+        self.max_streams = max_streams
+        self.max_bytes = max_bytes
+        self.__condition = threading.Condition()
+        self.__streams = 0
+        self.__bytes = 0
+
+    @contextlib.contextmanager
+    def stream(self, size: int) -> Iterator[None]:
+        """
+        Wait until copy of given number of bytes fits into limits and keep it reserved until the copy is done
+        """
+        with self.__condition:
+            if not self.__fits(size):
+                log.debug("Waiting for I/O limits: %s streams and %s bytes in flight", self.__streams, self.__bytes)
+                self.__condition.wait_for(lambda: self.__fits(size))
+            self.__streams += 1
+            self.__bytes += size
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__streams -= 1
+                self.__bytes -= size
+                self.__condition.notify_all()
+
+    def in_flight(self) -> tuple[int, int]:
+        """
+        :return: number of copy streams and bytes which are being copied right now
+        """
+        with self.__condition:
+            return self.__streams, self.__bytes
+
+    def __fits(self, size: int) -> bool:
+        if self.max_streams is not None and self.__streams >= self.max_streams:
+            return False
+        if self.max_bytes is not None and self.__bytes and self.__bytes + size > self.max_bytes:
+            return False
+        return True
@@ -0,0 +1,216 @@
+"""
+Append-only journal of a run stored next to the replica, so run which was killed or interrupted can be resumed.
+
+Journal starts with the plan of the run in the order in which it is applied. Indexes of finished operations are then
+appended in batches, together with progress of large file copies. Restarted run with the same source continues with
+operations which were not finished and large files continue from the last recorded offset. Journal is removed when
+all operations of the plan were done.
+
+Lines are JSON records, line which was not written completely when the run was killed is ignored.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Collection, Iterator, Optional
+
+from synchronizer.durability import TEMPORARY_PREFIX
+from synchronizer.plan import Operation
+from synchronizer.walker import Entry, FileStat
+
+log = logging.getLogger('synchronizer.journal.Journal')
+
+_VERSION = 2
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_SECONDS = 5.0
+# files from this size record progress of their copy, offset is recorded after every interval of copied bytes
+DEFAULT_PROGRESS_INTERVAL = 64 * 1024 * 1024
+
+
+class JournalState:
+    """
+    Unfinished run loaded from journal
+    """
+    def __init__(self, operations: list[Operation], done: set[int], offsets: dict[int, int]):
+        self.operations = operations
+        self.done = done
+        self.offsets = offsets
+
+
+class CopyProgress:
+    """
+    Progress of copy of one large file to partial file which is kept when the run is killed
+    """
+    def __init__(self, journal: 'Journal', index: int, partial: str, offset: int):
+        self.index = index
+        self.partial = partial
+        self.offset = offset
+        self.interval = journal.progress_interval
+        self.__journal = journal
+
+    def advanced(self, fd: int, offset: int):
+        """
+        Called when content of partial file up to given offset was written
+        """
+        if offset - self.offset >= self.interval:
+            # offset is recorded only when data before it can't be lost
+            os.fsync(fd)
+            self.offset = offset
+            self.__journal.record_offset(self.index, offset)
+
+
+class Journal:
+    """
+    Journal of one replica directory. Finished operations are written when batch_size operations were finished or
+    batch_seconds elapsed, see done and flush. Instance can be shared between copy workers.
+    """
+    FILE_SUFFIX = '.journal'
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE, batch_seconds: float = DEFAULT_BATCH_SECONDS,
+                 progress_interval: int = DEFAULT_PROGRESS_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.progress_interval = progress_interval
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__pending: list[int] = []
+        self.__flushed = clock()
+
+    @classmethod
+    def for_replica(cls, output_dir: str) -> 'Journal':
+        return cls(output_dir.rstrip('\\/') + cls.FILE_SUFFIX)
+
+    def load(self, input_dir: str, output_dir: str, directories: dict[str, bool]) -> Optional[JournalState]:
+        """
+        :return: unfinished run of the same source, replica and directories or None when there is nothing to resume
+        """
+        if not os.path.exists(self.path):
+            return None
+        header = {'version': _VERSION, 'input': os.path.abspath(input_dir), 'output': os.path.abspath(output_dir),
+                  'directories': directories}
+        operations, done, offsets = [], set(), {}
+        # operations of the same directory share its path
+        paths: dict[str, str] = {}
+        planned = None
+        for record in self.__records():
+            if 'version' in record:
+                if record != header:
+                    log.info("Journal '%s' belongs to another run, it is not resumed", self.path)
+                    return None
+            elif 'operation' in record:
+                operation = self.__to_operation(record['operation'])
+                operation.directory = paths.setdefault(operation.directory, operation.directory)
+                operations.append(operation)
+            elif 'planned' in record:
+                planned = record['planned']
+            elif 'done' in record:
+                done.update(record['done'])
+            elif 'offset' in record:
+                offsets[record['index']] = record['offset']
+        if planned is None or planned != len(operations):
+            log.info("Plan in journal '%s' is not complete, it is not resumed", self.path)
+            return None
+        return JournalState(operations, done, offsets)
+
+    def start(self, input_dir: str, output_dir: str, directories: dict[str, bool],
+              operations: Collection[Operation]):
+        """
+        Start new journal with the plan of the run
+        """
+        self.__file = open(self.path, 'w', encoding='utf-8')
+        self.__write({'version': _VERSION, 'input': os.path.abspath(input_dir), 'output': os.path.abspath(output_dir),
+                      'directories': directories})
+        for operation in operations:
+            self.__write({'operation': self.__from_operation(operation)})
+        self.__write({'planned': len(operations)})
+        self.__sync()
+
+    def resume(self):
+        """
+        Continue journal which was loaded
+        """
+        self.__file = open(self.path, 'a', encoding='utf-8')
+        # the last line may be incomplete
+        self.__file.write('\n')
+
+    def done(self, index: int) -> bool:
+        """
+        :return: True when batch of finished operations should be flushed
+        """
+        with self.__lock:
+            self.__pending.append(index)
+            return len(self.__pending) >= self.batch_size or self.__clock() - self.__flushed >= self.batch_seconds
+
+    def flush(self):
+        with self.__lock:
+            pending, self.__pending = self.__pending, []
+            self.__flushed = self.__clock()
+            if pending:
+                self.__write({'done': pending})
+                self.__sync()
+
+    def record_offset(self, index: int, offset: int):
+        with self.__lock:
+            self.__write({'index': index, 'offset': offset})
+            self.__sync()
+
+    def progress(self, index: int, target: str, offset: int = 0) -> CopyProgress:
+        """
+        :param target: replica file which is copied by the operation with given index
+        :param offset: offset recorded by previous run
+        """
+        partial = os.path.join(os.path.dirname(target), f"{TEMPORARY_PREFIX}{index}.partial")
+        return CopyProgress(self, index, partial, offset)
+
+    def close(self, complete: bool):
+        """
+        :param complete: all operations were done, so the journal is removed
+        """
+        if self.__file is None:
+            return
+        if not complete:
+            self.flush()
+        self.__file.close()
+        self.__file = None
+        if complete:
+            os.remove(self.path)
+
+    def __records(self) -> Iterator[dict]:
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    log.debug("Incomplete record in journal '%s' is ignored", self.path)
+
+    def __write(self, record: dict):
+        self.__file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def __sync(self):
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    @staticmethod
+    def __from_operation(operation: Operation) -> dict:
+        result = operation.to_dict()
+        for key, entry in (('entry', operation.entry), ('replica_entry', operation.replica_entry)):
+            if entry is not None:
+                result[key] = {'name': entry.name, 'is_dir': entry.is_dir, 'inode': entry.inode,
+                               'stat': list(entry.stat) if entry.stat is not None else None}
+        return result
+
+    @staticmethod
+    def __to_operation(data: dict) -> Operation:
+        operation = Operation.from_dict(data)
+        for key in ('entry', 'replica_entry'):
+            if key in data:
+                entry = data[key]
+                setattr(operation, key, Entry(entry['name'], entry['is_dir'],
+                                              FileStat(*entry['stat']) if entry['stat'] is not None else None,
+                                              entry['inode']))
+        return operation
@@ -0,0 +1,240 @@
+"""
+Persistent manifest of replica state stored in SQLite database next to the replica directory.
+
+Manifest keeps metadata of every replica entry (size, modification time, mode, owners and inode) from the last run,
+so following run can compare source tree with manifest instead of listing and stat-ing whole replica again.
+Manifest is trusted only when previous run finished completely for the same replica directory.
+Inode of source entry is recorded too, so entries moved or renamed in source can be found in replica.
+Entries can be recorded from copy worker threads, access to the database is serialized.
+"""
+import logging
+import os
+from os import stat_result
+import pathlib
+import sqlite3
+import threading
+from typing import Optional
+
+from synchronizer.walker import Entry, FileStat
+
+log = logging.getLogger('synchronizer.manifest.Manifest')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    mode INTEGER,
+    uid INTEGER,
+    gid INTEGER,
+    inode INTEGER,
+    source_inode INTEGER NOT NULL,
+    PRIMARY KEY (parent, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_source_inode ON entries (source_inode);
+CREATE INDEX IF NOT EXISTS entries_fingerprint ON entries (size, mtime_ns);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_VERSION = '2'
+_COLUMNS = "parent, name, is_dir, size, mtime_ns, mode, uid, gid, inode, source_inode"
+
+
+class Manifest:
+    """
+    Replica manifest bound to one replica directory.
+    Directories are identified by path relative to the replica root, root itself is empty string.
+    """
+    FILE_SUFFIX = '.manifest.sqlite'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__lock = threading.Lock()
+        self.__device = 0
+
+    @classmethod
+    def for_replica(cls, output_dir: str) -> 'Manifest':
+        """
+        :param output_dir: replica directory
+        :return: manifest stored as sibling file of given replica directory
+        """
+        return cls(output_dir.rstrip('\\/') + cls.FILE_SUFFIX)
+
+    def open(self, output_dir: str, verify: bool = False, read_only: bool = False, resume: bool = False) -> bool:
+        """
+        Open manifest for new run. Content is dropped when it can't be trusted.
+        :param output_dir: replica directory which the manifest describes
+        :param verify: drop content even when it looks valid e.g. when replica was modified out-of-band
+        :param read_only: manifest is only read e.g. to plan synchronization without doing it, nothing is changed
+        :param resume: interrupted run is resumed, content committed by it is kept and completed by the rest of its plan
+        :return: True when manifest content can be used instead of listing the replica
+        """
+        if read_only:
+            return self.__open_read_only(output_dir, verify)
+
+        self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.__connection.executescript("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if self.__get_meta('version') != _VERSION:
+            self.__connection.executescript("DROP TABLE IF EXISTS entries; DELETE FROM meta;")
+        self.__connection.executescript(_SCHEMA)
+        self.__set_meta('version', _VERSION)
+
+        replica = os.path.abspath(output_dir)
+        self.__device = os.stat(replica).st_dev
+        trusted = not verify and self.__get_meta('replica') == replica and self.__get_meta('complete') == '1'
+        if not trusted and not resume:
+            log.info("Rebuilding replica manifest '%s'", self.path)
+            self.__connection.execute("DELETE FROM entries")
+
+        # run is marked as incomplete until close, so interrupted run will cause rebuild next time
+        self.__set_meta('replica', replica)
+        self.__set_meta('complete', '0')
+        self.__connection.commit()
+        return trusted
+
+    def __open_read_only(self, output_dir: str, verify: bool) -> bool:
+        replica = os.path.abspath(output_dir)
+        if verify or not os.path.exists(self.path):
+            return False
+        self.open_reader(output_dir)
+        try:
+            return (self.__get_meta('version') == _VERSION and self.__get_meta('replica') == replica
+                    and self.__get_meta('complete') == '1')
+        except sqlite3.Error as error:
+            log.debug("Replica manifest '%s' can't be read: %s", self.path, error)
+            return False
+
+    def open_reader(self, output_dir: str):
+        """
+        Open committed content of manifest for reading from another process while the run which opened it for writing
+        is in progress
+        """
+        self.__device = os.stat(os.path.abspath(output_dir)).st_dev
+        uri = pathlib.Path(os.path.abspath(self.path)).as_uri() + '?mode=ro'
+        self.__connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def commit(self):
+        """
+        Commit entries recorded so far, run stays incomplete until close
+        """
+        with self.__lock:
+            self.__connection.commit()
+
+    def close(self, complete: bool = True):
+        if self.__connection is None:
+            return
+        if complete:
+            self.__set_meta('complete', '1')
+            self.__connection.commit()
+        else:
+            self.__connection.rollback()
+        self.__connection.close()
+        self.__connection = None
+
+    def listing(self, directory: str) -> dict[str, Entry]:
+        """
+        :param directory: relative path of replica directory
+        :return: recorded entries of given directory mapped by their name, ordered by name
+        """
+        with self.__lock:
+            rows = self.__connection.execute(
+                f"SELECT {_COLUMNS} FROM entries WHERE parent = ? ORDER BY name", (directory,)).fetchall()
+        return {row[1]: self.__to_entry(*row[1:]) for row in rows}
+
+    def find_by_source_inode(self, source_inode: int) -> list[tuple[str, Entry]]:
+        """
+        :return: relative directories and recorded entries which had given source inode in previous run
+        """
+        return self.__find("source_inode = ?", (source_inode,))
+
+    def find_by_fingerprint(self, size: int, mtime_ns: int) -> list[tuple[str, Entry]]:
+        """
+        :return: relative directories and recorded files with given size and modification time
+        """
+        return self.__find("size = ? AND mtime_ns = ? AND is_dir = 0", (size, mtime_ns))
+
+    def find_by_size(self, size: int) -> list[tuple[str, Entry]]:
+        """
+        :return: relative directories and recorded files with given size
+        """
+        return self.__find("size = ? AND is_dir = 0", (size,))
+
+    def record_directory(self, directory: str, name: str, source_inode: int):
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO entries (parent, name, is_dir, source_inode) VALUES (?, ?, 1, ?)",
+                (directory, name, source_inode))
+
+    def record_file(self, directory: str, name: str, stats: stat_result | FileStat, inode: int):
+        """
+        :param directory: relative path of replica directory
+        :param name: file name
+        :param stats: stats of source file which replica file has after synchronization too
+        :param inode: inode of replica file
+        """
+        with self.__lock:
+            self.__connection.execute(
+                f"INSERT OR REPLACE INTO entries ({_COLUMNS}) VALUES (?, ?, 0, ?, ?, ?, ?, ?, ?, ?)",
+                (directory, name, stats.st_size, stats.st_mtime_ns, stats.st_mode, stats.st_uid, stats.st_gid, inode,
+                 stats.st_ino))
+
+    def move(self, old_directory: str, old_name: str, directory: str, name: str):
+        """
+        Move entry together with all recorded entries under it
+        """
+        old_path = os.path.join(old_directory, old_name)
+        path = os.path.join(directory, name)
+        with self.__lock:
+            self.__connection.execute(
+                "UPDATE OR REPLACE entries SET parent = ?, name = ? WHERE parent = ? AND name = ?",
+                (directory, name, old_directory, old_name))
+            self.__connection.execute(
+                "UPDATE OR REPLACE entries SET parent = ? || substr(parent, ?)"
+                " WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                (path, len(old_path) + 1, *self.__subtree_range(old_path)))
+
+    def remove(self, directory: str, name: str):
+        """
+        Remove entry together with all recorded entries under it
+        """
+        path = os.path.join(directory, name)
+        with self.__lock:
+            self.__connection.execute("DELETE FROM entries WHERE parent = ? AND name = ?", (directory, name))
+            self.__connection.execute("DELETE FROM entries WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                                      self.__subtree_range(path))
+
+    @staticmethod
+    def __subtree_range(path: str) -> tuple[str, str, str]:
+        """
+        All descendants have parent starting with path + separator, range keeps usage of primary key index
+        """
+        return path, path + os.sep, path + chr(ord(os.sep) + 1)
+
+    def __find(self, condition: str, parameters: tuple) -> list[tuple[str, Entry]]:
+        with self.__lock:
+            rows = self.__connection.execute(f"SELECT {_COLUMNS} FROM entries WHERE {condition}",
+                                             parameters).fetchall()
+        return [(row[0], self.__to_entry(*row[1:])) for row in rows]
+
+    def __get_meta(self, key: str) -> Optional[str]:
+        row = self.__connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def __set_meta(self, key: str, value: str):
+        self.__connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __to_entry(self, name: str, is_dir: int, size: int, mtime_ns: int, mode: int, uid: int, gid: int,
+                   inode: int, source_inode: int) -> Entry:
+        """
+        Entry has inode of the source entry, stats have inode of the replica file
+        """
+        if is_dir:
+            return Entry(name, True, inode=source_inode)
+        # device is the one of replica root and change time is not known
+        return Entry(name, False, FileStat(mode, inode, self.__device, uid, gid, size, mtime_ns), source_inode)
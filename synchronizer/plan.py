@@ -0,0 +1,206 @@
+"""
+Plan of operations which make replica the same as source.
+
+Plan is created by diff of source and replica trees and then applied by the synchronizer. It can be serialized to JSON
+and printed together with estimation of its cost without touching the replica. Plan with memory budget spills its
+operations to disk, see spill module.
+"""
+import itertools
+import json
+import os
+from typing import Collection, Iterable, Iterator, Optional
+
+from synchronizer.spill import SortedRuns, Spill, estimated_memory, read_run, write_run
+from synchronizer.walker import Entry
+
+MKDIR = 'mkdir'
+COPY = 'copy'
+UPDATE = 'update'
+UPDATE_META = 'update-meta'
+VERIFY = 'verify'
+DELETE = 'delete'
+RENAME = 'rename'
+RECORD = 'record'
+
+FILE_OPERATIONS = (COPY, UPDATE, UPDATE_META, VERIFY)
+
+WALK_ORDER = 'walk'
+OPTIMIZED_ORDER = 'optimized'
+ORDERS = (WALK_ORDER, OPTIMIZED_ORDER)
+
+# rough cost model used for estimation of plan duration
+DEFAULT_THROUGHPUT = 100 * 1024 * 1024
+DEFAULT_OPERATION_COST = 0.0005
+
+
+class Operation:
+    """
+    Single operation of the plan. Path is relative to the replica root, previous path is set for rename only.
+    Source and replica entries are available only in plan created by diff, not in deserialized one.
+    Operation marked as replacing removes replica entry of different type than the source entry with the same path.
+    """
+    __slots__ = ('kind', 'directory', 'name', 'is_dir', 'size', 'previous', 'replacing', 'entry', 'replica_entry')
+
+    def __init__(self, kind: str, directory: str, name: str, is_dir: bool = False, size: int = 0,
+                 previous: Optional[str] = None, replacing: bool = False, entry: Optional[Entry] = None,
+                 replica_entry: Optional[Entry] = None):
+        self.kind = kind
+        self.directory = directory
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.previous = previous
+        self.replacing = replacing
+        self.entry = entry
+        self.replica_entry = replica_entry
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.name)
+
+    def to_dict(self) -> dict:
+        result = {'kind': self.kind, 'path': self.path, 'is_dir': self.is_dir, 'size': self.size}
+        if self.previous is not None:
+            result['previous'] = self.previous
+        if self.replacing:
+            result['replacing'] = True
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Operation':
+        directory, name = os.path.split(data['path'])
+        return cls(data['kind'], directory, name, data['is_dir'], data['size'], data.get('previous'),
+                   data.get('replacing', False))
+
+    def __str__(self) -> str:
+        match self.kind:
+            case 'rename':
+                return f"{self.kind} {self.previous} -> {self.path}"
+            case 'copy' | 'update' | 'verify':
+                return f"{self.kind} {self.path} ({self.size} bytes)"
+            case _:
+                return f"{self.kind} {self.path}"
+
+    def __repr__(self) -> str:
+        return f"Operation({self.to_dict()})"
+
+
+def _optimized_key(operation: Operation) -> tuple[int, int]:
+    """
+    Stable sort by the key keeps order of the tree walk for operations with the same key
+    """
+    if operation.kind in FILE_OPERATIONS:
+        return 2, operation.entry.inode if operation.entry else 0
+    if operation.kind == DELETE and not operation.replacing:
+        return 1, 0
+    return 0, 0
+
+
+class Plan:
+    """
+    Operations in order of the tree walk. This order is always valid, optimized order applies directory operations
+    and renames first, then removes entries to free the space and copies files sorted by source inode at the end.
+
+    Directory paths are shared by operations of the same directory. When estimated memory of operations reaches budget
+    of given spill, they are written to run file and only the following operations are kept in memory.
+    """
+    def __init__(self, operations: Optional[list[Operation]] = None, spill: Optional[Spill] = None):
+        # operations kept in memory, they follow the spilled ones
+        self.operations = []
+        # run files of spilled operations in order of the tree walk
+        self.runs: list[str] = []
+        self.spilled = 0
+        # number of compared source entries
+        self.scanned = 0
+        # directories which were not compared yet when diff was split
+        self.shards = []
+        self.__spill = spill
+        self.__memory = 0
+        self.__directories: dict[str, str] = {}
+        for operation in operations or []:
+            self.add(operation)
+
+    def add(self, operation: Operation):
+        operation.directory = self.__directories.setdefault(operation.directory, operation.directory)
+        self.operations.append(operation)
+        if self.__spill is not None:
+            self.__memory += estimated_memory(operation)
+            if self.__memory >= self.__spill.budget:
+                self.__write_run()
+
+    def extend(self, plan: 'Plan'):
+        """
+        Append operations of plan created for another part of the tree, its spilled runs are taken over
+        """
+        if plan.runs:
+            self.__write_run()
+            self.runs.extend(plan.runs)
+            self.spilled += plan.spilled
+        for operation in plan.operations:
+            self.add(operation)
+        self.scanned += plan.scanned
+
+    def ordered(self, order: str = WALK_ORDER) -> Collection[Operation]:
+        """
+        :return: operations in given order, spilled operations are read from disk while they are iterated
+        """
+        if order == WALK_ORDER:
+            return self if self.runs else self.operations
+        if order != OPTIMIZED_ORDER:
+            raise ValueError(f"Unknown order of operations: {order}")
+        if not self.runs:
+            return sorted(self.operations, key=_optimized_key)
+        # operations kept in memory are spilled too, so only one run is sorted in memory at once
+        self.__write_run()
+        return SortedRuns.sort(self, _optimized_key, self.__spill)
+
+    def __write_run(self):
+        if not self.operations:
+            return
+        self.runs.append(write_run(self.__spill.directory, self.operations))
+        self.spilled += len(self.operations)
+        self.operations = []
+        self.__memory = 0
+        self.__directories = {}
+
+    def summary(self, throughput: float = DEFAULT_THROUGHPUT, operation_cost: float = DEFAULT_OPERATION_COST) -> dict:
+        """
+        :param throughput: expected bytes per second of copy
+        :param operation_cost: expected seconds spent by single operation apart of copying data
+        :return: number of operations by kind, bytes to copy or compare and estimated duration in seconds
+        """
+        counts = {}
+        transferred = 0
+        for operation in self:
+            if operation.kind == RECORD:
+                continue
+            counts[operation.kind] = counts.get(operation.kind, 0) + 1
+            if operation.kind in (COPY, UPDATE, VERIFY):
+                transferred += operation.size
+        seconds = sum(counts.values()) * operation_cost + transferred / throughput
+        return {'operations': counts, 'bytes': transferred, 'estimated_seconds': round(seconds, 3)}
+
+    def to_json(self) -> str:
+        return json.dumps({'operations': [operation.to_dict() for operation in self],
+                           'summary': self.summary()})
+
+    @classmethod
+    def from_json(cls, data: str) -> 'Plan':
+        return cls([Operation.from_dict(operation) for operation in json.loads(data)['operations']])
+
+    def to_text(self) -> str:
+        """
+        :return: human-readable plan, operations changing only manifest are omitted
+        """
+        lines = [str(operation) for operation in self if operation.kind != RECORD]
+        summary = self.summary()
+        lines.append(f"{sum(summary['operations'].values())} operations, {summary['bytes']} bytes, "
+                     f"estimated duration {summary['estimated_seconds']} s")
+        return '\n'.join(lines)
+
+    def __iter__(self) -> Iterator[Operation]:
+        spilled: Iterable[Operation] = itertools.chain.from_iterable(read_run(path) for path in self.runs)
+        return itertools.chain(spilled, self.operations)
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.operations)
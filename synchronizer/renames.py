@@ -0,0 +1,110 @@
+"""
+Detection of entries moved or renamed in source, so they can be renamed in replica instead of being removed and copied
+again.
+
+Replica entry is a candidate when its source path from previous run no longer exists. Candidates are found by inode
+of source entry recorded in replica manifest. Files which got new inode (e.g. moved between file systems) are matched by
+size, modification time and hash of their first and last block. Inode of removed directory can be reused by new
+directory, so directory is renamed only when it has a child with the same name as before, or when the source or the
+replica directory is empty.
+"""
+import hashlib
+import logging
+import os
+from typing import Callable, Optional
+
+from synchronizer.manifest import Manifest
+from synchronizer.walker import Entry
+
+log = logging.getLogger('synchronizer.renames.RenameDetector')
+
+PARTIAL_BLOCK_SIZE = 64 * 1024
+
+
+class RenameDetector:
+    """
+    Find replica entry which can be renamed to given new source entry
+    """
+    def __init__(self, manifest: Manifest, input_dir: str, output_dir: str, partial_hash: bool = True):
+        self.__manifest = manifest
+        self.__input_dir = input_dir
+        self.__output_dir = output_dir
+        self.__partial_hash = partial_hash
+
+    def find(self, source: str, entry: Entry,
+             accept: Optional[Callable[[str, Entry], bool]] = None) -> Optional[tuple[str, Entry]]:
+        """
+        :param source: path of new source entry
+        :param entry: new source entry which is missing in replica
+        :param accept: filter of candidates by their relative directory and manifest entry
+        :return: relative directory and manifest entry of replica entry which can be renamed, None when there is none
+        """
+        candidates = self.__manifest.find_by_source_inode(entry.inode) if entry.inode else []
+        for directory, candidate in candidates:
+            if candidate.is_dir != entry.is_dir or not self.__is_same(source, entry, directory, candidate):
+                continue
+            if accept is not None and not accept(directory, candidate):
+                continue
+            if self.__is_left(directory, candidate):
+                return directory, candidate
+
+        if entry.is_dir or not self.__partial_hash:
+            return None
+
+        for directory, candidate in self.__manifest.find_by_fingerprint(entry.stat.st_size, entry.stat.st_mtime_ns):
+            if accept is not None and not accept(directory, candidate):
+                continue
+            if self.__is_left(directory, candidate) and self.__has_same_content(
+                    source, os.path.join(self.__output_dir, directory, candidate.name), entry.stat.st_size):
+                return directory, candidate
+        return None
+
+    def __is_same(self, source: str, entry: Entry, directory: str, candidate: Entry) -> bool:
+        if entry.is_dir:
+            return self.__has_common_child(source, os.path.join(directory, candidate.name))
+        return entry.stat.st_size == candidate.stat.st_size and entry.stat.st_mtime_ns == candidate.stat.st_mtime_ns
+
+    def __has_common_child(self, source: str, relative: str) -> bool:
+        """
+        :return: True when source directory and recorded replica directory share a child, or one of them is empty
+        """
+        recorded = self.__manifest.listing(relative)
+        if not recorded:
+            return True
+        try:
+            with os.scandir(source) as iterator:
+                children = [(dir_entry.name, dir_entry.is_dir()) for dir_entry in iterator]
+        except OSError as error:
+            log.debug("Directory '%s' can't be listed: %s", source, error)
+            return False
+        # children of empty directory were moved elsewhere, so its rename costs nothing
+        return not children or any(name in recorded and recorded[name].is_dir == is_dir for name, is_dir in children)
+
+    def __is_left(self, directory: str, candidate: Entry) -> bool:
+        """
+        :return: True when source of the candidate no longer exists and candidate still exists in replica
+        """
+        relative = os.path.join(directory, candidate.name)
+        return (not os.path.lexists(os.path.join(self.__input_dir, relative))
+                and os.path.lexists(os.path.join(self.__output_dir, relative)))
+
+    @staticmethod
+    def __has_same_content(source: str, target: str, size: int) -> bool:
+        try:
+            return RenameDetector.partial_digest(source, size) == RenameDetector.partial_digest(target, size)
+        except OSError as error:
+            log.debug("Partial hash of '%s' or '%s' can't be computed: %s", source, target, error)
+            return False
+
+    @staticmethod
+    def partial_digest(path: str, size: int) -> bytes:
+        """
+        :return: hash of the first and the last block of the file
+        """
+        digest = hashlib.blake2b()
+        with open(path, 'rb') as file:
+            digest.update(file.read(PARTIAL_BLOCK_SIZE))
+            if size > PARTIAL_BLOCK_SIZE:
+                file.seek(max(PARTIAL_BLOCK_SIZE, size - PARTIAL_BLOCK_SIZE))
+                digest.update(file.read(PARTIAL_BLOCK_SIZE))
+        return digest.digest()
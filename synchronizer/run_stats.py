@@ -0,0 +1,124 @@
+"""
+Statistics of one synchronization run: time spent in phases, counts of operations, copied bytes, the slowest files and
+peak RSS of the process.
+"""
+import contextlib
+import heapq
+import logging
+import sys
+import threading
+import time
+from typing import Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+log = logging.getLogger('synchronizer.run_stats.RunStats')
+
+COUNTERS = ('scanned', 'created_directories', 'copied', 'updated', 'linked', 'chmod', 'chown', 'renamed', 'deleted',
+            'failed')
+
+# scan is the diff of source and replica, apply is wall time of applying the plan, copy, metadata and cleanup are
+# times spent by operations which can overlap when more workers are used
+PHASES = ('scan', 'apply', 'copy', 'metadata', 'cleanup')
+
+DEFAULT_SLOWEST_COUNT = 10
+
+
+class RunStats:
+    """
+    Statistics are collected by synchronizer during the run, counters can be updated from copy workers.
+    """
+    def __init__(self, input_dir: str, output_dir: str, slowest_count: int = DEFAULT_SLOWEST_COUNT):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.success: Optional[bool] = None
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_copied = 0
+        # peak resident memory of the process in KB when the run finished, None when it can't be measured
+        self.peak_rss_kb: Optional[int] = None
+        self.__slowest_count = slowest_count
+        self.__slowest: list[tuple[float, str]] = []
+        self.__start = time.perf_counter()
+        self.__duration: Optional[float] = None
+        self.__lock = threading.Lock()
+
+    def add(self, counter: str, value: int = 1):
+        with self.__lock:
+            self.counts[counter] += value
+
+    def add_bytes(self, copied: int):
+        with self.__lock:
+            self.bytes_copied += copied
+
+    def add_time(self, phase: str, seconds: float):
+        with self.__lock:
+            self.phases[phase] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def file_done(self, path: str, seconds: float):
+        with self.__lock:
+            if len(self.__slowest) < self.__slowest_count:
+                heapq.heappush(self.__slowest, (seconds, path))
+            elif self.__slowest and seconds > self.__slowest[0][0]:
+                heapq.heapreplace(self.__slowest, (seconds, path))
+
+    def finish(self, success: bool):
+        self.__duration = time.perf_counter() - self.__start
+        self.finished = time.time()
+        self.success = success
+        self.peak_rss_kb = peak_rss_kb()
+
+    @property
+    def duration(self) -> float:
+        return self.__duration if self.__duration is not None else time.perf_counter() - self.__start
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: copied bytes per second of the whole run
+        """
+        return self.bytes_copied / self.duration if self.duration else 0.0
+
+    def slowest(self) -> list[tuple[str, float]]:
+        """
+        :return: paths of the slowest synchronized files with their time, the slowest first
+        """
+        with self.__lock:
+            return [(path, seconds) for seconds, path in sorted(self.__slowest, reverse=True)]
+
+    def to_dict(self) -> dict:
+        return {'input_dir': self.input_dir, 'output_dir': self.output_dir, 'started': self.started,
+                'finished': self.finished, 'success': self.success, 'duration': self.duration,
+                'phases': dict(self.phases), 'counts': dict(self.counts), 'bytes_copied': self.bytes_copied,
+                'throughput': self.throughput, 'peak_rss_kb': self.peak_rss_kb,
+                'slowest': [{'path': path, 'seconds': seconds} for path, seconds in self.slowest()]}
+
+    def log_report(self):
+        log.info("Synchronization took %.3f s (scan %.3f s, apply %.3f s), %s, copied %s bytes, peak RSS %s KB",
+                 self.duration, self.phases['scan'], self.phases['apply'],
+                 ', '.join(f"{counter} {value}" for counter, value in self.counts.items() if value),
+                 self.bytes_copied, self.peak_rss_kb)
+
+
+def peak_rss_kb() -> Optional[int]:
+    """
+    :return: peak resident memory of the process in KB, None when it can't be measured
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other systems KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
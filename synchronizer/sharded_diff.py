@@ -0,0 +1,90 @@
+"""
+Diff of source and replica trees split into subtrees which are compared in parallel by pool of processes.
+
+Scanning of one tree is limited by the GIL and by latency of every directory listing on network file systems. The tree
+is split breadth first until there is enough subtrees for all workers, then subtrees are compared by worker processes.
+Plans of subtrees are merged in order of the subtrees, so every directory is still created before its content.
+Memory budget of the plan is divided between the merged plan and plans of workers, runs spilled by workers are taken
+over by the merged plan.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+from typing import Optional
+
+from synchronizer.diff import Shard, TreeDiff
+from synchronizer.filters import Filter
+from synchronizer.manifest import Manifest
+from synchronizer.plan import Plan
+from synchronizer.spill import Spill
+from synchronizer.walker import Walker
+
+log = logging.getLogger('synchronizer.sharded_diff.ShardedDiff')
+
+SHARDS_PER_WORKER = 4
+
+# diff of the worker process, created by the pool initializer
+_worker_diff: Optional[TreeDiff] = None
+_worker_dirs: tuple[str, str] = ('', '')
+
+
+def _init_worker(input_dir: str, output_dir: str, manifest_path: Optional[str], manifest_trusted: bool,
+                 checksum: bool, filter_rules: Optional[tuple[tuple[str, ...], Optional[str]]],
+                 spill: Optional[Spill] = None):
+    global _worker_diff, _worker_dirs  # pylint: disable=global-statement
+    manifest = None
+    if manifest_path is not None:
+        # untrusted manifest is never read, it is needed only to plan recording of unchanged entries
+        manifest = Manifest(manifest_path)
+        if manifest_trusted:
+            manifest.open_reader(output_dir)
+    filters = None
+    if filter_rules is not None:
+        filters = Filter(*filter_rules)
+        filters.start(input_dir)
+    _worker_diff = TreeDiff(Walker(), manifest, manifest_trusted, checksum=checksum, filters=filters, spill=spill)
+    _worker_dirs = (input_dir, output_dir)
+
+
+def _diff_shard(shard: Shard) -> Plan:
+    return _worker_diff.diff_shards(*_worker_dirs, [shard])
+
+
+class ShardedDiff:
+    """
+    Compare trees by given number of worker processes. Trusted manifest is read by workers from its committed
+    content, so nothing may be written to it before the diff is done. Filter has to be started with the source
+    directory, workers load rules of ignore files again.
+    """
+    def __init__(self, workers: int, manifest: Optional[Manifest] = None, manifest_trusted: bool = False,
+                 checksum: bool = False, filters: Optional[Filter] = None, spill: Optional[Spill] = None):
+        self.workers = workers
+        # merged plan and plans of all workers are kept at once
+        self.__spill = spill.share(workers + 1) if spill is not None else None
+        self.__filter = filters
+        self.__manifest = manifest
+        self.__manifest_trusted = manifest_trusted
+        self.__checksum = checksum
+
+    def diff(self, input_dir: str, output_dir: str, directories: list[tuple[str, bool]]) -> Plan:
+        tree_diff = TreeDiff(Walker(), self.__manifest, self.__manifest_trusted, checksum=self.__checksum,
+                             filters=self.__filter, spill=self.__spill)
+        plan = Plan(spill=self.__spill)
+        shards = [Shard(relative, recursive) for relative, recursive in directories]
+        while shards and len(shards) < self.workers * SHARDS_PER_WORKER:
+            level = tree_diff.diff_shards(input_dir, output_dir, shards, split=True)
+            plan.extend(level)
+            shards = level.shards
+        if not shards:
+            return plan
+
+        log.debug("Comparing %s subtrees by %s processes", len(shards), self.workers)
+        manifest_path = self.__manifest.path if self.__manifest is not None else None
+        filter_rules = (self.__filter.patterns, self.__filter.ignore_file) if self.__filter is not None else None
+        # processes are spawned, forked process would inherit locks held by other threads of the synchronizer
+        with concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'), _init_worker,
+                                                    (input_dir, output_dir, manifest_path, self.__manifest_trusted,
+                                                     self.__checksum, filter_rules, self.__spill)) as pool:
+            for shard_plan in pool.map(_diff_shard, shards):
+                plan.extend(shard_plan)
+        return plan
@@ -0,0 +1,128 @@
+"""
+Operations of plan which doesn't fit into memory budget are spilled to disk.
+
+Plan keeps operations in memory until their estimated size reaches the budget, then they are written to run file in
+spill directory next to the replica. When the plan is applied in other order than the tree walk, every run is sorted
+on its own and sorted runs are merged while the plan is applied, so only one batch of every run is in memory at once.
+"""
+import heapq
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+SUFFIX = '.spill'
+
+# items written and read by one pickle call, directory strings are shared inside the batch
+BATCH_SIZE = 1024
+
+# estimated memory of planned operation and of its entry with stats on 64-bit CPython, without the name
+OPERATION_MEMORY = 200
+ENTRY_MEMORY = 330
+
+
+class Spill(NamedTuple):
+    """
+    Memory budget of plan in bytes and directory where operations over the budget are written
+    """
+    budget: int
+    directory: str
+
+    @classmethod
+    def for_replica(cls, output_dir: str, budget: int) -> 'Spill':
+        """
+        :return: spill to directory which is sibling of given replica directory
+        """
+        return cls(budget, output_dir.rstrip('\\/') + SUFFIX)
+
+    def share(self, parts: int) -> 'Spill':
+        """
+        :return: spill with budget divided between given number of plans which are kept at once
+        """
+        return Spill(self.budget // parts, self.directory)
+
+
+def estimated_memory(operation) -> int:
+    """
+    :param operation: planned operation
+    :return: estimated bytes of operation together with its entries
+    """
+    memory = OPERATION_MEMORY + len(operation.name)
+    for entry in (operation.entry, operation.replica_entry):
+        if entry is not None:
+            memory += ENTRY_MEMORY + len(entry.name)
+    return memory
+
+
+def write_run(directory: str, items: Iterable[Any]) -> str:
+    """
+    :return: path of run file with given items
+    """
+    fd, path = tempfile.mkstemp(SUFFIX, dir=directory)
+    with os.fdopen(fd, 'wb') as file:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == BATCH_SIZE:
+                pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_run(path: str) -> Iterator[Any]:
+    """
+    :return: items of run file in the order in which they were written
+    """
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                batch = pickle.load(file)
+            except EOFError:
+                return
+            yield from batch
+
+
+class SortedRuns:
+    """
+    Operations of runs sorted by the same key, iteration merges them. Operations can be iterated more times.
+    """
+    def __init__(self, paths: list[str], count: int, key: Callable[[Any], Any]):
+        self.paths = paths
+        self.__count = count
+        self.__key = key
+
+    @classmethod
+    def sort(cls, operations: Iterable[Any], key: Callable[[Any], Any], spill: Spill) -> 'SortedRuns':
+        """
+        Sort operations which don't fit into memory budget, every run is sorted in memory on its own
+        """
+        paths = []
+        count = 0
+        run = []
+        memory = 0
+        for operation in operations:
+            run.append(operation)
+            memory += estimated_memory(operation)
+            if memory >= spill.budget:
+                paths.append(cls.__write_sorted(run, key, spill.directory))
+                count += len(run)
+                run = []
+                memory = 0
+        if run:
+            paths.append(cls.__write_sorted(run, key, spill.directory))
+            count += len(run)
+        return cls(paths, count, key)
+
+    @staticmethod
+    def __write_sorted(run: list[Any], key: Callable[[Any], Any], directory: str) -> str:
+        run.sort(key=key)
+        return write_run(directory, run)
+
+    def __iter__(self) -> Iterator[Any]:
+        # merge is stable, operations with the same key keep order of runs
+        return heapq.merge(*(read_run(path) for path in self.paths), key=self.__key)
+
+    def __len__(self) -> int:
+        return self.__count
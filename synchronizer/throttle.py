@@ -0,0 +1,212 @@
+"""
+Throttling of replica writes, so synchronization doesn't starve other users of the target disk.
+
+Bytes and write operations are limited by token buckets. Limits are configured per time window of the day (e.g. no limit
+at night and 50 MB/s during business hours) and are applied to every written chunk, so copy of a large file doesn't
+cause a burst. Adaptive mode measures latency of chunk writes and lowers the bytes limit while latency is above given
+threshold, then raises it again step by step.
+"""
+import contextlib
+import datetime
+import logging
+import threading
+import time
+from typing import Callable, Iterator, NamedTuple, Optional, Sequence
+
+log = logging.getLogger('synchronizer.throttle.Throttle')
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# how often adaptive limit is changed and how much
+ADJUST_INTERVAL = 1.0
+BACKOFF_FACTOR = 0.5
+RECOVERY_FACTOR = 1.25
+MIN_BYTES_PER_SECOND = 64 * 1024
+
+
+class ThrottleWindow(NamedTuple):
+    """
+    Limits applied from start to end time of every day, window can go over midnight. Window with the same start and
+    end applies whole day. Limit which is None is not applied.
+    """
+    start: datetime.time
+    end: datetime.time
+    bytes_per_second: Optional[float] = None
+    operations_per_second: Optional[float] = None
+
+    def contains(self, moment: datetime.time) -> bool:
+        if self.start == self.end:
+            return True
+        if self.start < self.end:
+            return self.start <= moment < self.end
+        return moment >= self.start or moment < self.end
+
+
+def parse_window(text: str) -> ThrottleWindow:
+    """
+    :param text: window in format HH:MM-HH:MM,<MB per second>[,<operations per second>] e.g. 08:00-18:00,50 or
+    08:00-18:00,,500 for limit of operations only
+    :raise ValueError: when the format is wrong
+    """
+    times, _, limits = text.partition(',')
+    start, separator, end = times.partition('-')
+    if not separator or not limits:
+        raise ValueError(f"Wrong throttle window was provided: '{text}'")
+    megabytes, _, operations = limits.partition(',')
+    return ThrottleWindow(datetime.time.fromisoformat(start.strip()), datetime.time.fromisoformat(end.strip()),
+                          float(megabytes) * 1024 * 1024 if megabytes.strip() else None,
+                          float(operations) if operations.strip() else None)
+
+
+class TokenBucket:
+    """
+    Token bucket which can go into debt, so amount larger than the bucket is still allowed and the following
+    consumers wait until the debt is paid. Rate None means unlimited.
+    """
+    def __init__(self, rate: Optional[float] = None, burst_seconds: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.burst_seconds = burst_seconds
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__rate = rate
+        self.__tokens = rate * burst_seconds if rate is not None else 0.0
+        self.__updated = clock()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.__rate
+
+    @rate.setter
+    def rate(self, rate: Optional[float]):
+        with self.__lock:
+            self.__refill()
+            self.__rate = rate
+            if rate is not None:
+                self.__tokens = min(self.__tokens, rate * self.burst_seconds)
+
+    def consume(self, amount: float) -> float:
+        """
+        :return: seconds which consumer has to wait before it can use the amount
+        """
+        with self.__lock:
+            if self.__rate is None:
+                return 0.0
+            self.__refill()
+            self.__tokens -= amount
+            return -self.__tokens / self.__rate if self.__tokens < 0 else 0.0
+
+    def __refill(self):
+        now = self.__clock()
+        if self.__rate is not None:
+            self.__tokens = min(self.__tokens + (now - self.__updated) * self.__rate,
+                                self.__rate * self.burst_seconds)
+        self.__updated = now
+
+
+class Throttle:
+    """
+    Limit writes of all copy workers (and jobs) which share the instance. Limits of the first window which contains
+    current local time are used, there is no limit outside of windows.
+
+    When max_latency (seconds) is set, average write latency of chunks is checked every ADJUST_INTERVAL. Bytes limit is
+    halved while it is above max_latency and raised again while it is below half of it. When the window has no bytes
+    limit, measured throughput is halved.
+    """
+    def __init__(self, windows: Sequence[ThrottleWindow] = (), max_latency: Optional[float] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, clock: Callable[[], float] = time.monotonic,
+                 now: Callable[[], datetime.datetime] = datetime.datetime.now,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.windows = tuple(windows)
+        self.max_latency = max_latency
+        self.chunk_size = chunk_size
+        self.__clock = clock
+        self.__now = now
+        self.__sleep = sleep
+        self.__bytes = TokenBucket(clock=clock)
+        self.__operations = TokenBucket(clock=clock)
+        self.__window: Optional[ThrottleWindow] = None
+        self.__lock = threading.Lock()
+        self.__adaptive_rate: Optional[float] = None
+        self.__adjusted = clock()
+        self.__written = 0
+        self.__latencies = 0.0
+        self.__writes = 0
+        self.waited = 0.0
+
+    @contextlib.contextmanager
+    def chunk(self, size: int) -> Iterator[None]:
+        """
+        Wait until write of given number of bytes fits into limits, write latency is measured in adaptive mode
+        """
+        self.acquire(size)
+        start = self.__clock()
+        yield
+        self.record(size, self.__clock() - start)
+
+    def acquire(self, size: int):
+        self.__update_window()
+        wait = max(self.__bytes.consume(size), self.__operations.consume(1))
+        if wait > 0:
+            with self.__lock:
+                self.waited += wait
+            self.__sleep(wait)
+
+    def record(self, size: int, seconds: float):
+        """
+        :param seconds: how long the write of the chunk took
+        """
+        if self.max_latency is None:
+            return
+        with self.__lock:
+            self.__written += size
+            self.__latencies += seconds
+            self.__writes += 1
+            elapsed = self.__clock() - self.__adjusted
+            if elapsed >= ADJUST_INTERVAL:
+                self.__adjust(self.__latencies / self.__writes, self.__written / elapsed)
+                self.__adjusted += elapsed
+                self.__written = 0
+                self.__latencies = 0.0
+                self.__writes = 0
+
+    def limits(self) -> tuple[Optional[float], Optional[float]]:
+        """
+        :return: bytes and operations per second which are applied right now
+        """
+        return self.__bytes.rate, self.__operations.rate
+
+    def __update_window(self):
+        moment = self.__now().time()
+        window = next((window for window in self.windows if window.contains(moment)), None)
+        with self.__lock:
+            if window == self.__window:
+                return
+            log.debug("Throttle window changed to %s", window)
+            self.__window = window
+            self.__adaptive_rate = None
+            self.__apply_rates()
+
+    def __adjust(self, latency: float, throughput: float):
+        window_rate = self.__window.bytes_per_second if self.__window is not None else None
+        current = self.__bytes.rate
+        if latency > self.max_latency:
+            rate = max((current if current is not None else throughput) * BACKOFF_FACTOR, MIN_BYTES_PER_SECOND)
+            if rate != current:
+                log.info("Write latency %.1f ms is above %.1f ms, copy is throttled to %.1f MB/s",
+                         latency * 1000, self.max_latency * 1000, rate / 1024 / 1024)
+            self.__adaptive_rate = rate
+        elif self.__adaptive_rate is not None and latency < self.max_latency / 2:
+            self.__adaptive_rate *= RECOVERY_FACTOR
+            # limit is dropped when it reaches the window limit or when copy doesn't use it anymore
+            if ((window_rate is not None and self.__adaptive_rate >= window_rate)
+                    or (window_rate is None and throughput < self.__adaptive_rate * BACKOFF_FACTOR)):
+                log.info("Write latency is back to %.1f ms, adaptive throttling is stopped", latency * 1000)
+                self.__adaptive_rate = None
+        self.__apply_rates()
+
+    def __apply_rates(self):
+        window = self.__window
+        rate = window.bytes_per_second if window is not None else None
+        if self.__adaptive_rate is not None:
+            rate = self.__adaptive_rate if rate is None else min(rate, self.__adaptive_rate)
+        self.__bytes.rate = rate
+        self.__operations.rate = window.operations_per_second if window is not None else None
@@ -0,0 +1,120 @@
+"""
+Directory tree scanning based on os.scandir.
+
+Every entry is read only once per run - type and stat information are taken from DirEntry and kept in Entry record
+which is then reused for all the checks done by synchronizer. Only stat fields used by synchronizer are kept, whole
+os.stat_result with its float times takes about three times more memory per entry. Only directories and regular files
+are synchronized, other entries (dangling symlinks, FIFOs, sockets, devices) are skipped.
+"""
+import logging
+import os
+from os import stat_result
+import stat
+from typing import Callable, Collection, Iterator, Optional
+
+# called with names of all entries of scanned directory before any of them is stat-ed, returns function of entry name
+# and directory flag which accepts entries
+Selector = Callable[[Collection[str]], Callable[[str, bool], bool]]
+
+log = logging.getLogger('synchronizer.walker.Walker')
+
+
+class FileStat:
+    """
+    Stat fields of file used by synchronizer, attributes have the same names as in os.stat_result.
+    Change time is 0 when it is not known.
+    """
+    __slots__ = ('st_mode', 'st_ino', 'st_dev', 'st_uid', 'st_gid', 'st_size', 'st_mtime_ns', 'st_ctime_ns')
+
+    def __init__(self, st_mode: int, st_ino: int, st_dev: int, st_uid: int, st_gid: int, st_size: int,
+                 st_mtime_ns: int, st_ctime_ns: int = 0):
+        self.st_mode = st_mode
+        self.st_ino = st_ino
+        self.st_dev = st_dev
+        self.st_uid = st_uid
+        self.st_gid = st_gid
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+        self.st_ctime_ns = st_ctime_ns
+
+    @classmethod
+    def of(cls, stats: stat_result) -> 'FileStat':
+        return cls(stats.st_mode, stats.st_ino, stats.st_dev, stats.st_uid, stats.st_gid, stats.st_size,
+                   stats.st_mtime_ns, stats.st_ctime_ns)
+
+    def __iter__(self) -> Iterator[int]:
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FileStat) and tuple(self) == tuple(other)
+
+    def __repr__(self) -> str:
+        return f"FileStat({', '.join(f'{field}={getattr(self, field)}' for field in self.__slots__)})"
+
+
+class Entry:
+    """
+    Metadata of single directory entry. Stat is gathered only for files as directories don't need them right now.
+    Inode identifies the entry also after it is moved or renamed.
+    """
+    __slots__ = ('name', 'is_dir', 'stat', 'inode')
+
+    def __init__(self, name: str, is_dir: bool, stat: Optional[FileStat] = None, inode: int = 0):
+        self.name = name
+        self.is_dir = is_dir
+        self.stat = stat
+        self.inode = inode
+
+    def __repr__(self) -> str:
+        return f"Entry(name={self.name!r}, is_dir={self.is_dir})"
+
+
+class Walker:
+    """
+    Read content of directories with one os.scandir call per directory.
+    Entries are returned sorted by name so the synchronization order is the same on every platform.
+    Entries rejected by selector are skipped without being stat-ed, entries which are neither directories nor regular
+    files are skipped as well.
+    """
+    def scan(self, directory: str, selector: Optional[Selector] = None) -> list[Entry]:
+        entries = []
+        with os.scandir(directory) as iterator:
+            if selector is None:
+                dir_entries = iterator
+            else:
+                dir_entries = list(iterator)
+                accept = selector([dir_entry.name for dir_entry in dir_entries])
+                dir_entries = [dir_entry for dir_entry in dir_entries if accept(dir_entry.name, dir_entry.is_dir())]
+            for dir_entry in dir_entries:
+                entry = self._to_entry(dir_entry)
+                if entry is not None:
+                    entries.append(entry)
+        entries.sort(key=lambda entry: entry.name)
+        return entries
+
+    def listing(self, directory: str) -> dict[str, Entry]:
+        """
+        :param directory: path to directory
+        :return: entries of given directory mapped by their name, ordered by name
+        """
+        return {entry.name: entry for entry in self.scan(directory)}
+
+    @staticmethod
+    def _to_entry(dir_entry: os.DirEntry) -> Optional[Entry]:
+        """
+        :return: entry of directory or regular file, None for other entries and entries which can't be stat-ed
+        """
+        if dir_entry.is_dir():
+            # inode of directory entry is known from scandir without additional call on POSIX systems
+            return Entry(dir_entry.name, True, inode=dir_entry.inode())
+        try:
+            stats = dir_entry.stat()
+        except OSError as error:
+            # e.g. dangling symlink or file removed since the directory was listed
+            log.warning("Entry '%s' is skipped, it can't be read: %s", dir_entry.path, error)
+            return None
+        if not stat.S_ISREG(stats.st_mode):
+            log.debug("Entry '%s' is skipped, it is not a regular file", dir_entry.path)
+            return None
+        file_stat = FileStat.of(stats)
+        return Entry(dir_entry.name, False, file_stat, file_stat.st_ino)
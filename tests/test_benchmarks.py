@@ -0,0 +1,72 @@
+import os
+import shutil
+import unittest
+
+from benchmarks.run_benchmarks import check_memory, compare
+from benchmarks.scenarios import run_scenario
+from benchmarks.tree_generator import PROFILES, TreeGenerator
+
+BENCHMARK_DIR = 'data' + os.sep + 'benchmark'
+# peak RSS of synchronization of smoke tree in fresh process, interpreter itself takes about 20 MB
+MAX_RSS_KB = 64 * 1024
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+
+    def doCleanups(self):
+        if os.path.exists(BENCHMARK_DIR):
+            shutil.rmtree(BENCHMARK_DIR)
+
+    def test_generator_is_deterministic(self):
+        generator = TreeGenerator(PROFILES['deep_tree'], scale=0.001, size_scale=2)
+
+        self.assertEqual(10, generator.file_count)
+        self.assertEqual(['d00000', os.path.join('d00000', 'l001'), os.path.join('d00000', 'l001', 'l002')],
+                         generator.directories()[:3])
+        info = generator.generate(BENCHMARK_DIR)
+        self.assertEqual((10, 10 * 2048, 10), info)
+
+        with open(os.path.join(BENCHMARK_DIR, generator.files()[3]), 'rb') as file:
+            content = file.read()
+        shutil.rmtree(BENCHMARK_DIR)
+        generator.generate(BENCHMARK_DIR)
+        with open(os.path.join(BENCHMARK_DIR, generator.files()[3]), 'rb') as file:
+            self.assertEqual(content, file.read())
+
+    def test_modified_scenario(self):
+        generator = TreeGenerator(PROFILES['smoke'])
+
+        result = run_scenario('modified_1pct', generator, BENCHMARK_DIR, {'manifest': True}, isolated=False)
+
+        self.assertEqual(200, result['files'])
+        self.assertEqual(2 * 4096, result['bytes'])
+        # source and replica of both modified files
+        self.assertEqual(4, result['syscalls']['open'])
+        self.assertEqual(generator.directory_count + 1, result['syscalls']['scandir'])
+
+    def test_compare_reports_regressions(self):
+        baseline = {'results': {'first_sync': {'wall_seconds': 1.0, 'syscalls': {'stat': 100}, 'peak_rss_kb': 1000},
+                                'noop_resync': {'wall_seconds': 0.01, 'syscalls': {'stat': 10}, 'peak_rss_kb': 1000}}}
+        results = {'results': {'first_sync': {'wall_seconds': 1.1, 'syscalls': {'stat': 150}, 'peak_rss_kb': 1300},
+                               'noop_resync': {'wall_seconds': 0.05, 'syscalls': {'stat': 10}, 'peak_rss_kb': 1000},
+                               'mass_delete': {'wall_seconds': 9.0, 'syscalls': {}, 'peak_rss_kb': None}}}
+
+        self.assertEqual(["first_sync: syscalls 100 -> 150", "first_sync: peak_rss_kb 1000 -> 1300"],
+                         compare(results, baseline))
+
+    def test_memory_budget_of_spilled_plan(self):
+        results = {'results': {'first_sync': run_scenario('first_sync', TreeGenerator(PROFILES['smoke']),
+                                                          BENCHMARK_DIR, {'memory_budget': 64 * 1024})}}
+
+        self.assertEqual(200, results['results']['first_sync']['files'])
+        self.assertEqual([], check_memory(results, MAX_RSS_KB))
+        self.assertEqual(["first_sync: peak_rss_kb 2000 over limit 1000"],
+                         check_memory({'results': {'first_sync': {'peak_rss_kb': 2000},
+                                                   'noop_resync': {'peak_rss_kb': None}}}, 1000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import errno
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from synchronizer import copy_backend
+from synchronizer.copy_backend import CopyBackend
+
+COPY_DIR = 'data' + os.sep + 'copy'
+SOURCE = COPY_DIR + os.sep + 'source.bin'
+TARGET = COPY_DIR + os.sep + 'target.bin'
+BACKEND_LOGGER = 'synchronizer.copy_backend.CopyBackend'
+
+CONTENT = bytes(range(256)) * 4099
+
+
+class CopyBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(COPY_DIR)
+        with open(SOURCE, 'wb') as file:
+            file.write(CONTENT)
+        os.chmod(SOURCE, 0o640)
+        os.utime(SOURCE, ns=(1_600_000_000_123_456_789, 1_600_000_000_987_654_321))
+
+    def doCleanups(self):
+        if os.path.exists(COPY_DIR):
+            shutil.rmtree(COPY_DIR)
+
+    def test_every_mechanism_copies_content_and_metadata(self):
+        for mechanism in CopyBackend().mechanisms:
+            if mechanism == copy_backend.REFLINK:
+                # depends on file system of test machine, covered by fallback test
+                continue
+            with self.subTest(mechanism=mechanism):
+                backend = CopyBackend((mechanism,))
+                self.assertEqual(mechanism, backend.copy(SOURCE, TARGET))
+                self.__assert_copy()
+                self.assertEqual(len(CONTENT), backend.stats()[mechanism].bytes)
+                self.assertEqual(1, backend.stats()[mechanism].files)
+                os.remove(TARGET)
+
+    def test_fallback_when_mechanism_is_not_supported(self):
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        backend = CopyBackend((copy_backend.COPY_FILE_RANGE, copy_backend.USERSPACE))
+        with patch('os.copy_file_range', unsupported, create=True):
+            self.assertEqual(copy_backend.USERSPACE, backend.copy(SOURCE, TARGET))
+            self.__assert_copy()
+
+        # unsupported mechanism is not tried again for the same devices
+        with patch('os.copy_file_range', side_effect=AssertionError('should not be called'), create=True):
+            self.assertEqual(copy_backend.USERSPACE, backend.copy(SOURCE, TARGET))
+        self.assertEqual(2, backend.stats()[copy_backend.USERSPACE].files)
+
+    def test_fallback_continues_from_copied_offset(self):
+        def copy_half(source_fd, target_fd, count, offset_src, offset_dst):
+            if offset_src:
+                raise OSError(errno.EINVAL, 'Invalid argument')
+            return os.pwrite(target_fd, os.pread(source_fd, len(CONTENT) // 2, 0), 0)
+
+        backend = CopyBackend((copy_backend.COPY_FILE_RANGE, copy_backend.USERSPACE))
+        with patch('os.copy_file_range', copy_half, create=True):
+            self.assertEqual(copy_backend.USERSPACE, backend.copy(SOURCE, TARGET))
+
+        self.__assert_copy()
+        self.assertEqual(len(CONTENT) // 2, backend.stats()[copy_backend.COPY_FILE_RANGE].bytes)
+        self.assertEqual(0, backend.stats()[copy_backend.COPY_FILE_RANGE].files)
+        self.assertEqual(len(CONTENT) - len(CONTENT) // 2, backend.stats()[copy_backend.USERSPACE].bytes)
+
+    def test_report_of_used_mechanisms(self):
+        backend = CopyBackend((copy_backend.USERSPACE,))
+        backend.copy(SOURCE, TARGET)
+        with self.assertLogs(BACKEND_LOGGER, level='INFO') as cm:
+            backend.log_report()
+
+        self.assertEqual(1, len(cm.records))
+        self.assertRegex(cm.records[0].getMessage(),
+                         rf"Copied 1 files \({len(CONTENT)} bytes\) with userspace in [\d.]+ s, throughput [\d.]+ MB/s")
+
+        backend.reset_stats()
+        self.assertEqual({}, backend.stats())
+
+    def test_large_file_is_copied_by_ranges(self):
+        range_size = 64 * 1024
+        for mechanism in (copy_backend.COPY_FILE_RANGE, copy_backend.USERSPACE):
+            if mechanism not in CopyBackend().mechanisms:
+                continue
+            with self.subTest(mechanism=mechanism):
+                backend = CopyBackend((mechanism,), parallel_threshold=len(CONTENT), range_size=range_size,
+                                      chunk_checksums=True)
+                with patch('os.posix_fallocate', wraps=os.posix_fallocate) as fallocate, \
+                        patch('os.pread', wraps=os.pread) as pread:
+                    self.assertEqual(mechanism, backend.copy(SOURCE, TARGET))
+
+                self.__assert_copy()
+                fallocate.assert_called_once_with(fallocate.call_args[0][0], 0, len(CONTENT))
+                # every range is read back from source and target
+                self.assertGreaterEqual(pread.call_count, 2 * (len(CONTENT) // range_size))
+                self.assertEqual(len(CONTENT), backend.stats()[mechanism].bytes)
+                self.assertEqual(1, backend.stats()[mechanism].files)
+                os.remove(TARGET)
+
+    def test_failed_range_keeps_target(self):
+        with open(TARGET, 'wb') as file:
+            file.write(b'old content')
+        original_pwrite = os.pwrite
+
+        def failing_pwrite(fd, data, offset):
+            if offset >= len(CONTENT) // 2:
+                raise OSError(errno.ENOSPC, 'No space left on device')
+            return original_pwrite(fd, data, offset)
+
+        backend = CopyBackend((copy_backend.USERSPACE,), parallel_threshold=0, range_size=64 * 1024)
+        with patch('os.pwrite', failing_pwrite), self.assertRaises(OSError):
+            backend.copy(SOURCE, TARGET)
+
+        with open(TARGET, 'rb') as file:
+            self.assertEqual(b'old content', file.read())
+        self.assertEqual(['source.bin', 'target.bin'], sorted(os.listdir(COPY_DIR)))
+
+    def test_range_checksum_detects_corrupted_copy(self):
+        original_pwrite = os.pwrite
+
+        def corrupting_pwrite(fd, data, offset):
+            if offset == 0:
+                data = b'X' + bytes(data[1:])
+            return original_pwrite(fd, data, offset)
+
+        backend = CopyBackend((copy_backend.USERSPACE,), parallel_threshold=0, range_size=64 * 1024,
+                              chunk_checksums=True)
+        with patch('os.pwrite', corrupting_pwrite), self.assertRaisesRegex(OSError, 'Checksum of copied range 0-65536'):
+            backend.copy(SOURCE, TARGET)
+        self.assertFalse(os.path.exists(TARGET))
+
+    def __assert_copy(self):
+        with open(TARGET, 'rb') as file:
+            self.assertEqual(CONTENT, file.read())
+        source_stats = os.stat(SOURCE)
+        target_stats = os.stat(TARGET)
+        self.assertEqual(source_stats.st_mode, target_stats.st_mode)
+        self.assertEqual(source_stats.st_mtime_ns, target_stats.st_mtime_ns)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+
+from synchronizer.copy_pool import CopyPool
+
+POOL_LOGGER = 'synchronizer.copy_pool.CopyPool'
+
+
+class CopyPoolTest(unittest.TestCase):
+
+    def test_single_worker_runs_in_calling_thread(self):
+        pool = CopyPool()
+        threads = []
+        pool.submit('first', lambda: threads.append(threading.current_thread()))
+
+        self.assertEqual([threading.current_thread()], threads)
+        self.assertEqual([], pool.wait())
+        pool.shutdown()
+
+    def test_all_tasks_finished_by_wait(self):
+        pool = CopyPool(4, queue_size=2)
+        done = []
+        lock = threading.Lock()
+
+        def task(number: int):
+            time.sleep(0.001)
+            with lock:
+                done.append(number)
+
+        for number in range(50):
+            pool.submit(str(number), task, number)
+
+        self.assertEqual([], pool.wait())
+        self.assertEqual(list(range(50)), sorted(done))
+        pool.shutdown()
+
+    def test_failure_does_not_stop_other_tasks(self):
+        for workers in (1, 3):
+            with self.subTest(workers=workers):
+                pool = CopyPool(workers)
+                done = []
+
+                def task(number: int):
+                    if number == 2:
+                        raise OSError('disk full')
+                    done.append(number)
+
+                with self.assertLogs(POOL_LOGGER, level='ERROR') as cm:
+                    for number in range(5):
+                        pool.submit(f"file{number}", task, number)
+                    errors = pool.wait()
+
+                self.assertEqual(1, len(errors))
+                self.assertEqual('file2', errors[0][0])
+                self.assertIsInstance(errors[0][1], OSError)
+                self.assertEqual("Synchronization of 'file2' failed: disk full", cm.records[0].getMessage())
+                self.assertEqual([0, 1, 3, 4], sorted(done))
+                self.assertEqual([], pool.wait(), 'Errors should be returned only once')
+                pool.shutdown()
+
+    def test_wrong_number_of_workers(self):
+        with self.assertRaisesRegex(ValueError, 'Number of workers has to be positive: 0'):
+            CopyPool(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import errno
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from synchronizer import renames
+from synchronizer.dedup import HARDLINK, REFLINK, Deduplicator
+from synchronizer.hash_cache import HashCache
+from synchronizer.manifest import Manifest
+
+DEDUP_DIR = 'data' + os.sep + 'dedup'
+REPLICA = DEDUP_DIR + os.sep + 'replica'
+SOURCE = DEDUP_DIR + os.sep + 'source.bin'
+EXISTING = REPLICA + os.sep + 'existing.bin'
+TARGET = REPLICA + os.sep + 'target.bin'
+
+
+class DeduplicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.makedirs(REPLICA)
+        self.manifest = Manifest.for_replica(REPLICA)
+        self.manifest.open(REPLICA)
+        self.hash_cache = HashCache.for_replica(REPLICA)
+        self.hash_cache.open()
+
+    def tearDown(self):
+        self.manifest.close()
+        self.hash_cache.close()
+
+    def doCleanups(self):
+        if os.path.exists(DEDUP_DIR):
+            shutil.rmtree(DEDUP_DIR)
+
+    def __write(self, source: bytes, existing: bytes):
+        for path, content in ((SOURCE, source), (EXISTING, existing)):
+            with open(path, 'wb') as file:
+                file.write(content)
+            os.utime(path, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+        self.manifest.record_file('', 'existing.bin', os.stat(SOURCE), os.stat(EXISTING).st_ino)
+
+    def test_file_with_the_same_partial_hash_is_compared_by_full_hash(self):
+        # the first and the last block are the same, content in the middle differs
+        self.__write(b'a' * renames.PARTIAL_BLOCK_SIZE * 3, b'a' * renames.PARTIAL_BLOCK_SIZE + b'b'
+                     + b'a' * (renames.PARTIAL_BLOCK_SIZE * 2 - 1))
+        deduplicator = Deduplicator(HARDLINK, self.manifest, self.hash_cache, REPLICA)
+
+        self.assertFalse(deduplicator.link(SOURCE, TARGET, os.stat(SOURCE)))
+        self.assertEqual(2, self.hash_cache.hashed)
+        self.assertFalse(os.path.exists(TARGET))
+
+    def test_identical_file_is_hardlinked(self):
+        self.__write(b'content', b'content')
+        deduplicator = Deduplicator(HARDLINK, self.manifest, self.hash_cache, REPLICA)
+
+        self.assertTrue(deduplicator.link(SOURCE, TARGET, os.stat(SOURCE)))
+        self.assertEqual(os.stat(EXISTING).st_ino, os.stat(TARGET).st_ino)
+        self.assertEqual(['existing.bin', 'target.bin'], sorted(os.listdir(REPLICA)))
+
+    def test_hardlink_is_skipped_when_metadata_differ(self):
+        self.__write(b'content', b'content')
+        os.chmod(SOURCE, 0o600)
+        deduplicator = Deduplicator(HARDLINK, self.manifest, self.hash_cache, REPLICA)
+
+        self.assertFalse(deduplicator.link(SOURCE, TARGET, os.stat(SOURCE)))
+        self.assertEqual((0, 0), (self.hash_cache.hashed, self.hash_cache.cached))
+
+    def test_unsupported_reflink_turns_deduplication_off(self):
+        self.__write(b'content', b'content')
+        deduplicator = Deduplicator(REFLINK, self.manifest, self.hash_cache, REPLICA)
+
+        with patch('fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, 'Operation not supported')) as ioctl:
+            self.assertFalse(deduplicator.link(SOURCE, TARGET, os.stat(SOURCE)))
+            self.assertFalse(deduplicator.link(SOURCE, TARGET, os.stat(SOURCE)))
+        self.assertEqual(1, ioctl.call_count)
+        self.assertEqual(['existing.bin'], os.listdir(REPLICA))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import unittest
+
+from synchronizer.delta import DeltaCopier
+
+DELTA_DIR = 'data' + os.sep + 'delta'
+SOURCE = DELTA_DIR + os.sep + 'source.bin'
+TARGET = DELTA_DIR + os.sep + 'target.bin'
+BLOCK_SIZE = 1024
+
+CONTENT = bytes(range(256)) * 40
+
+
+class DeltaCopierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(DELTA_DIR)
+        self.__write(TARGET, CONTENT)
+
+    def doCleanups(self):
+        if os.path.exists(DELTA_DIR):
+            shutil.rmtree(DELTA_DIR)
+
+    def test_only_changed_block_is_written(self):
+        changed = bytearray(CONTENT)
+        changed[BLOCK_SIZE * 3 + 10] ^= 0xff
+        self.__write(SOURCE, bytes(changed))
+
+        copier = DeltaCopier(BLOCK_SIZE)
+        self.assertEqual(BLOCK_SIZE, copier.update(SOURCE, TARGET))
+        self.__assert_copy()
+        self.assertEqual({'files': 1, 'written': BLOCK_SIZE, 'skipped': len(CONTENT) - BLOCK_SIZE}, copier.stats())
+
+    def test_appended_data(self):
+        self.__write(SOURCE, CONTENT + b'appended line\n')
+
+        self.assertEqual(len(b'appended line\n'), DeltaCopier(BLOCK_SIZE).update(SOURCE, TARGET))
+        self.__assert_copy()
+
+    def test_changed_last_block_is_not_append(self):
+        self.__write(SOURCE, CONTENT[:-1] + b'x' + b'appended')
+
+        self.assertEqual(BLOCK_SIZE + len(b'appended'), DeltaCopier(BLOCK_SIZE).update(SOURCE, TARGET))
+        self.__assert_copy()
+
+    def test_changed_start_of_grown_file(self):
+        changed = bytearray(CONTENT + b'appended')
+        changed[10] ^= 0xff
+        self.__write(SOURCE, bytes(changed))
+
+        self.assertEqual(BLOCK_SIZE + len(b'appended'), DeltaCopier(BLOCK_SIZE).update(SOURCE, TARGET))
+        self.__assert_copy()
+
+    def test_shrunk_file(self):
+        changed = bytearray(CONTENT[:BLOCK_SIZE * 2 + 100])
+        changed[0] ^= 0xff
+        self.__write(SOURCE, bytes(changed))
+
+        self.assertEqual(BLOCK_SIZE, DeltaCopier(BLOCK_SIZE).update(SOURCE, TARGET))
+        self.__assert_copy()
+
+    def __assert_copy(self):
+        with open(SOURCE, 'rb') as source, open(TARGET, 'rb') as target:
+            self.assertEqual(source.read(), target.read(), "File content doesn't match")
+        self.assertEqual(os.stat(SOURCE).st_mtime_ns, os.stat(TARGET).st_mtime_ns)
+        self.assertEqual(os.stat(SOURCE).st_mode, os.stat(TARGET).st_mode)
+
+    @staticmethod
+    def __write(path: str, content: bytes):
+        with open(path, 'wb') as file:
+            file.write(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,12 +8,22 @@ import os
 import re
 import shutil
 from stat import S_IREAD, S_IRGRP, S_IROTH, S_IWUSR
+from typing import Callable
 import unittest
+from unittest.mock import MagicMock, patch
 
+from benchmarks.syscalls import SyscallCounter
+from synchronizer.copy_backend import CopyBackend
+from synchronizer import durability
 from synchronizer.dir_sync import Synchronizer, SynchronizerException
+from synchronizer.durability import BATCHED
+from synchronizer.manifest import Manifest
 
 SYNC_OUTPUT = 'data' + os.sep + 'target'
 SYNC_INPUT = 'data' + os.sep + 'source'
+SYNC_MANIFEST = SYNC_OUTPUT + '.manifest.sqlite'
+SYNC_HASHES = SYNC_OUTPUT + '.hashes.sqlite'
+SYNC_JOURNAL = SYNC_OUTPUT + '.journal'
 
 SYNC_LOGGER = 'synchronizer.dir_sync.Synchronizer'
 DEBUG_HEADER = 'before synchronization'
@@ -51,6 +61,10 @@ class SynchronizerTest(unittest.TestCase):
         if os.path.exists(SYNC_INPUT):
             shutil.rmtree(SYNC_INPUT)
 
+        for database in (SYNC_MANIFEST, SYNC_HASHES, SYNC_JOURNAL):
+            if os.path.exists(database):
+                os.remove(database)
+
     def test_basic_synchronization_without_separator(self):
         self.__print_debug(DEBUG_HEADER)
 
@@ -152,6 +166,613 @@ class SynchronizerTest(unittest.TestCase):
 
         self.__compare_source_and_target()
 
+    def test_syscall_count_of_unchanged_resync(self):
+        synchronizer = Synchronizer()
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        with SyscallCounter() as counter:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        # each of 2 directories is listed once in source and once in replica
+        self.assertEqual(4, counter.counts['scandir'], 'Unexpected number of scandir calls')
+        # each of 3 files is stat-ed once in source and once in replica
+        self.assertEqual(6, counter.counts['entry_stat'], 'Unexpected number of stat calls of directory entries')
+        # only validation of input and output directory is done outside scandir
+        self.assertLessEqual(counter.counts['stat'] + counter.counts['lstat'], 4, 'Unexpected number of stat calls')
+
+    def test_replaced_file_type(self):
+        synchronizer = Synchronizer()
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        os.remove(SYNC_INPUT + os.sep + FILE_NAME3)
+        self.__create_sub_dir(FILE_NAME3)
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(3, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"Removing no longer existing file '{self.__prepare_path(FILE_NAME3)}' from replica",
+                             cm.records[1].getMessage())
+            self.assert_log_missing_directory(cm.records[2].getMessage(), FILE_NAME3)
+
+        self.assertTrue(os.path.isdir(SYNC_OUTPUT + os.sep + FILE_NAME3))
+
+    def test_special_files_are_skipped(self):
+        dangling = SYNC_INPUT + os.sep + 'dangling_link'
+        fifo = SYNC_INPUT + os.sep + 'sub_folder' + os.sep + 'fifo'
+        os.symlink('non_existing_file', dangling)
+        os.mkfifo(fifo)
+        try:
+            with self.assertLogs('synchronizer.walker.Walker', level='WARNING') as cm:
+                Synchronizer().synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+                self.assertEqual(1, len(cm.records), DIF_LOG_COUNT_MSG)
+                self.assertIn(f"Entry '{dangling}' is skipped", cm.records[0].getMessage())
+        finally:
+            os.remove(dangling)
+            os.remove(fifo)
+
+        self.assertEqual(['sub_folder', FILE_NAME1, FILE_NAME3], sorted(os.listdir(SYNC_OUTPUT)))
+        self.assertEqual([FILE_NAME2], os.listdir(SYNC_OUTPUT + os.sep + 'sub_folder'))
+        self.__compare_source_and_target()
+
+    def test_manifest_resync_does_not_list_replica(self):
+        synchronizer = Synchronizer(manifest=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertTrue(os.path.exists(SYNC_MANIFEST), 'Manifest was not created next to replica')
+
+        with SyscallCounter() as counter:
+            with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+                synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+                self.assertEqual(1, len(cm.records), DIF_LOG_COUNT_MSG)
+
+        # only source directories are listed and only source files are stat-ed
+        self.assertEqual(2, counter.counts['scandir'], 'Unexpected number of scandir calls')
+        self.assertEqual(3, counter.counts['entry_stat'], 'Unexpected number of stat calls of directory entries')
+
+        self.__create_file(FILE_NAME1, 'some test text and longer text')
+        os.remove(SYNC_INPUT + os.sep + 'sub_folder' + os.sep + FILE_NAME2)
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(3, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual("Removing no longer existing file "
+                             f"'{self.__prepare_path('sub_folder', FILE_NAME2)}' from replica",
+                             cm.records[1].getMessage())
+            self.assert_log_changed_meta(cm.records[2].getMessage(), FILE_NAME1)
+
+        self.__compare_source_and_target()
+
+    def test_manifest_verify_after_out_of_band_change(self):
+        Synchronizer(manifest=True).synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        os.remove(SYNC_OUTPUT + os.sep + FILE_NAME1)
+
+        # manifest still describes removed file, so it is not noticed without verification
+        Synchronizer(manifest=True).synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertFalse(os.path.exists(SYNC_OUTPUT + os.sep + FILE_NAME1))
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            Synchronizer(manifest=True, verify=True).synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(2, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assert_log_missing_file(cm.records[1].getMessage(), FILE_NAME1)
+
+        self.__compare_source_and_target()
+
+    def test_manifest_with_entry_removed_from_replica(self):
+        synchronizer = Synchronizer(manifest=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        os.remove(SYNC_INPUT + os.sep + FILE_NAME1)
+        os.remove(SYNC_OUTPUT + os.sep + FILE_NAME1)
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(3, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"'{self.__prepare_path(FILE_NAME1)}' was already removed from replica",
+                             cm.records[2].getMessage())
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+            self.assertEqual(1, len(cm.records), 'Removed entry should be dropped from manifest')
+
+        self.__compare_source_and_target()
+
+    def test_synchronization_with_workers(self):
+        for number in range(20):
+            self.__create_file(f'sub_folder/parallel_{number}.txt', f'parallel content {number}')
+
+        Synchronizer(workers=4).synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.__compare_source_and_target()
+
+    def test_failed_file_does_not_stop_synchronization(self):
+        original_copy = CopyBackend.copy
+
+        def failing_copy(backend, source, target, *args):
+            if source.endswith(FILE_NAME1):
+                raise OSError('disk full')
+            return original_copy(backend, source, target, *args)
+
+        synchronizer = Synchronizer(workers=2)
+        finished = []
+        synchronizer.add_stats_listener(finished.append)
+        with patch.object(CopyBackend, 'copy', failing_copy):
+            with self.assertRaisesRegex(SynchronizerException, 'Synchronization of 1 files failed'):
+                synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertEqual([synchronizer.last_stats], finished)
+        self.assertFalse(finished[0].success)
+        self.assertEqual(1, finished[0].counts['failed'])
+        self.assertEqual(2, finished[0].counts['copied'])
+        self.assertFalse(os.path.exists(SYNC_OUTPUT + os.sep + FILE_NAME1))
+        self.assertTrue(os.path.exists(SYNC_OUTPUT + os.sep + FILE_NAME3))
+        self.assertTrue(os.path.exists(SYNC_OUTPUT + os.sep + 'sub_folder' + os.sep + FILE_NAME2))
+
+    def test_run_statistics(self):
+        synchronizer = Synchronizer()
+        stats = synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertTrue(stats.success)
+        self.assertEqual({'scanned': 4, 'created_directories': 1, 'copied': 3, 'updated': 0, 'linked': 0,
+                          'chmod': 0, 'chown': 0, 'renamed': 0, 'deleted': 0, 'failed': 0}, stats.counts)
+        self.assertEqual(14 + 3 + 20, stats.bytes_copied)
+        self.assertEqual(3, len(stats.slowest()))
+        self.assertGreater(stats.phases['scan'], 0)
+        self.assertGreaterEqual(stats.duration, stats.phases['scan'] + stats.phases['apply'])
+
+        self.__create_file(FILE_NAME1, 'changed')
+        os.chmod(SYNC_INPUT + os.sep + FILE_NAME3, S_IREAD)
+        os.remove(SYNC_INPUT + os.sep + 'sub_folder' + os.sep + FILE_NAME2)
+        stats = synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertEqual({'scanned': 3, 'created_directories': 0, 'copied': 0, 'updated': 1, 'linked': 0,
+                          'chmod': 1, 'chown': 0, 'renamed': 0, 'deleted': 1, 'failed': 0}, stats.counts)
+        self.assertEqual(7, stats.bytes_copied)
+        self.assertEqual(['scanned 3', 'updated 1', 'chmod 1', 'deleted 1'],
+                         [f"{key} {value}" for key, value in stats.to_dict()['counts'].items() if value])
+
+    def test_change_in_file_with_delta_update(self):
+        synchronizer = Synchronizer(delta_threshold=0)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.__create_file(FILE_NAME1, 'some test text and longer text')
+        self.__create_file(FILE_NAME3, '+')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(3, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assert_log_changed_meta(cm.records[1].getMessage(), FILE_NAME1)
+            self.assert_log_changed_meta(cm.records[2].getMessage(), FILE_NAME3)
+
+        self.__compare_source_and_target()
+
+    def test_updated_file_is_replaced_and_flushed_before_manifest(self):
+        synchronizer = Synchronizer(manifest=True, durability=BATCHED)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.__create_file(FILE_NAME1, 'some test text and longer text')
+
+        syncfs = MagicMock(return_value=0)
+        with patch.object(durability, '_syncfs', syncfs):
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        syncfs.assert_called_once()
+
+        manifest = Manifest.for_replica(SYNC_OUTPUT)
+        self.assertTrue(manifest.open(SYNC_OUTPUT, read_only=True))
+        self.addCleanup(manifest.close, False)
+        self.assertEqual(os.stat(self.__prepare_path(FILE_NAME1)).st_ino, manifest.listing('')[FILE_NAME1].stat.st_ino)
+        self.__compare_source_and_target()
+
+    def test_identical_files_are_hardlinked(self):
+        for name in ('a.bin', 'b.bin', 'sub_folder/c.bin', 'newer.bin'):
+            self.__create_file(name, 'identical content')
+            os.utime(SYNC_INPUT + os.sep + name, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+        os.utime(SYNC_INPUT + os.sep + 'newer.bin')
+        synchronizer = Synchronizer(dedup='hardlink')
+
+        stats = synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        inode = os.stat(self.__prepare_path('a.bin')).st_ino
+        self.assertEqual(inode, os.stat(self.__prepare_path('b.bin')).st_ino)
+        self.assertEqual(inode, os.stat(self.__prepare_path('sub_folder', 'c.bin')).st_ino)
+        # hardlink would change modification time of the other links
+        self.assertNotEqual(inode, os.stat(self.__prepare_path('newer.bin')).st_ino)
+        self.assertEqual(2, stats.counts['linked'])
+        self.assertEqual(7, stats.counts['copied'])
+        self.__compare_source_and_target()
+
+        # changed metadata of one link are not applied to the shared inode
+        os.chmod(SYNC_INPUT + os.sep + 'b.bin', S_IREAD)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertNotEqual(inode, os.stat(self.__prepare_path('b.bin')).st_ino)
+        self.assertNotEqual(os.stat(self.__prepare_path('a.bin')).st_mode,
+                            os.stat(self.__prepare_path('b.bin')).st_mode)
+        self.__compare_source_and_target()
+
+    def test_links_of_earlier_dedup_run_are_not_changed_in_place(self):
+        for name in ('a.bin', 'b.bin'):
+            self.__create_file(name, 'identical content')
+            os.utime(SYNC_INPUT + os.sep + name, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+        Synchronizer(manifest=True, dedup='hardlink').synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertEqual(os.stat(self.__prepare_path('a.bin')).st_ino, os.stat(self.__prepare_path('b.bin')).st_ino)
+
+        os.chmod(SYNC_INPUT + os.sep + 'a.bin', S_IREAD)
+        Synchronizer(manifest=True).synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertEqual(os.stat(SYNC_INPUT + os.sep + 'b.bin').st_mode, os.stat(self.__prepare_path('b.bin')).st_mode)
+        self.__compare_source_and_target()
+
+    def test_unchanged_files_are_hardlinked_from_previous_snapshot(self):
+        first, second = self.__prepare_path('first'), self.__prepare_path('second')
+        os.mkdir(first)
+        os.mkdir(second)
+        synchronizer = Synchronizer()
+        synchronizer.synchronize(SYNC_INPUT, first)
+        self.__create_file(FILE_NAME3, 'changed content')
+
+        stats = synchronizer.synchronize(SYNC_INPUT, second, link_dest=first)
+
+        self.assertEqual(os.stat(os.path.join(first, FILE_NAME1)).st_ino,
+                         os.stat(os.path.join(second, FILE_NAME1)).st_ino)
+        self.assertEqual(os.stat(os.path.join(first, 'sub_folder', FILE_NAME2)).st_ino,
+                         os.stat(os.path.join(second, 'sub_folder', FILE_NAME2)).st_ino)
+        self.assertNotEqual(os.stat(os.path.join(first, FILE_NAME3)).st_ino,
+                            os.stat(os.path.join(second, FILE_NAME3)).st_ino)
+        self.assertEqual(2, stats.counts['linked'])
+        with open(os.path.join(first, FILE_NAME3), encoding='utf-8') as file:
+            self.assertEqual('...', file.read())
+
+        # continued snapshot never changes metadata of the previous snapshot through shared inode
+        os.chmod(SYNC_INPUT + os.sep + FILE_NAME1, S_IREAD)
+        synchronizer.synchronize(SYNC_INPUT, second, link_dest=first)
+        self.assertNotEqual(os.stat(os.path.join(first, FILE_NAME1)).st_mode,
+                            os.stat(os.path.join(second, FILE_NAME1)).st_mode)
+
+    def test_checksum_detects_change_with_preserved_metadata(self):
+        synchronizer = Synchronizer()
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        source = SYNC_INPUT + os.sep + FILE_NAME3
+        stats = os.stat(source)
+        self.__create_file(FILE_NAME3, '+++')
+        os.utime(source, ns=(stats.st_atime_ns, stats.st_mtime_ns))
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+            self.assertEqual(1, len(cm.records), 'Change with preserved metadata should not be detected')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            Synchronizer(checksum=True).synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(2, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"Updating file with changed content '{self.__prepare_path(FILE_NAME3)}'",
+                             cm.records[1].getMessage())
+
+        self.__compare_source_and_target()
+
+    def test_checksum_after_delta_update_with_preserved_metadata(self):
+        synchronizer = Synchronizer(checksum=True, manifest=True, delta_threshold=0)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        source = SYNC_INPUT + os.sep + FILE_NAME3
+        stats = os.stat(source)
+        with open(source, 'r+b') as file:
+            file.write(b'+')
+        os.utime(source, ns=(stats.st_atime_ns, stats.st_mtime_ns))
+
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertEqual(1, synchronizer.last_stats.counts['updated'])
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertEqual(0, synchronizer.last_stats.counts['updated'], 'Replica hash should be refreshed')
+        self.__compare_source_and_target()
+
+    def test_synchronize_only_given_directories(self):
+        synchronizer = Synchronizer()
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.__create_file(FILE_NAME1, 'some test text and longer text')
+        self.__create_file(f'sub_folder/{FILE_NAME2}', 'changed sub folder test file')
+        self.__create_sub_dir('new_sub_directory')
+        self.__create_file('new_sub_directory/new_file_in_sub_directory.txt', '.,.,.,.,.,')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize_directories(SYNC_INPUT, SYNC_OUTPUT, {'': False, 'removed_directory': True})
+
+            self.assertEqual(4, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assert_log_missing_directory(cm.records[1].getMessage(), 'new_sub_directory')
+            self.assert_log_missing_file(cm.records[2].getMessage(), 'new_sub_directory',
+                                         'new_file_in_sub_directory.txt')
+            self.assert_log_changed_meta(cm.records[3].getMessage(), FILE_NAME1)
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize_directories(SYNC_INPUT, SYNC_OUTPUT, {'sub_folder': False})
+
+            self.assertEqual(2, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assert_log_changed_meta(cm.records[1].getMessage(), 'sub_folder', FILE_NAME2)
+
+        self.__compare_source_and_target()
+
+    def test_renamed_directory_is_moved_in_replica(self):
+        synchronizer = Synchronizer(detect_renames=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        replica_inode = os.stat(self.__prepare_path('sub_folder', FILE_NAME2)).st_ino
+
+        os.rename(SYNC_INPUT + os.sep + 'sub_folder', SYNC_INPUT + os.sep + 'renamed_folder')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(2, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"Moving '{self.__prepare_path('sub_folder')}' to "
+                             f"'{self.__prepare_path('renamed_folder')}' in replica", cm.records[1].getMessage())
+
+        self.assertEqual(replica_inode, os.stat(self.__prepare_path('renamed_folder', FILE_NAME2)).st_ino)
+        self.assertFalse(os.path.exists(self.__prepare_path('sub_folder')))
+        self.__compare_source_and_target()
+
+        # manifest follows the move
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+            self.assertEqual(1, len(cm.records), DIF_LOG_COUNT_MSG)
+
+    def test_directory_with_new_content_is_not_moved(self):
+        synchronizer = Synchronizer(detect_renames=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        # the same as new directory which got inode of removed directory
+        os.rename(SYNC_INPUT + os.sep + 'sub_folder', SYNC_INPUT + os.sep + 'renamed_folder')
+        os.remove(SYNC_INPUT + os.sep + 'renamed_folder' + os.sep + FILE_NAME2)
+        self.__create_file('renamed_folder/other_file.txt', 'other content')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(4, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assert_log_missing_directory(cm.records[1].getMessage(), 'renamed_folder')
+
+        self.assertFalse(os.path.exists(self.__prepare_path('sub_folder')))
+        self.__compare_source_and_target()
+
+    def test_file_moved_to_directory_processed_before_its_source(self):
+        synchronizer = Synchronizer(detect_renames=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        os.rename(SYNC_INPUT + os.sep + FILE_NAME3, SYNC_INPUT + os.sep + 'sub_folder' + os.sep + FILE_NAME3)
+        os.remove(SYNC_INPUT + os.sep + FILE_NAME1)
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(3, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"Moving '{self.__prepare_path(FILE_NAME3)}' to "
+                             f"'{self.__prepare_path('sub_folder', FILE_NAME3)}' in replica",
+                             cm.records[1].getMessage())
+            self.assertEqual(f"Removing no longer existing file '{self.__prepare_path(FILE_NAME1)}' from replica",
+                             cm.records[2].getMessage())
+
+        self.__compare_source_and_target()
+
+    def test_copied_and_removed_file_is_moved_by_partial_hash(self):
+        synchronizer = Synchronizer(detect_renames=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        shutil.copy2(SYNC_INPUT + os.sep + FILE_NAME1, SYNC_INPUT + os.sep + 'a_copied_file.txt')
+        os.remove(SYNC_INPUT + os.sep + FILE_NAME1)
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(2, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"Moving '{self.__prepare_path(FILE_NAME1)}' to "
+                             f"'{self.__prepare_path('a_copied_file.txt')}' in replica", cm.records[1].getMessage())
+
+        self.__compare_source_and_target()
+
+    def test_file_moved_out_of_renamed_directory(self):
+        synchronizer = Synchronizer(detect_renames=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        os.rename(SYNC_INPUT + os.sep + 'sub_folder', SYNC_INPUT + os.sep + 'renamed_folder')
+        os.rename(SYNC_INPUT + os.sep + 'renamed_folder' + os.sep + FILE_NAME2, SYNC_INPUT + os.sep + 'z_file.txt')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(3, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assertEqual(f"Moving '{self.__prepare_path('sub_folder')}' to "
+                             f"'{self.__prepare_path('renamed_folder')}' in replica", cm.records[1].getMessage())
+            self.assertEqual(f"Moving '{self.__prepare_path('renamed_folder', FILE_NAME2)}' to "
+                             f"'{self.__prepare_path('z_file.txt')}' in replica", cm.records[2].getMessage())
+
+        self.assertEqual([], os.listdir(self.__prepare_path('renamed_folder')))
+        self.__compare_source_and_target()
+
+    def test_interrupted_run_is_resumed(self):
+        synchronizer = Synchronizer(manifest=True, resume=True)
+        copied = self.__interrupt_after_copies(synchronizer, 2)
+        self.assertTrue(os.path.exists(SYNC_JOURNAL))
+
+        with patch.object(CopyBackend, 'copy', self.__counting_copy(copied)):
+            stats = synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertEqual([self.__prepare_path(FILE_NAME3)], copied)
+        self.assertEqual(0, stats.counts['scanned'])
+        self.assertFalse(os.path.exists(SYNC_JOURNAL))
+        self.__compare_source_and_target()
+        # manifest was completed by the resumed run
+        self.assertEqual([], synchronizer.plan(SYNC_INPUT, SYNC_OUTPUT).operations)
+
+    def test_operations_not_journaled_before_kill_are_repeated(self):
+        synchronizer = Synchronizer(resume=True)
+        self.__interrupt_after_copies(synchronizer, 2)
+        # killed process didn't flush the last batch of finished operations
+        with open(SYNC_JOURNAL, encoding='utf-8') as file:
+            records = [line for line in file if '"done"' not in line]
+        with open(SYNC_JOURNAL, 'w', encoding='utf-8') as file:
+            file.writelines(records)
+
+        copied = []
+        with patch.object(CopyBackend, 'copy', self.__counting_copy(copied)):
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertEqual(3, len(copied))
+        self.assertFalse(os.path.exists(SYNC_JOURNAL))
+        self.__compare_source_and_target()
+
+    def test_journal_of_other_directories_is_not_resumed(self):
+        self.__interrupt_after_copies(Synchronizer(resume=True), 1)
+
+        copied = []
+        with patch.object(CopyBackend, 'copy', self.__counting_copy(copied)):
+            stats = Synchronizer(resume=True).synchronize_directories(SYNC_INPUT, SYNC_OUTPUT, {'sub_folder': False})
+
+        self.assertEqual(1, stats.counts['scanned'])
+        self.assertFalse(os.path.exists(SYNC_JOURNAL))
+
+    @staticmethod
+    def __counting_copy(copied: list) -> Callable:
+        original_copy = CopyBackend.copy
+
+        def counting_copy(backend, source, target, *args):
+            copied.append(target)
+            return original_copy(backend, source, target, *args)
+        return counting_copy
+
+    def __interrupt_after_copies(self, synchronizer: Synchronizer, count: int) -> list:
+        copied = []
+        counting_copy = self.__counting_copy(copied)
+
+        def interrupted_copy(backend, source, target, *args):
+            if len(copied) == count:
+                raise KeyboardInterrupt()
+            return counting_copy(backend, source, target, *args)
+
+        with patch.object(CopyBackend, 'copy', interrupted_copy), self.assertRaises(KeyboardInterrupt):
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        copied.clear()
+        return copied
+
+    def test_excluded_directories_are_pruned_and_protected(self):
+        self.__create_sub_dir('node_modules')
+        self.__create_file(f'node_modules/{FILE_NAME1}', 'dependency')
+        self.__create_file('build.tmp', 'temporary')
+        os.mkdir(self.__prepare_path('node_modules'))
+        with open(self.__prepare_path('cache.tmp'), 'w', encoding='utf-8') as file:
+            file.write('only in replica')
+        synchronizer = Synchronizer(exclude=['node_modules/', '*.tmp'])
+
+        with SyscallCounter() as counter:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        # excluded directory is listed neither in source nor in replica, excluded files are not stat-ed
+        self.assertEqual(3, counter.counts['scandir'])
+        self.assertEqual(3, counter.counts['entry_stat'])
+        self.assertEqual([], os.listdir(self.__prepare_path('node_modules')))
+        self.assertFalse(os.path.exists(self.__prepare_path('build.tmp')))
+        self.assertTrue(os.path.exists(self.__prepare_path('cache.tmp')))
+
+        # protected from removal also when it is removed in source
+        shutil.rmtree(SYNC_INPUT + os.sep + 'node_modules')
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertTrue(os.path.isdir(self.__prepare_path('node_modules')))
+
+    def test_rules_of_syncignore_file_apply_to_its_directory(self):
+        self.__create_file('sub_folder/.syncignore', '*.txt\n!keep.txt\nbuild/\n')
+        self.__create_file('sub_folder/keep.txt', 'kept')
+        synchronizer = Synchronizer(manifest=True)
+
+        plan = synchronizer.plan(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertEqual([os.path.join('sub_folder', '.syncignore'), os.path.join('sub_folder', 'keep.txt'),
+                          FILE_NAME1, FILE_NAME3],
+                         sorted(operation.path for operation in plan if operation.kind == 'copy'))
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertFalse(os.path.exists(self.__prepare_path('sub_folder', FILE_NAME2)))
+
+        # excluded replica directory is not replaced by source file with the same name
+        os.mkdir(self.__prepare_path('sub_folder', 'build'))
+        self.__create_file('sub_folder/build', 'source file')
+        self.assertEqual([], list(Synchronizer().plan(SYNC_INPUT, SYNC_OUTPUT)))
+
+    def test_plan_does_not_change_replica(self):
+        synchronizer = Synchronizer(manifest=True)
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.__create_file(FILE_NAME1, 'some test text and longer text')
+        self.__create_file('test_file_new.txt', 'newly created file')
+        os.remove(SYNC_INPUT + os.sep + FILE_NAME3)
+
+        plan = synchronizer.plan(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertEqual([('update', FILE_NAME1), ('delete', FILE_NAME3), ('copy', 'test_file_new.txt')],
+                         [(operation.kind, operation.path) for operation in plan])
+        self.assertEqual(30 + 18, plan.summary()['bytes'])
+        self.assertTrue(os.path.exists(self.__prepare_path(FILE_NAME3)))
+        self.assertFalse(os.path.exists(self.__prepare_path('test_file_new.txt')))
+
+        # manifest stays trusted, so the plan is applied without listing the replica
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm, SyscallCounter() as counter:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(4, len(cm.records), DIF_LOG_COUNT_MSG)
+        self.assertEqual(2, counter.counts['scandir'])
+        self.__compare_source_and_target()
+
+    def test_optimized_order_creates_directories_first(self):
+        synchronizer = Synchronizer(workers=2, apply_order='optimized')
+        self.__create_sub_dir('z_folder')
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+            self.assertEqual(6, len(cm.records), DIF_LOG_COUNT_MSG)
+            self.assert_log_missing_directory(cm.records[1].getMessage(), 'sub_folder')
+            self.assert_log_missing_directory(cm.records[2].getMessage(), 'z_folder')
+
+        self.__compare_source_and_target()
+
+    def test_plan_over_memory_budget_is_spilled(self):
+        for index in range(10):
+            self.__create_file(f'sub_folder/file{index}.txt', f'content {index}')
+        synchronizer = Synchronizer(apply_order='optimized', memory_budget=2048)
+
+        with self.assertLogs(SYNC_LOGGER, level='INFO') as cm:
+            stats = synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+
+        self.assertTrue(any(re.match(r"Plan of 14 operations doesn't fit into memory budget, \d+ operations were "
+                                     r"spilled to \d+ runs", record.getMessage()) for record in cm.records))
+        self.assertEqual(13, stats.counts['copied'])
+        self.assertFalse(os.path.exists(SYNC_OUTPUT + '.spill'))
+        self.assertIsNotNone(stats.peak_rss_kb)
+        self.__compare_source_and_target()
+
+    @patch('synchronizer.sharded_diff.SHARDS_PER_WORKER', 1)
+    def test_scan_split_between_processes(self):
+        for index in range(3):
+            self.__create_sub_dir(f'folder{index}')
+            self.__create_sub_dir(f'folder{index}/nested')
+            self.__create_file(f'folder{index}/nested/{FILE_NAME1}', f'nested file {index}')
+        synchronizer = Synchronizer(manifest=True, scan_workers=2)
+        serial = Synchronizer(manifest=True)
+
+        # subtrees are merged after the directories compared by coordinator, so only the order differs
+        self.assertCountEqual([(operation.kind, operation.path) for operation in serial.plan(SYNC_INPUT, SYNC_OUTPUT)],
+                              [(operation.kind, operation.path)
+                               for operation in synchronizer.plan(SYNC_INPUT, SYNC_OUTPUT)])
+        stats = synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertEqual(13, stats.counts['scanned'])
+        self.__compare_source_and_target()
+
+        self.__create_file(f'folder1/nested/{FILE_NAME1}', 'changed')
+        os.remove(SYNC_INPUT + os.sep + 'folder2' + os.sep + 'nested' + os.sep + FILE_NAME1)
+
+        plan = synchronizer.plan(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertEqual([('update', os.path.join('folder1', 'nested', FILE_NAME1)),
+                          ('delete', os.path.join('folder2', 'nested', FILE_NAME1))],
+                         [(operation.kind, operation.path) for operation in plan])
+        synchronizer.synchronize(SYNC_INPUT, SYNC_OUTPUT)
+        self.assertFalse(os.path.exists(self.__prepare_path('folder2', 'nested', FILE_NAME1)))
+        self.__compare_source_and_target()
+
     def test_non_existing_source(self):
         synchronizer = Synchronizer()
         with self.assertRaisesRegex(SynchronizerException, "Wrong input directory was provided"):
@@ -169,7 +790,7 @@ class SynchronizerTest(unittest.TestCase):
         file_log = f"for {input_f} and {output_f} files"
 
         self.assertEqual(input_stat.st_size, output_stat.st_size, f"Size of files doesn't match {file_log}")
-        self.assertEqual(input_stat.st_mtime, output_stat.st_mtime,
+        self.assertEqual(input_stat.st_mtime_ns, output_stat.st_mtime_ns,
                          f"Modification time of files doesn't match {file_log}")
         self.assertEqual(input_stat.st_mode, output_stat.st_mode, f"File mode doesn't match {file_log}")
         self.assertEqual(input_stat.st_uid, output_stat.st_uid, f"File owner doesn't match {file_log}")
@@ -0,0 +1,117 @@
+import errno
+import os
+import shutil
+import unittest
+from unittest.mock import MagicMock, patch
+
+from synchronizer import copy_backend, durability
+from synchronizer.copy_backend import CopyBackend
+from synchronizer.delta import DeltaCopier
+from synchronizer.durability import BATCHED, STRICT, TEMPORARY_PREFIX, Durability
+
+DURABILITY_DIR = 'data' + os.sep + 'durability'
+SOURCE = DURABILITY_DIR + os.sep + 'source.bin'
+TARGET = DURABILITY_DIR + os.sep + 'target.bin'
+
+
+class DurabilityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(DURABILITY_DIR)
+        with open(SOURCE, 'wb') as file:
+            file.write(b'new content')
+        with open(TARGET, 'wb') as file:
+            file.write(b'old content of replica')
+
+    def doCleanups(self):
+        if os.path.exists(DURABILITY_DIR):
+            shutil.rmtree(DURABILITY_DIR)
+
+    def test_copy_replaces_target(self):
+        inode = os.stat(TARGET).st_ino
+
+        CopyBackend((copy_backend.USERSPACE,)).copy(SOURCE, TARGET)
+
+        with open(TARGET, 'rb') as file:
+            self.assertEqual(b'new content', file.read())
+        self.assertNotEqual(inode, os.stat(TARGET).st_ino)
+        self.assertEqual(['source.bin', 'target.bin'], sorted(os.listdir(DURABILITY_DIR)))
+
+    def test_failed_copy_keeps_target(self):
+        def failing_read(*args):
+            raise OSError(errno.EIO, 'Input/output error')
+
+        with patch('os.read', failing_read), self.assertRaises(OSError):
+            CopyBackend((copy_backend.USERSPACE,)).copy(SOURCE, TARGET)
+
+        with open(TARGET, 'rb') as file:
+            self.assertEqual(b'old content of replica', file.read())
+        self.assertFalse([name for name in os.listdir(DURABILITY_DIR) if name.startswith(TEMPORARY_PREFIX)])
+
+    def test_strict_flushes_every_file_and_directory(self):
+        strict = Durability(STRICT)
+        with patch('os.fsync') as fsync:
+            CopyBackend((copy_backend.USERSPACE,), durability=strict).copy(SOURCE, TARGET)
+            self.assertEqual(2, fsync.call_count)
+            DeltaCopier(4, durability=strict).update(SOURCE, TARGET)
+            self.assertEqual(4, fsync.call_count)
+
+    def test_batched_flush_after_number_of_files(self):
+        batched = Durability(BATCHED, batch_files=3, batch_seconds=60)
+        syncfs = MagicMock(return_value=0)
+        with patch.object(durability, '_syncfs', syncfs), patch('os.fsync') as fsync:
+            backend = CopyBackend((copy_backend.USERSPACE,), durability=batched)
+            for _ in range(7):
+                backend.copy(SOURCE, TARGET)
+            self.assertEqual(2, syncfs.call_count)
+
+            batched.flush()
+            batched.flush()
+            self.assertEqual(3, syncfs.call_count)
+            self.assertEqual(3, batched.flushes)
+            fsync.assert_not_called()
+
+    def test_batched_flush_after_time(self):
+        now = [0.0]
+        batched = Durability(BATCHED, batch_files=1000, batch_seconds=5, clock=lambda: now[0])
+        syncfs = MagicMock(return_value=0)
+        with patch.object(durability, '_syncfs', syncfs):
+            batched.written(TARGET)
+            now[0] = 5
+            batched.written(TARGET)
+        self.assertEqual(1, syncfs.call_count)
+
+    def test_batched_flush_of_removed_file(self):
+        batched = Durability(BATCHED)
+        batched.root = DURABILITY_DIR
+        syncfs = MagicMock(return_value=0)
+        with patch.object(durability, '_syncfs', syncfs):
+            batched.written(TARGET)
+            os.remove(TARGET)
+            batched.flush()
+        self.assertEqual(1, batched.flushes)
+
+        with patch.object(durability, '_syncfs', None), patch('os.fsync') as fsync:
+            batched.written(SOURCE)
+            os.remove(SOURCE)
+            batched.flush()
+        # only directory of the removed file
+        self.assertEqual(1, fsync.call_count)
+
+    def test_batched_flush_without_syncfs(self):
+        batched = Durability(BATCHED)
+        with patch.object(durability, '_syncfs', None), patch('os.fsync') as fsync:
+            batched.written(TARGET)
+            batched.written(SOURCE)
+            batched.flush()
+        # both files and their directory
+        self.assertEqual(3, fsync.call_count)
+
+    def test_unknown_mode(self):
+        with self.assertRaisesRegex(ValueError, "Unknown durability mode 'always'"):
+            Durability('always')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import unittest
+
+from synchronizer.filters import Filter
+from synchronizer.walker import Walker
+
+FILTERS_DIR = 'data' + os.sep + 'filters'
+
+
+class FilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.makedirs(os.path.join(FILTERS_DIR, 'docs', 'build'))
+
+    def doCleanups(self):
+        if os.path.exists(FILTERS_DIR):
+            shutil.rmtree(FILTERS_DIR)
+
+    def __excluded(self, patterns: list[str], path: str, is_dir: bool = False) -> bool:
+        filters = Filter(patterns)
+        filters.start(FILTERS_DIR)
+        return filters.excluded(path.replace('/', os.sep), is_dir)
+
+    def test_name_pattern_matches_at_any_depth(self):
+        self.assertTrue(self.__excluded(['*.tmp'], 'file.tmp'))
+        self.assertTrue(self.__excluded(['*.tmp'], 'docs/build/file.tmp'))
+        self.assertFalse(self.__excluded(['*.tmp'], 'file.tmp.txt'))
+        self.assertTrue(self.__excluded(['build'], 'docs/build/file.txt'))
+
+    def test_pattern_with_slash_is_anchored(self):
+        self.assertTrue(self.__excluded(['/build'], 'build', True))
+        self.assertFalse(self.__excluded(['/build'], 'docs/build', True))
+        self.assertTrue(self.__excluded(['docs/*.txt'], 'docs/file.txt'))
+        self.assertFalse(self.__excluded(['docs/*.txt'], 'docs/build/file.txt'))
+
+    def test_double_asterisk(self):
+        self.assertTrue(self.__excluded(['**/build/*.o'], 'build/main.o'))
+        self.assertTrue(self.__excluded(['**/build/*.o'], 'docs/build/main.o'))
+        self.assertTrue(self.__excluded(['docs/**/*.o'], 'docs/main.o'))
+        self.assertTrue(self.__excluded(['docs/**/*.o'], 'docs/a/b/main.o'))
+        self.assertTrue(self.__excluded(['docs/**'], 'docs/build', True))
+        self.assertFalse(self.__excluded(['docs/**'], 'docs', True))
+
+    def test_trailing_slash_matches_only_directories(self):
+        self.assertTrue(self.__excluded(['cache/'], 'cache', True))
+        self.assertFalse(self.__excluded(['cache/'], 'cache'))
+
+    def test_last_matching_rule_wins(self):
+        self.assertFalse(self.__excluded(['*.log', '!important.log'], 'important.log'))
+        self.assertTrue(self.__excluded(['!important.log', '*.log'], 'important.log'))
+        self.assertTrue(self.__excluded(['*.log', '!important.log'], 'other.log'))
+        # comments, blank lines and escaped characters
+        self.assertTrue(self.__excluded(['# comment', '', '\\!literal', 'file[0-9].txt'], '!literal'))
+        self.assertTrue(self.__excluded(['file[!a-z].txt'], 'file1.txt'))
+        self.assertFalse(self.__excluded(['file[!a-z].txt'], 'filea.txt'))
+
+    def test_entries_of_excluded_directory_are_excluded(self):
+        self.assertTrue(self.__excluded(['docs/', '!*.txt'], 'docs/file.txt'))
+
+    def test_ignore_file_applies_to_its_directory(self):
+        with open(os.path.join(FILTERS_DIR, 'docs', '.syncignore'), 'w', encoding='utf-8') as file:
+            file.write('/build/\n*.log\n')
+        filters = Filter(['!debug.log'])
+        filters.start(FILTERS_DIR)
+
+        self.assertTrue(filters.excluded(os.path.join('docs', 'build'), True))
+        self.assertTrue(filters.excluded(os.path.join('docs', 'debug.log'), False))
+        self.assertFalse(filters.excluded('debug.log', False))
+        self.assertFalse(filters.excluded(os.path.join('other', 'build'), True))
+
+    def test_walker_skips_rejected_entries(self):
+        with open(os.path.join(FILTERS_DIR, '.syncignore'), 'w', encoding='utf-8') as file:
+            file.write('docs/\n')
+        filters = Filter()
+        filters.start(FILTERS_DIR)
+
+        self.assertEqual(['.syncignore'], [entry.name for entry in Walker().scan(FILTERS_DIR, filters.selector(''))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import shutil
+import unittest
+
+from synchronizer.hash_cache import HashCache
+from synchronizer.walker import FileStat
+
+CACHE_DIR = 'data' + os.sep + 'hash_cache'
+CACHE = CACHE_DIR + os.sep + 'cache.sqlite'
+FILE = CACHE_DIR + os.sep + 'file.txt'
+
+
+class HashCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(CACHE_DIR)
+        self.__write('cached content')
+
+    def doCleanups(self):
+        if os.path.exists(CACHE_DIR):
+            shutil.rmtree(CACHE_DIR)
+
+    def test_digest_is_cached_between_runs(self):
+        cache = HashCache(CACHE)
+        cache.open()
+        digest = cache.digest(FILE, os.stat(FILE))
+        self.assertEqual(hashlib.blake2b(b'cached content').digest(), digest)
+        self.assertEqual(digest, cache.digest(FILE, os.stat(FILE)))
+        self.assertEqual((1, 1), (cache.hashed, cache.cached))
+        cache.close()
+
+        cache.open()
+        self.assertEqual(digest, cache.digest(FILE, os.stat(FILE)))
+        self.assertEqual((0, 1), (cache.hashed, cache.cached))
+        cache.close()
+
+    def test_modified_file_is_hashed_again(self):
+        cache = HashCache(CACHE)
+        cache.open()
+        cache.digest(FILE, os.stat(FILE))
+
+        self.__write('changed content')
+        self.assertEqual(hashlib.blake2b(b'changed content').digest(), cache.digest(FILE, os.stat(FILE)))
+
+        # content changed with the same size and restored modification time is recognized by change time
+        stats = os.stat(FILE)
+        self.__write('restored mtime!')
+        os.utime(FILE, ns=(stats.st_atime_ns, stats.st_mtime_ns))
+        self.assertNotEqual(stats.st_ctime_ns, os.stat(FILE).st_ctime_ns)
+        self.assertEqual(hashlib.blake2b(b'restored mtime!').digest(), cache.digest(FILE, os.stat(FILE)))
+        self.assertEqual((3, 0), (cache.hashed, cache.cached))
+        cache.close()
+
+    def test_unknown_change_time_is_not_trusted(self):
+        cache = HashCache(CACHE)
+        cache.open()
+        cache.digest(FILE, os.stat(FILE))
+
+        stats = FileStat.of(os.stat(FILE))
+        stats.st_ctime_ns = 0
+        cache.digest(FILE, stats)
+        self.assertEqual((2, 0), (cache.hashed, cache.cached))
+        cache.close()
+
+    def test_unused_hashes_are_removed(self):
+        now = [1_000_000.0]
+        cache = HashCache(CACHE, max_unused=10 * 86400, clock=lambda: now[0])
+        cache.open()
+        cache.digest(FILE, os.stat(FILE))
+        removed = CACHE_DIR + os.sep + 'removed.txt'
+        with open(removed, 'w', encoding='utf-8') as file:
+            file.write('removed file')
+        cache.digest(removed, os.stat(removed))
+        cache.close()
+
+        # hash used later is kept, hash of removed file is not used anymore
+        now[0] += 6 * 86400
+        cache.open()
+        cache.digest(FILE, os.stat(FILE))
+        cache.close()
+        now[0] += 6 * 86400
+        cache.open()
+        cache.digest(FILE, os.stat(FILE))
+        cache.digest(removed, os.stat(removed))
+        self.assertEqual((1, 1), (cache.hashed, cache.cached))
+        cache.close()
+
+    def test_cache_next_to_replica(self):
+        self.assertEqual('backup' + HashCache.FILE_SUFFIX, HashCache.for_replica('backup' + os.sep).path)
+
+    @staticmethod
+    def __write(content: str):
+        with open(FILE, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import threading
+import time
+import unittest
+
+from synchronizer.io_limits import IOLimiter
+
+
+class IOLimiterTest(unittest.TestCase):
+
+    def test_streams_are_limited(self):
+        limiter = IOLimiter(max_streams=2)
+        peak = []
+
+        def copy():
+            with limiter.stream(1):
+                peak.append(limiter.in_flight()[0])
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=copy) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(6, len(peak))
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual((0, 0), limiter.in_flight())
+
+    def test_bytes_are_limited(self):
+        limiter = IOLimiter(max_bytes=100)
+        # kept open, so the reservation isn't released when the thread ends
+        second = limiter.stream(50)
+        with limiter.stream(60):
+            waiting = threading.Thread(target=second.__enter__)
+            waiting.start()
+            waiting.join(0.05)
+            self.assertTrue(waiting.is_alive())
+            self.assertEqual((1, 60), limiter.in_flight())
+        waiting.join(1)
+        self.assertFalse(waiting.is_alive())
+        self.assertEqual((1, 50), limiter.in_flight())
+
+    def test_file_larger_than_limit_is_copied_alone(self):
+        limiter = IOLimiter(max_bytes=100)
+        with limiter.stream(500):
+            self.assertEqual((1, 500), limiter.in_flight())
+
+    def test_wrong_number_of_streams(self):
+        with self.assertRaisesRegex(ValueError, "Number of copy streams has to be at least 1: 0"):
+            IOLimiter(max_streams=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import shutil
+import unittest
+
+from job import job_config
+from job.job_config import JobConfig, JobConfigException, Limits
+from job.snapshots import Retention
+from synchronizer.throttle import parse_window
+
+CONFIG_DIR = 'data' + os.sep + 'config'
+CONFIG_FILE = CONFIG_DIR + os.sep + 'jobs.yaml'
+
+
+class JobConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(CONFIG_DIR)
+
+    def doCleanups(self):
+        if os.path.exists(CONFIG_DIR):
+            shutil.rmtree(CONFIG_DIR)
+
+    @staticmethod
+    def __write(content: str):
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+    def test_load(self):
+        self.__write("""
+limits:
+  max_copy_streams: 4
+  max_mb_in_flight: 2
+  stagger: 1m
+jobs:
+  - name: documents
+    input_dir: /data/documents
+    output_dir: /backup/documents
+    interval: 1h
+    options:
+      manifest: true
+  - input_dir: /data/photos
+    output_dir: /backup/photos
+    interval: 1d
+""")
+        config = job_config.load(CONFIG_FILE)
+
+        self.assertEqual([JobConfig('documents', '/data/documents', '/backup/documents', '1h', {'manifest': True}),
+                          JobConfig('1', '/data/photos', '/backup/photos', '1d', {})], config.jobs)
+        self.assertEqual(Limits(4, 2 * 1024 * 1024, 60), config.limits)
+
+    def test_missing_jobs(self):
+        self.__write("limits:\n  stagger: 1s\n")
+
+        with self.assertRaisesRegex(JobConfigException, "No jobs are defined"):
+            job_config.load(CONFIG_FILE)
+
+    def test_missing_job_values(self):
+        self.__write("jobs:\n  - name: docs\n    input_dir: /data\n")
+
+        with self.assertRaisesRegex(JobConfigException, "Job 'docs' is missing output_dir, interval"):
+            job_config.load(CONFIG_FILE)
+
+    def test_wrong_interval(self):
+        self.__write("jobs:\n  - input_dir: /data\n    output_dir: /backup\n    interval: 5x\n")
+
+        with self.assertRaisesRegex(JobConfigException, "Wrong time value was provided: '5x'"):
+            job_config.load(CONFIG_FILE)
+
+    def test_unknown_options(self):
+        self.__write("jobs:\n  - {name: docs, input_dir: /a, output_dir: /b, interval: 1h,"
+                     " options: {manfest: true, throttle: 1, workers: 2}}\n")
+
+        with self.assertRaisesRegex(JobConfigException, "Job 'docs' has unknown options manfest, throttle"):
+            job_config.load(CONFIG_FILE)
+
+    def test_duplicate_names(self):
+        self.__write("jobs:\n  - {name: a, input_dir: /a, output_dir: /b, interval: 1h}\n"
+                     "  - {name: a, input_dir: /c, output_dir: /d, interval: 1h}\n")
+
+        with self.assertRaisesRegex(JobConfigException, "Job names have to be unique"):
+            job_config.load(CONFIG_FILE)
+
+    def test_throttle_limits(self):
+        self.__write("limits:\n  throttle:\n    - 08:00-18:00,50,500\n    - 22:00-06:00,,100\n"
+                     "  max_write_latency_ms: 20\njobs:\n  - {input_dir: /a, output_dir: /b, interval: 1h}\n")
+
+        limits = job_config.load(CONFIG_FILE).limits
+        self.assertEqual((parse_window('08:00-18:00,50,500'), parse_window('22:00-06:00,,100')),
+                         limits.throttle_windows)
+        self.assertEqual(0.02, limits.max_write_latency)
+
+        self.__write("limits:\n  throttle: [08-18]\njobs:\n  - {input_dir: /a, output_dir: /b, interval: 1h}\n")
+        with self.assertRaisesRegex(JobConfigException, "Wrong throttle window '08-18'"):
+            job_config.load(CONFIG_FILE)
+
+    def test_snapshots(self):
+        self.__write("jobs:\n  - {input_dir: /a, output_dir: /b, interval: 1h, snapshots: true}\n"
+                     "  - {input_dir: /c, output_dir: /d, interval: 1h, snapshots: {daily: 30}}\n")
+
+        self.assertEqual([Retention(24, 7), Retention(24, 30)],
+                         [job.snapshots for job in job_config.load(CONFIG_FILE).jobs])
+
+        self.__write("jobs:\n  - {name: a, input_dir: /a, output_dir: /b, interval: 1h, snapshots: true,\n"
+                     "     options: {manifest: true, workers: 2}}\n")
+        with self.assertRaisesRegex(JobConfigException, "Job 'a' with snapshots can't use options manifest"):
+            job_config.load(CONFIG_FILE)
+
+        self.__write("jobs:\n  - {name: a, input_dir: /a, output_dir: /b, interval: 1h, snapshots: {hourly: -1}}\n")
+        with self.assertRaisesRegex(JobConfigException, "Snapshot retention of job 'a' has to be non-negative"):
+            job_config.load(CONFIG_FILE)
+
+
+if __name__ == '__main__':
+    unittest.main()
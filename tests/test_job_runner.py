@@ -1,8 +1,12 @@
+import threading
 from typing import Optional
 import unittest
 from unittest.mock import patch, MagicMock
 
+from job.job_config import JobConfig, Limits
 from job.job_runner import JobRunner, JobRunnerException
+from job.snapshots import Retention
+from job.watcher import Changes
 import schedule
 
 INPUT_DIR = 'some/directory'
@@ -67,6 +71,155 @@ class MyTestCase(unittest.TestCase):
             self.assertRaisesRegex(JobRunnerException, "Wrong time value was provided: 'ah'", self.__prepare_job_runner,
                                    sync, 'ah')
 
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_job_run_with_sync_options(self, sync: MagicMock):
+        job = JobRunner(INPUT_DIR, OUTPUT_DIR, sync_options={'manifest': True, 'verify': False})
+        job.run_job()
+
+        sync.assert_called_once_with(manifest=True, verify=False)
+        sync.return_value.synchronize.assert_called_once_with(INPUT_DIR, OUTPUT_DIR)
+
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_job_run_keeps_history(self, sync: MagicMock):
+        job = JobRunner(INPUT_DIR, OUTPUT_DIR, history_size=2)
+        job.run_job()
+
+        sync.return_value.add_stats_listener.assert_called_once_with(job.history.add)
+
+    @patch("job.job_runner.SnapshotStore")
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_job_run_writes_snapshot(self, sync: MagicMock, store: MagicMock):
+        store.return_value.latest.return_value = OUTPUT_DIR + '/previous'
+        store.return_value.begin.return_value = OUTPUT_DIR + '/next.partial'
+        store.return_value.root = OUTPUT_DIR
+        job = JobRunner(INPUT_DIR, OUTPUT_DIR, snapshots=Retention(1, 2))
+        job.run_job()
+
+        store.assert_called_once_with(OUTPUT_DIR, Retention(1, 2))
+        sync.return_value.synchronize.assert_called_once_with(INPUT_DIR, OUTPUT_DIR + '/next.partial',
+                                                              link_dest=OUTPUT_DIR + '/previous')
+        store.return_value.finish.assert_called_once_with(OUTPUT_DIR + '/next.partial')
+        # history is kept for the snapshot root
+        stats = MagicMock(output_dir=OUTPUT_DIR + '/next.partial')
+        with patch.object(job.history, 'add') as add:
+            sync.return_value.add_stats_listener.call_args.args[0](stats)
+        add.assert_called_once_with(stats)
+        self.assertEqual(OUTPUT_DIR, stats.output_dir)
+
+        with self.assertRaisesRegex(JobRunnerException, "Snapshots can't be written in watch mode"):
+            JobRunner(INPUT_DIR, OUTPUT_DIR, watch=True, snapshots=Retention()).run_job()
+
+    @patch("job.watcher.DirectoryWatcher")
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_job_run_in_watch_mode(self, sync: MagicMock, directory_watcher: MagicMock):
+        job = JobRunner(INPUT_DIR, OUTPUT_DIR, watch=True)
+        changes = Changes()
+        changes.add('sub', True)
+        overflow = Changes()
+        overflow.overflow = True
+
+        def poll(timeout):
+            if not events:
+                job.stop()
+                return None
+            return events.pop(0)
+
+        events = [None, changes, overflow]
+        directory_watcher.return_value.poll.side_effect = poll
+        unit_mock = MagicMock(name="every")
+        with patch.object(schedule, 'every', return_value=unit_mock) as mock_method:
+            job.run_job()
+
+            mock_method.assert_called_with(1)
+            unit_mock.hours.do.assert_called_once()
+
+        directory_watcher.assert_called_once_with(INPUT_DIR)
+        directory_watcher.return_value.start.assert_called_once()
+        directory_watcher.return_value.close.assert_called_once()
+        sync.return_value.synchronize_directories.assert_called_once_with(INPUT_DIR, OUTPUT_DIR, {'sub': True})
+        # initial synchronization and the one after overflow
+        self.assertEqual(2, sync.return_value.synchronize.call_count)
+
+    @patch("job.watcher.DirectoryWatcher")
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_failed_run_does_not_stop_watch_mode(self, sync: MagicMock, directory_watcher: MagicMock):
+        job = JobRunner(INPUT_DIR, OUTPUT_DIR, watch=True)
+        changes = Changes()
+        changes.add('sub', True)
+        overflow = Changes()
+        overflow.overflow = True
+
+        def poll(timeout):
+            if not events:
+                job.stop()
+                return None
+            return events.pop(0)
+
+        events = [changes, overflow]
+        directory_watcher.return_value.poll.side_effect = poll
+        sync.return_value.synchronize_directories.side_effect = FileNotFoundError('removed temp file')
+        with patch.object(schedule, 'every'), self.assertLogs('job.job_runner.JobRunner', level='ERROR') as cm:
+            job.run_job()
+
+        self.assertEqual(["Synchronization of changes failed: removed temp file"],
+                         [record.getMessage() for record in cm.records])
+        # initial synchronization and the one after overflow
+        self.assertEqual(2, sync.return_value.synchronize.call_count)
+        directory_watcher.return_value.close.assert_called_once()
+
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_jobs_from_config_do_not_overlap(self, sync: MagicMock):
+        jobs = [JobConfig('first', 'in1', 'out1', '1s', {'manifest': True}),
+                JobConfig('second', 'in2', 'out2', '1h', {})]
+        job = JobRunner('', '', jobs=jobs, limits=Limits(max_copy_streams=2))
+        release = threading.Event()
+        sync.return_value.synchronize.side_effect = lambda *args: release.wait(5)
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 1:
+                # the first job is due again while its first run is still in progress
+                release.wait(1.1)
+            else:
+                job.stop()
+                release.set()
+
+        with patch('time.sleep', sleep), self.assertLogs('job.job_runner.JobRunner', level='INFO') as cm:
+            job.run_job()
+
+        self.assertEqual(2, sync.call_count)
+        limiter = sync.call_args_list[0].kwargs['io_limiter']
+        self.assertEqual(2, limiter.max_streams)
+        self.assertIs(limiter, sync.call_args_list[1].kwargs['io_limiter'])
+        self.assertIsNone(sync.call_args_list[0].kwargs['throttle'])
+        self.assertTrue(sync.call_args_list[0].kwargs['manifest'])
+        self.assertEqual(2, sync.return_value.synchronize.call_count)
+        self.assertIn("Job 'first' is still running, its run is skipped",
+                      [record.getMessage() for record in cm.records])
+
+    @patch("synchronizer.dir_sync.Synchronizer")
+    def test_periodic_runs_are_staggered(self, sync: MagicMock):
+        jobs = [JobConfig('first', 'in1', 'out1', '1h', {}), JobConfig('second', 'in2', 'out2', '1h', {})]
+        job = JobRunner('', '', jobs=jobs, limits=Limits(stagger=30))
+        schedulers = []
+        scheduler_class = schedule.Scheduler
+
+        def create_scheduler():
+            schedulers.append(scheduler_class())
+            return schedulers[-1]
+
+        job.stop()
+        with patch('schedule.Scheduler', create_scheduler):
+            job.run_job()
+
+        first, second = schedulers[0].jobs
+        self.assertAlmostEqual(30, (second.next_run - first.next_run).total_seconds(), delta=1)
+
+    def test_wrong_config_file(self):
+        with self.assertRaisesRegex(JobRunnerException, "Job file 'non_existing.yaml' can't be loaded"):
+            JobRunner.from_config('non_existing.yaml')
+
     @staticmethod
     def __prepare_job_runner(sync: MagicMock, unit: Optional[str]) -> MagicMock:
         sync_instance = MagicMock(name="syncInstance")
@@ -0,0 +1,121 @@
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from synchronizer import copy_backend
+from synchronizer.copy_backend import CopyBackend
+from synchronizer.journal import Journal
+from synchronizer.plan import COPY, MKDIR, Operation
+from synchronizer.walker import Entry, FileStat
+
+JOURNAL_DIR = 'data' + os.sep + 'journal'
+REPLICA = JOURNAL_DIR + os.sep + 'replica'
+SOURCE = JOURNAL_DIR + os.sep + 'source.bin'
+TARGET = REPLICA + os.sep + 'target.bin'
+
+CHUNK = 64 * 1024
+CONTENT = os.urandom(10 * CHUNK)
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.makedirs(REPLICA)
+        with open(SOURCE, 'wb') as file:
+            file.write(CONTENT)
+        self.journal = Journal.for_replica(REPLICA)
+
+    def doCleanups(self):
+        if os.path.exists(JOURNAL_DIR):
+            shutil.rmtree(JOURNAL_DIR)
+
+    def test_finished_operations_are_loaded(self):
+        stats = FileStat.of(os.stat(SOURCE))
+        operations = [Operation(MKDIR, '', 'folder', True, entry=Entry('folder', True, inode=5)),
+                      Operation(COPY, 'folder', 'file', size=stats.st_size, entry=Entry('file', False, stats, 7))]
+        self.journal.start('source', REPLICA, {'': True}, operations)
+        self.journal.done(0)
+        self.journal.close(False)
+
+        state = Journal.for_replica(REPLICA).load('source', REPLICA, {'': True})
+
+        self.assertEqual({0}, state.done)
+        self.assertEqual([(MKDIR, 'folder'), (COPY, os.path.join('folder', 'file'))],
+                         [(operation.kind, operation.path) for operation in state.operations])
+        self.assertEqual(5, state.operations[0].entry.inode)
+        self.assertEqual(stats, state.operations[1].entry.stat)
+        self.assertEqual(stats.st_mtime_ns, state.operations[1].entry.stat.st_mtime_ns)
+
+    def test_finished_operations_are_written_in_batches(self):
+        journal = Journal(self.journal.path, batch_size=2)
+        journal.start('source', REPLICA, {'': True}, [Operation(MKDIR, '', str(index), True) for index in range(3)])
+
+        self.assertFalse(journal.done(0))
+        self.assertTrue(journal.done(1))
+        journal.flush()
+        self.assertFalse(journal.done(2))
+        # killed before the next flush
+        self.assertEqual({0, 1}, Journal.for_replica(REPLICA).load('source', REPLICA, {'': True}).done)
+
+        journal.close(True)
+        self.assertFalse(os.path.exists(journal.path))
+
+    def test_incomplete_journal_is_not_resumed(self):
+        self.journal.start('source', REPLICA, {'': True}, [Operation(MKDIR, '', 'folder', True)])
+        self.journal.close(False)
+        with open(self.journal.path, 'r+', encoding='utf-8') as file:
+            lines = file.readlines()
+            # the last record was not written completely
+            file.seek(0)
+            file.truncate()
+            file.writelines(lines[:-1] + [lines[-1][:5]])
+
+        self.assertIsNone(self.journal.load('source', REPLICA, {'': True}))
+
+    def test_journal_of_another_run_is_not_resumed(self):
+        self.journal.start('source', REPLICA, {'': True}, [])
+        self.journal.close(False)
+
+        self.assertIsNotNone(self.journal.load('source', REPLICA, {'': True}))
+        self.assertIsNone(self.journal.load('other', REPLICA, {'': True}))
+        self.assertIsNone(self.journal.load('source', REPLICA, {'folder': True}))
+
+    def test_interrupted_copy_continues_from_offset(self):
+        journal = Journal(self.journal.path, progress_interval=2 * CHUNK)
+        journal.start('source', REPLICA, {'': True}, [Operation(COPY, '', 'target.bin', size=len(CONTENT))])
+        backend = CopyBackend((copy_backend.USERSPACE,))
+        original_read = os.read
+        reads = []
+
+        def interrupted_read(fd, size):
+            reads.append(size)
+            if len(reads) == 6:
+                raise KeyboardInterrupt()
+            return original_read(fd, min(size, CHUNK))
+
+        with patch('os.read', interrupted_read), self.assertRaises(KeyboardInterrupt):
+            backend.copy(SOURCE, TARGET, journal.progress(0, TARGET))
+        journal.close(False)
+        self.assertFalse(os.path.exists(TARGET))
+
+        resumed = Journal(self.journal.path, progress_interval=2 * CHUNK)
+        state = resumed.load('source', REPLICA, {'': True})
+        self.assertEqual({0: 4 * CHUNK}, state.offsets)
+        resumed.resume()
+        progress = resumed.progress(0, TARGET, state.offsets[0])
+        # data after the recorded offset are written again
+        self.assertEqual(5 * CHUNK, os.path.getsize(progress.partial))
+
+        backend.copy(SOURCE, TARGET, progress)
+        resumed.close(True)
+
+        with open(TARGET, 'rb') as file:
+            self.assertEqual(CONTENT, file.read())
+        self.assertFalse(os.path.exists(progress.partial))
+        self.assertEqual(len(CONTENT) - 4 * CHUNK, backend.stats()[copy_backend.USERSPACE].bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
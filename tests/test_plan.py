@@ -0,0 +1,99 @@
+import os
+import shutil
+import unittest
+
+from synchronizer.plan import Operation, Plan
+from synchronizer.spill import OPERATION_MEMORY, Spill
+from synchronizer.walker import Entry
+
+SPILL_DIR = 'data' + os.sep + 'spill'
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(SPILL_DIR)
+        self.plan = Plan(self.__operations())
+
+    def doCleanups(self):
+        if os.path.exists(SPILL_DIR):
+            shutil.rmtree(SPILL_DIR)
+
+    @staticmethod
+    def __operations() -> list[Operation]:
+        return [
+            Operation('delete', '', 'old_file', replacing=False),
+            Operation('copy', 'folder', 'second', size=10, entry=Entry('second', False, inode=7)),
+            Operation('delete', 'folder', 'replaced', True, replacing=True),
+            Operation('mkdir', 'folder', 'replaced', True),
+            Operation('copy', 'folder', 'first', size=20, entry=Entry('first', False, inode=3)),
+            Operation('rename', 'folder', 'moved', True, previous='old_folder'),
+            Operation('record', 'folder', 'unchanged'),
+        ]
+
+    def test_walk_order_is_kept(self):
+        self.assertIs(self.plan.operations, self.plan.ordered('walk'))
+
+    def test_optimized_order(self):
+        paths = [(operation.kind, operation.name) for operation in self.plan.ordered('optimized')]
+
+        self.assertEqual([('delete', 'replaced'), ('mkdir', 'replaced'), ('rename', 'moved'), ('record', 'unchanged'),
+                          ('delete', 'old_file'), ('copy', 'first'), ('copy', 'second')], paths)
+
+    def test_operations_over_memory_budget_are_spilled(self):
+        # two operations without entries fit into the budget, operation with entry doesn't
+        plan = Plan(self.__operations(), Spill(2 * OPERATION_MEMORY + 20, SPILL_DIR))
+
+        self.assertEqual(2, len(plan.runs))
+        self.assertEqual(5, plan.spilled)
+        self.assertEqual(['moved', 'unchanged'], [operation.name for operation in plan.operations])
+        self.assertEqual(len(self.plan), len(plan))
+        self.assertEqual(self.plan.to_json(), plan.to_json())
+        for order in ('walk', 'optimized'):
+            with self.subTest(order=order):
+                operations = plan.ordered(order)
+                self.assertEqual(len(self.plan), len(operations))
+                self.assertEqual([str(operation) for operation in self.plan.ordered(order)],
+                                 [str(operation) for operation in operations])
+
+    def test_spilled_runs_are_taken_over(self):
+        spill = Spill(2 * OPERATION_MEMORY + 20, SPILL_DIR)
+        operations = self.__operations()
+        plan = Plan(operations[:3], spill)
+        plan.extend(Plan(operations[3:], spill))
+
+        self.assertEqual([str(operation) for operation in self.plan], [str(operation) for operation in plan])
+        # operations kept in memory before the taken over runs are spilled too
+        self.assertEqual(3, len(plan.runs))
+
+    def test_unknown_order(self):
+        with self.assertRaisesRegex(ValueError, "Unknown order of operations: random"):
+            self.plan.ordered('random')
+
+    def test_summary(self):
+        summary = self.plan.summary(throughput=10, operation_cost=1)
+
+        self.assertEqual({'delete': 2, 'copy': 2, 'mkdir': 1, 'rename': 1}, summary['operations'])
+        self.assertEqual(30, summary['bytes'])
+        self.assertEqual(6 + 3, summary['estimated_seconds'])
+
+    def test_json_round_trip(self):
+        restored = Plan.from_json(self.plan.to_json())
+
+        self.assertEqual([operation.to_dict() for operation in self.plan],
+                         [operation.to_dict() for operation in restored])
+        self.assertEqual('old_folder', restored.operations[5].previous)
+        self.assertTrue(restored.operations[2].replacing)
+
+    def test_text(self):
+        lines = self.plan.to_text().splitlines()
+
+        self.assertEqual(7, len(lines))
+        self.assertEqual(f"copy {os.path.join('folder', 'second')} (10 bytes)", lines[1])
+        self.assertEqual(f"rename old_folder -> {os.path.join('folder', 'moved')}", lines[5])
+        self.assertTrue(lines[6].startswith("6 operations, 30 bytes"))
+
+
+if __name__ == '__main__':
+    unittest.main()
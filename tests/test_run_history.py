@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import stat
+import unittest
+
+from job.run_history import RunHistory
+from synchronizer.run_stats import RunStats
+
+HISTORY_DIR = 'data' + os.sep + 'history'
+
+
+class RunHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.mkdir(HISTORY_DIR)
+
+    def doCleanups(self):
+        if os.path.exists(HISTORY_DIR):
+            shutil.rmtree(HISTORY_DIR)
+
+    @staticmethod
+    def __stats(success: bool, copied: int = 0) -> RunStats:
+        stats = RunStats('in "put"', 'output')
+        stats.add('copied', copied)
+        stats.add_bytes(copied * 10)
+        stats.file_done('slow', 2.0)
+        stats.file_done('fast', 1.0)
+        stats.finish(success)
+        return stats
+
+    def test_history_is_limited(self):
+        history = RunHistory(max_size=2)
+        for copied in range(3):
+            history.add(self.__stats(True, copied))
+
+        self.assertEqual([1, 2], [run['counts']['copied'] for run in history.runs])
+        self.assertEqual({'success': 3, 'failure': 0}, history.totals)
+
+    def test_json_export(self):
+        path = HISTORY_DIR + os.sep + 'history.json'
+        history = RunHistory(export_file=path)
+        history.add(self.__stats(True, 2))
+        history.add(self.__stats(False))
+
+        with open(path, 'r', encoding='utf-8') as file:
+            exported = json.load(file)
+        self.assertEqual({'success': 1, 'failure': 1}, exported['totals'])
+        self.assertEqual(history.runs[0]['finished'], exported['last_success'])
+        self.assertEqual(20, exported['runs'][0]['bytes_copied'])
+        self.assertEqual([{'path': 'slow', 'seconds': 2.0}, {'path': 'fast', 'seconds': 1.0}],
+                         exported['runs'][0]['slowest'])
+        self.assertEqual(['history.json'], os.listdir(HISTORY_DIR))
+
+    def test_prometheus_export(self):
+        path = HISTORY_DIR + os.sep + 'dir_sync.prom'
+        history = RunHistory(export_file=path)
+        history.add(self.__stats(True, 3))
+
+        with open(path, 'r', encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        labels = 'input="in \\"put\\"",output="output"'
+        self.assertIn('# TYPE dir_sync_runs_total counter', lines)
+        self.assertIn('dir_sync_runs_total{status="success"} 1', lines)
+        self.assertIn(f'dir_sync_last_run_success{{{labels}}} 1', lines)
+        self.assertIn(f'dir_sync_last_run_entries{{{labels},kind="copied"}} 3', lines)
+        self.assertIn(f'dir_sync_last_run_copied_bytes{{{labels}}} 30', lines)
+        self.assertIn(f'dir_sync_last_run_peak_rss_bytes{{{labels}}} {history.runs[0]["peak_rss_kb"] * 1024}', lines)
+        self.assertTrue(any(line.startswith(f'dir_sync_last_run_phase_seconds{{{labels},phase="scan"}}')
+                            for line in lines))
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(path).st_mode))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import datetime
+import os
+import shutil
+import unittest
+
+from job.snapshots import NAME_FORMAT, Retention, SnapshotStore
+
+SNAPSHOTS_DIR = 'data' + os.sep + 'snapshots'
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.makedirs(SNAPSHOTS_DIR)
+        self.now = datetime.datetime(2026, 10, 18, 12, 30)
+
+    def doCleanups(self):
+        if os.path.exists(SNAPSHOTS_DIR):
+            shutil.rmtree(SNAPSHOTS_DIR)
+
+    def __store(self, retention: Retention = Retention()) -> SnapshotStore:
+        return SnapshotStore(SNAPSHOTS_DIR, retention, lambda: self.now)
+
+    @staticmethod
+    def __snapshot(time: datetime.datetime) -> tuple[datetime.datetime, str]:
+        return time, os.path.join(SNAPSHOTS_DIR, time.strftime(NAME_FORMAT))
+
+    def test_newest_snapshot_of_hour_and_day_is_kept(self):
+        times = [self.now - datetime.timedelta(minutes=20 * index) for index in range(4 * 24 * 3)]
+        snapshots = [self.__snapshot(time) for time in reversed(times)]
+
+        kept = self.__store(Retention(hourly=3, daily=2)).kept(snapshots)
+
+        expected = {self.now, datetime.datetime(2026, 10, 18, 11, 50), datetime.datetime(2026, 10, 18, 10, 50),
+                    datetime.datetime(2026, 10, 17, 23, 50)}
+        self.assertEqual({self.__snapshot(time)[1] for time in expected}, kept)
+        self.assertEqual({snapshots[-1][1]}, self.__store(Retention(0, 0)).kept(snapshots))
+
+    def test_snapshot_is_finished_and_old_snapshots_pruned(self):
+        store = self.__store(Retention(hourly=1, daily=0))
+        first = store.begin()
+        self.assertTrue(first.endswith('.partial'))
+        self.assertIsNone(store.latest())
+        store.finish(first)
+        self.assertEqual(os.path.join(SNAPSHOTS_DIR, '2026-10-18_12-30-00'), store.latest())
+
+        self.now = datetime.datetime(2026, 10, 18, 13, 5)
+        os.mkdir(os.path.join(SNAPSHOTS_DIR, 'unrelated'))
+        store.finish(store.begin())
+        store.wait()
+
+        self.assertEqual(['2026-10-18_13-05-00', 'unrelated'], sorted(os.listdir(SNAPSHOTS_DIR)))
+
+    def test_partial_snapshot_of_failed_run_is_continued(self):
+        store = self.__store()
+        partial = store.begin()
+        with open(os.path.join(partial, 'copied.txt'), 'w', encoding='utf-8') as file:
+            file.write('content')
+
+        self.now = datetime.datetime(2026, 10, 18, 13, 0)
+        continued = store.begin()
+
+        self.assertEqual(os.path.join(SNAPSHOTS_DIR, '2026-10-18_13-00-00.partial'), continued)
+        self.assertEqual(['2026-10-18_13-00-00.partial'], os.listdir(SNAPSHOTS_DIR))
+        self.assertEqual(['copied.txt'], os.listdir(continued))
+
+
+if __name__ == '__main__':
+    unittest.main()
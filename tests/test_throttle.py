@@ -0,0 +1,176 @@
+import datetime
+import os
+import shutil
+import unittest
+
+from synchronizer.copy_backend import REFLINK, USERSPACE, CopyBackend
+from synchronizer.delta import DeltaCopier
+from synchronizer.throttle import MIN_BYTES_PER_SECOND, Throttle, ThrottleWindow, TokenBucket, parse_window
+
+THROTTLE_DIR = 'data' + os.sep + 'throttle'
+SOURCE = THROTTLE_DIR + os.sep + 'source.bin'
+TARGET = THROTTLE_DIR + os.sep + 'target.bin'
+THROTTLE_LOGGER = 'synchronizer.throttle.Throttle'
+
+MB = 1024 * 1024
+DAY = datetime.time(12)
+NIGHT = datetime.time(23)
+
+
+class _Clock:
+    """
+    Time which moves only by sleeps of the throttle and by explicit moves of the test
+    """
+    def __init__(self, moment: datetime.time = DAY):
+        self.seconds = 0.0
+        self.sleeps = []
+        self.moment = moment
+
+    def __call__(self) -> float:
+        return self.seconds
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.combine(datetime.date(2024, 1, 1), self.moment)
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.seconds += seconds
+
+
+class ThrottleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        self.clock = _Clock()
+
+    def doCleanups(self):
+        if os.path.exists(THROTTLE_DIR):
+            shutil.rmtree(THROTTLE_DIR)
+
+    def test_parse_window(self):
+        self.assertEqual(ThrottleWindow(datetime.time(8), datetime.time(18), 50 * MB, 500.0),
+                         parse_window('08:00-18:00,50,500'))
+        self.assertEqual(ThrottleWindow(datetime.time(22, 30), datetime.time(6), None, 100.0),
+                         parse_window('22:30-06:00,,100'))
+        for wrong in ('08:00,50', '08:00-18:00', '8-18,50', '08:00-18:00,fast'):
+            with self.subTest(window=wrong), self.assertRaises(ValueError):
+                parse_window(wrong)
+
+    def test_window_over_midnight(self):
+        window = parse_window('22:00-06:00,1')
+        self.assertTrue(window.contains(NIGHT))
+        self.assertTrue(window.contains(datetime.time(5, 59)))
+        self.assertFalse(window.contains(DAY))
+        self.assertTrue(parse_window('00:00-00:00,1').contains(DAY))
+
+    def test_bucket_debt_is_paid_by_waiting(self):
+        bucket = TokenBucket(10, clock=self.clock)
+        self.assertEqual(0, bucket.consume(10))
+        self.assertEqual(2.5, bucket.consume(25))
+        self.clock.seconds += 1
+        self.assertEqual(1.5 + 0.5, bucket.consume(5))
+
+        bucket.rate = None
+        self.assertEqual(0, bucket.consume(1000))
+
+    def test_bytes_and_operations_are_limited_per_chunk(self):
+        throttle = self.__throttle([ThrottleWindow(datetime.time(8), datetime.time(18), 2 * MB, 4)])
+        for _ in range(8):
+            with throttle.chunk(MB):
+                pass
+
+        self.assertEqual((2 * MB, 4), throttle.limits())
+        # bucket starts empty when the window starts, so there is no burst, operations limit allows 4 chunks per
+        # second, so bytes limit is the one which is applied
+        self.assertAlmostEqual(4.0, self.clock.seconds)
+        self.assertAlmostEqual(4.0, throttle.waited)
+
+    def test_no_limit_outside_of_windows(self):
+        self.clock.moment = NIGHT
+        throttle = self.__throttle([parse_window('08:00-18:00,1,1')])
+        for _ in range(100):
+            throttle.acquire(MB)
+
+        self.assertEqual((None, None), throttle.limits())
+        self.assertEqual([], self.clock.sleeps)
+
+        self.clock.moment = DAY
+        throttle.acquire(MB)
+        self.assertEqual((MB, 1), throttle.limits())
+
+    def test_adaptive_backoff_and_recovery(self):
+        throttle = self.__throttle([parse_window('08:00-18:00,8')], max_latency=0.01)
+
+        with self.assertLogs(THROTTLE_LOGGER, level='INFO') as cm:
+            self.__write(throttle, 0.05)
+            self.assertEqual(4 * MB, throttle.limits()[0])
+            self.__write(throttle, 0.05)
+            self.assertEqual(2 * MB, throttle.limits()[0])
+
+            # latency between half of the threshold and the threshold keeps the limit
+            self.__write(throttle, 0.008)
+            self.assertEqual(2 * MB, throttle.limits()[0])
+            for _ in range(3):
+                self.__write(throttle, 0.001)
+            self.assertAlmostEqual(2 * MB * 1.25 ** 3, throttle.limits()[0])
+            for _ in range(4):
+                self.__write(throttle, 0.001)
+            self.assertEqual(8 * MB, throttle.limits()[0])
+
+        self.assertEqual("Write latency 50.0 ms is above 10.0 ms, copy is throttled to 4.0 MB/s",
+                         cm.records[0].getMessage())
+        self.assertEqual("Write latency is back to 1.0 ms, adaptive throttling is stopped", cm.records[-1].getMessage())
+
+    def test_adaptive_backoff_without_window_uses_measured_throughput(self):
+        throttle = self.__throttle(max_latency=0.01)
+        for _ in range(8):
+            throttle.acquire(MB)
+            self.clock.seconds += 0.125
+            throttle.record(MB, 0.5)
+
+        # 8 MB written in 1 second
+        self.assertEqual(4 * MB, throttle.limits()[0])
+        for _ in range(20):
+            self.__write(throttle, 0.5)
+        self.assertEqual(MIN_BYTES_PER_SECOND, throttle.limits()[0])
+
+    def test_copy_and_delta_are_throttled_per_chunk(self):
+        os.mkdir(THROTTLE_DIR)
+        content = os.urandom(10 * 64 * 1024)
+        with open(SOURCE, 'wb') as file:
+            file.write(content)
+        throttle = Throttle([parse_window('00:00-00:00,,1000')], chunk_size=64 * 1024)
+        chunks = []
+        original = throttle.acquire
+        throttle.acquire = lambda size: chunks.append(size) or original(size)
+
+        for mechanism in CopyBackend().mechanisms:
+            if mechanism != REFLINK:
+                with self.subTest(mechanism=mechanism):
+                    chunks.clear()
+                    CopyBackend((mechanism,), throttle).copy(SOURCE, TARGET)
+                    self.assertEqual([64 * 1024] * 10, chunks)
+                    with open(TARGET, 'rb') as file:
+                        self.assertEqual(content, file.read())
+
+        CopyBackend((USERSPACE,)).copy(SOURCE, TARGET)
+        with open(SOURCE, 'r+b') as file:
+            file.write(b'changed')
+        chunks.clear()
+        self.assertEqual(64 * 1024, DeltaCopier(64 * 1024, throttle).update(SOURCE, TARGET))
+        self.assertEqual([64 * 1024], chunks)
+
+    def __throttle(self, windows=(), max_latency=None) -> Throttle:
+        return Throttle(windows, max_latency, clock=self.clock, now=self.clock.now, sleep=self.clock.sleep)
+
+    def __write(self, throttle: Throttle, latency: float):
+        """
+        Write one chunk with given latency and wait until the next adjustment of adaptive limit
+        """
+        throttle.acquire(1)
+        self.clock.seconds += 1
+        throttle.record(1, latency)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import sys
+import time
+import unittest
+
+from job.watcher import Changes, DirectoryWatcher
+
+WATCH_DIR = 'data' + os.sep + 'watch'
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is available only on Linux')
+class DirectoryWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doCleanups()
+        os.makedirs(WATCH_DIR + os.sep + 'existing')
+        self.watcher = DirectoryWatcher(WATCH_DIR, debounce=0.05)
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.close()
+
+    def doCleanups(self):
+        if os.path.exists(WATCH_DIR):
+            shutil.rmtree(WATCH_DIR)
+
+    def test_changed_file_marks_its_directory(self):
+        self.__write('existing/file.txt')
+
+        self.assertEqual({'existing': False}, self.__wait_for_changes().directories)
+
+    def test_created_directory_is_synchronized_recursively_and_watched(self):
+        os.makedirs(WATCH_DIR + os.sep + 'new' + os.sep + 'nested')
+        self.__write('new/nested/file.txt')
+
+        changes = self.__wait_for_changes()
+        self.assertTrue(changes.directories['new'])
+        self.assertFalse(changes.overflow)
+
+        self.__write('new/nested/other.txt')
+        self.assertEqual({os.path.join('new', 'nested'): False}, self.__wait_for_changes().directories)
+
+    def test_no_changes(self):
+        self.assertIsNone(self.watcher.poll(0.1))
+
+    def test_changes_are_debounced(self):
+        for number in range(20):
+            self.__write(f'file{number}.txt')
+
+        self.assertEqual({'': False}, self.__wait_for_changes().directories)
+        self.assertIsNone(self.watcher.poll(0.1))
+
+    def __wait_for_changes(self) -> Changes:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            changes = self.watcher.poll(0.1)
+            if changes is not None:
+                return changes
+        self.fail('No changes were reported')
+
+    @staticmethod
+    def __write(name: str):
+        with open(WATCH_DIR + os.sep + name, 'w', encoding='utf-8') as file:
+            file.write(name)
+
+
+if __name__ == '__main__':
+    unittest.main()